@@ -0,0 +1,123 @@
+"""
+Index Recall vs Memory Benchmark
+Builds each FAISS index type from index_factory on the same vectors and
+reports memory, build time, query latency and recall@k against exact search.
+
+Vectors are synthetic unit-length points drawn around random cluster
+centres, which is closer to real embedding distributions than uniform noise.
+
+Usage (from backend/):
+    python -m benchmarks.bench_index --vectors 20000 --queries 200 --json
+    python -m benchmarks.bench_index --vectors 50000 --only ivf hnsw
+"""
+
+import argparse
+import json
+import os
+import time
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import numpy as np
+
+from benchmarks.common import percentiles
+from index_factory import build_index, index_memory_bytes
+
+# (label, index type, rescore)
+CONFIGURATIONS = (
+    ("flat", "flat", False),
+    ("ivf", "ivf", False),
+    ("sq8", "sq8", False),
+    ("sq8+rescore", "sq8", True),
+    ("ivfpq", "ivfpq", False),
+    ("ivfpq+rescore", "ivfpq", True),
+    ("hnsw", "hnsw", False),
+)
+
+
+def clustered_vectors(count: int, dimension: int, clusters: int, seed: int) -> np.ndarray:
+    """Unit vectors scattered around `clusters` random centres"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, count)]
+    vectors += 0.5 * rng.standard_normal((count, dimension)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    """Fraction of the exact top-k neighbours that were returned"""
+    k = int(truth.shape[1])
+    hits = sum(len(set(f.tolist()) & set(t.tolist())) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def run_configuration(kind: str, rescore: bool, vectors: np.ndarray, queries: np.ndarray, k: int) -> dict:
+    start = time.perf_counter()
+    index, built = build_index(kind, vectors, rescore=rescore)
+    build_seconds = time.perf_counter() - start
+
+    samples = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        samples.append(time.perf_counter() - start)
+        found.append(ids[0])
+    return {
+        "index_type": built,
+        "faiss_class": type(index).__name__,
+        "build_seconds": round(build_seconds, 3),
+        "memory_mb": round(index_memory_bytes(index) / 1024 / 1024, 2),
+        "search_ms": percentiles(samples),
+        "found": np.vstack(found),
+    }
+
+
+def main(num_vectors: int, dimension: int, num_queries: int, k: int, only: list[str] | None = None) -> dict:
+    vectors = clustered_vectors(num_vectors, dimension, clusters=max(10, num_vectors // 200), seed=0)
+    # Queries are perturbed copies of stored vectors, like a question close to a chunk
+    noise = np.random.default_rng(1).standard_normal((num_queries, dimension)).astype(np.float32)
+    queries = vectors[:num_queries] + 0.05 * noise
+
+    results = {}
+    truth = None
+    for label, kind, rescore in CONFIGURATIONS:
+        # flat always runs: it provides the ground truth and the memory baseline
+        if only and label != "flat" and label not in only:
+            continue
+        result = run_configuration(kind, rescore, vectors, queries, k)
+        found = result.pop("found")
+        if truth is None:
+            truth = found  # flat is exact and runs first
+        result["recall_at_k"] = round(recall_at_k(found, truth), 4)
+        results[label] = result
+
+    flat_mb = results["flat"]["memory_mb"] or 1
+    for result in results.values():
+        result["compression"] = round(flat_mb / result["memory_mb"], 1) if result["memory_mb"] else None
+    return {"vectors": num_vectors, "dimension": dimension, "queries": num_queries, "k": k, "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=7)
+    parser.add_argument("--only", nargs="+", choices=[c[0] for c in CONFIGURATIONS],
+                        help="Subset of configurations (flat always runs)")
+    parser.add_argument("--json", action="store_true", help="Print raw JSON results")
+    args = parser.parse_args()
+
+    report = main(args.vectors, args.dimension, args.queries, args.k, args.only)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{'index':<15}{'built as':<10}{'memory':>10}{'ratio':>8}{'recall':>8}{'p50':>10}{'build':>9}")
+        for label, r in report["results"].items():
+            print(
+                f"{label:<15}{r['index_type']:<10}{r['memory_mb']:>8}MB{r['compression']:>7}x"
+                f"{r['recall_at_k']:>8}{r['search_ms']['p50']:>8.3f}ms{r['build_seconds']:>8.2f}s"
+            )
@@ -0,0 +1,121 @@
+"""
+Middleware Overhead Benchmark
+Compares the pure-ASGI middleware stack against BaseHTTPMiddleware wrapping.
+
+Drives the ASGI app directly (no sockets, no httpx buffering) so the numbers
+reflect only per-request middleware cost and time-to-first-token on a
+streaming response.
+
+Usage (from backend/):
+    python -m benchmarks.bench_middleware --requests 2000 --json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+
+# Benchmarks must not need real credentials or hit rate limits
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+os.environ.setdefault("RATE_LIMIT_CHAT", "1000000000")
+os.environ.setdefault("RATE_LIMIT_UPLOADS", "1000000000")
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from benchmarks.common import asgi_call, percentiles
+from middleware import (
+    APIKeyMiddleware,
+    RateLimitMiddleware,
+    RequestIDMiddleware,
+    RequestSizeLimitMiddleware,
+)
+
+TOKENS_PER_STREAM = 50
+
+
+class PassthroughHTTPMiddleware(BaseHTTPMiddleware):
+    """BaseHTTPMiddleware that does nothing, isolating its wrapping cost"""
+
+    async def dispatch(self, request, call_next):
+        return await call_next(request)
+
+
+def build_app(stack: str) -> FastAPI:
+    """Build a minimal app with a JSON and a streaming endpoint"""
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    @app.post("/chat")
+    async def chat():
+        async def tokens():
+            for i in range(TOKENS_PER_STREAM):
+                yield f'{{"type":"token","data":"t{i}"}}\n'
+                await asyncio.sleep(0)
+        return StreamingResponse(tokens(), media_type="application/x-ndjson")
+
+    if stack == "basehttp":
+        for _ in range(4):
+            app.add_middleware(PassthroughHTTPMiddleware)
+    elif stack == "asgi":
+        app.add_middleware(RequestIDMiddleware)
+        app.add_middleware(APIKeyMiddleware)
+        app.add_middleware(RateLimitMiddleware)
+        app.add_middleware(RequestSizeLimitMiddleware)
+    return app
+
+
+def summarize(samples: list[float]) -> dict:
+    """Latency percentiles in microseconds"""
+    summary = percentiles(samples, scale=1e6)
+    return {key + "_us": round(summary[key], 1) for key in ("mean", "p50", "p99")}
+
+
+async def run_stack(stack: str, requests: int) -> dict:
+    """Benchmark one middleware stack"""
+    app = build_app(stack)
+    # Warm up routing and middleware construction
+    for _ in range(20):
+        await asgi_call(app, "GET", "/health")
+        await asgi_call(app, "POST", "/chat")
+
+    plain = [(await asgi_call(app, "GET", "/health"))["total"] for _ in range(requests)]
+    streams = [await asgi_call(app, "POST", "/chat") for _ in range(requests // 10 or 1)]
+    return {
+        "stack": stack,
+        "json_request": summarize(plain),
+        "stream_ttft": summarize([result["ttft"] for result in streams]),
+        "stream_total": summarize([result["total"] for result in streams]),
+    }
+
+
+async def main(requests: int) -> list[dict]:
+    results = []
+    for stack in ("none", "basehttp", "asgi"):
+        results.append(await run_stack(stack, requests))
+    baseline = results[0]["json_request"]["mean_us"]
+    for result in results:
+        result["overhead_us"] = round(result["json_request"]["mean_us"] - baseline, 1)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--json", action="store_true", help="Print raw JSON results")
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args.requests))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'stack':<10}{'req mean':>12}{'req p99':>12}{'overhead':>12}{'ttft p50':>12}{'stream p50':>12}")
+        for r in results:
+            print(
+                f"{r['stack']:<10}{r['json_request']['mean_us']:>10}us{r['json_request']['p99_us']:>10}us"
+                f"{r['overhead_us']:>10}us{r['stream_ttft']['p50_us']:>10}us{r['stream_total']['p50_us']:>10}us"
+            )
@@ -0,0 +1,88 @@
+"""
+Text Splitter Benchmark
+Compares FastTextSplitter with LangChain's RecursiveCharacterTextSplitter on
+synthetic PDF pages and checks that both produce identical chunks.
+
+Usage (from backend/):
+    python -m benchmarks.bench_splitter --pages 1000 --json
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Iterable, Protocol, TypeVar
+
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from benchmarks.pdfgen import generate_pdf
+from text_splitter import FastTextSplitter
+
+
+T = TypeVar("T")
+
+
+class Splitter(Protocol):
+    def split_documents(self, documents: Iterable[Document]) -> list[Document]: ...
+
+
+def best_of(runs: int, fn: Callable[[], T]) -> tuple[float, T]:
+    """Fastest wall time over `runs` calls (at least one), and the last result"""
+    start = time.perf_counter()
+    result = fn()
+    best = time.perf_counter() - start
+    for _ in range(runs - 1):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(pages: int, chunk_size: int, chunk_overlap: int, runs: int) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        pdf_path = generate_pdf(Path(workdir) / "bench.pdf", pages)
+        documents = PyPDFLoader(str(pdf_path)).load()
+    characters = sum(len(document.page_content) for document in documents)
+
+    splitters: dict[str, Splitter] = {
+        "langchain": RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap),
+        "fast": FastTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap),
+    }
+    results = {}
+    outputs = {}
+    for name, splitter in splitters.items():
+        seconds, chunks = best_of(runs, lambda: splitter.split_documents(documents))
+        outputs[name] = [(chunk.page_content, chunk.metadata) for chunk in chunks]
+        results[name] = {
+            "seconds": round(seconds, 4),
+            "chunks": len(chunks),
+            "mb_per_second": round(characters / seconds / 1e6, 2),
+        }
+    return {
+        "pages": pages,
+        "characters": characters,
+        "identical": outputs["langchain"] == outputs["fast"],
+        "speedup": round(results["langchain"]["seconds"] / results["fast"]["seconds"], 2),
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--chunk-size", type=int, default=800)
+    parser.add_argument("--chunk-overlap", type=int, default=400)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Print raw JSON results")
+    args = parser.parse_args()
+
+    report = main(args.pages, args.chunk_size, args.chunk_overlap, args.runs)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for name, r in report["results"].items():
+            print(f"{name:<10}{r['seconds']:>9.3f}s{r['chunks']:>9} chunks{r['mb_per_second']:>8} MB/s")
+        print(f"speedup {report['speedup']}x, identical output: {report['identical']}")
@@ -0,0 +1,126 @@
+"""
+Shared Benchmark Helpers
+ASGI request driver, latency summaries and peak-RSS measurement.
+"""
+
+import asyncio
+import json
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+
+async def asgi_call(app, method: str, path: str, body: bytes = b"", headers: Optional[list] = None) -> dict:
+    """
+    Run one request through an ASGI app without sockets or response buffering.
+
+    Returns:
+        Dictionary with status, body bytes, ttft (seconds to first body byte)
+        and total (seconds to completion)
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"host", b"bench"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ] + (headers or []),
+        "client": ("127.0.0.1", 12345),
+        "server": ("bench", 80),
+    }
+    sent = False
+    status = 0
+    chunks: list[bytes] = []
+    first_byte: Optional[float] = None
+    start = time.perf_counter()
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.sleep(3600)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal first_byte, status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body"):
+            if first_byte is None:
+                first_byte = time.perf_counter()
+            chunks.append(message["body"])
+
+    await app(scope, receive, send)
+    end = time.perf_counter()
+    return {
+        "status": status,
+        "body": b"".join(chunks),
+        "ttft": (first_byte or end) - start,
+        "total": end - start,
+    }
+
+
+def percentiles(samples: list[float], scale: float = 1000.0) -> dict:
+    """Latency summary, by default in milliseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))] * scale, 3)
+
+    return {
+        "mean": round(statistics.fmean(ordered) * scale, 3),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "max": round(ordered[-1] * scale, 3),
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divisor, 1)
+
+
+def environment_info() -> dict:
+    """Identify the code and machine a result came from"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, cwd=Path(__file__).parent, check=False,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def write_json(data, path: Optional[str]) -> None:
+    """Write results to `path`, or stdout when no path is given"""
+    text = json.dumps(data, indent=2)
+    if path:
+        Path(path).write_text(text + "\n")
+    else:
+        print(text)
@@ -0,0 +1,83 @@
+"""
+Benchmark Report Comparison
+Diffs two JSON reports from benchmarks.run and flags regressions.
+
+Usage (from backend/):
+    python -m benchmarks.compare baseline.json candidate.json --threshold 0.15
+
+Exits with status 1 if any metric regressed by more than the threshold.
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Metrics that are counts or labels rather than performance measurements
+IGNORED_KEYS = {"pages", "chunks", "queries", "requests", "errors", "cache_hit", "max"}
+
+
+def flatten(data: dict, prefix: str = "") -> dict[str, float]:
+    """Flatten nested numeric fields into dotted keys"""
+    flat = {}
+    for key, value in data.items():
+        if key in IGNORED_KEYS:
+            continue
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = float(value)
+    return flat
+
+
+def higher_is_better(metric: str) -> bool:
+    return "per_second" in metric
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> list[dict]:
+    """Relative change for every metric present in both reports"""
+    def index(report):
+        return {(r["scenario"], r["pages"]): flatten(r) for r in report["results"]}
+
+    old, new = index(baseline), index(candidate)
+    rows = []
+    for key in sorted(old.keys() & new.keys()):
+        for metric in sorted(old[key].keys() & new[key].keys()):
+            before, after = old[key][metric], new[key][metric]
+            if before == 0:
+                continue
+            change = (after - before) / before
+            worse = -change if higher_is_better(metric) else change
+            rows.append({
+                "scenario": key[0],
+                "pages": key[1],
+                "metric": metric,
+                "before": before,
+                "after": after,
+                "change": change,
+                "regression": worse > threshold,
+            })
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("candidate", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative change counted as a regression (default 0.10)")
+    args = parser.parse_args()
+
+    rows = compare(
+        json.loads(args.baseline.read_text()),
+        json.loads(args.candidate.read_text()),
+        args.threshold,
+    )
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else ""
+        print(
+            f"{row['scenario']:<8}{row['pages']:>6}  {row['metric']:<32}"
+            f"{row['before']:>12.3f}{row['after']:>12.3f}{row['change']:>+9.1%}  {flag}"
+        )
+    sys.exit(1 if any(row["regression"] for row in rows) else 0)
@@ -0,0 +1,182 @@
+"""
+Concurrent /chat Load Generator
+Drives N concurrent NDJSON chat streams and reports throughput and the
+server's own overhead on top of model time.
+
+In-process mode (default) runs the app with the stub LLM and local
+embeddings, so overhead = observed stream time - the stub's intrinsic
+latency. With --url it targets a running server instead (start it with
+LLM_PROVIDER=stub to keep the overhead figure meaningful).
+
+Usage (from backend/):
+    python -m benchmarks.load_chat --concurrency 100 --requests 500
+    python -m benchmarks.load_chat --url http://localhost:8000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Protocol
+
+from benchmarks.common import environment_info, percentiles, write_json
+
+
+def _configure_environment(workdir: Path, first_token_ms: float, token_ms: float, tokens: int) -> None:
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    os.environ["LOG_LEVEL"] = "WARNING"
+    os.environ["EMBEDDING_PROVIDER"] = "local"
+    os.environ["LLM_PROVIDER"] = "stub"
+    os.environ["LLM_STUB_FIRST_TOKEN_MS"] = str(first_token_ms)
+    os.environ["LLM_STUB_TOKEN_MS"] = str(token_ms)
+    os.environ["LLM_STUB_TOKENS"] = str(tokens)
+    os.environ["VECTOR_STORE_PATH"] = str(workdir / "faiss_index")
+    os.environ["DB_PATH"] = str(workdir / "chat_history.db")
+    os.environ["RATE_LIMIT_CHAT"] = "1000000000"
+
+
+class LoadTarget(Protocol):
+    """What run_load drives: the in-process app or a running server"""
+
+    async def setup(self) -> None: ...
+
+    async def chat(self, question: str) -> dict: ...
+
+    async def close(self) -> None: ...
+
+
+class InProcessTarget:
+    """Runs the FastAPI app in this process over raw ASGI"""
+
+    def __init__(self, pages: int, workdir: Path):
+        from benchmarks.pdfgen import generate_pdf
+        from ingestion import ingest_pdf
+        from main import app
+
+        ingest_pdf(str(generate_pdf(workdir / "load.pdf", pages)))
+        self.app = app
+
+    async def setup(self) -> None:
+        from database import init_db
+        await init_db()
+
+    async def chat(self, question: str) -> dict:
+        from benchmarks.common import asgi_call
+        result = await asgi_call(self.app, "POST", "/chat", json.dumps({"question": question}).encode())
+        return {
+            "ok": result["status"] == 200 and b'"type":"error"' not in result["body"],
+            "ttft": result["ttft"],
+            "total": result["total"],
+            "tokens": result["body"].count(b'"type":"token"'),
+        }
+
+    async def close(self) -> None:
+        pass
+
+
+class HTTPTarget:
+    """Streams from a running server with httpx"""
+
+    def __init__(self, url: str):
+        import httpx
+        self.url = url.rstrip("/")
+        self.client = httpx.AsyncClient(timeout=None, limits=httpx.Limits(max_connections=None))
+
+    async def setup(self) -> None:
+        pass
+
+    async def chat(self, question: str) -> dict:
+        start = time.perf_counter()
+        first = None
+        tokens = 0
+        ok = True
+        async with self.client.stream("POST", f"{self.url}/chat", json={"question": question}) as response:
+            ok = response.status_code == 200
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                if first is None:
+                    first = time.perf_counter()
+                event = json.loads(line)
+                if event.get("type") == "token":
+                    tokens += 1
+                elif event.get("type") == "error":
+                    ok = False
+        end = time.perf_counter()
+        return {"ok": ok, "ttft": (first or end) - start, "total": end - start, "tokens": tokens}
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+async def run_load(target: LoadTarget, concurrency: int, requests: int, expected_seconds: float) -> dict:
+    """Fire `requests` chats with at most `concurrency` in flight"""
+    await target.setup()
+    semaphore = asyncio.Semaphore(concurrency)
+    results: list[dict] = []
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            try:
+                results.append(await target.chat(f"How do I replace the pump filter in section {i % 50}?"))
+            except Exception as e:
+                results.append({"ok": False, "ttft": 0.0, "total": 0.0, "tokens": 0, "error": str(e)})
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - start
+    await target.close()
+
+    ok = [r for r in results if r["ok"]]
+    report = {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": requests - len(ok),
+        "wall_seconds": round(wall, 3),
+        "streams_per_second": round(len(ok) / wall, 2),
+        "tokens_per_second": round(sum(r["tokens"] for r in ok) / wall, 1),
+        "ttft_ms": percentiles([r["ttft"] for r in ok]),
+        "stream_ms": percentiles([r["total"] for r in ok]),
+    }
+    if expected_seconds:
+        report["model_ms"] = round(expected_seconds * 1000, 3)
+        report["server_overhead_ms"] = percentiles([max(0.0, r["total"] - expected_seconds) for r in ok])
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Concurrent /chat load generator")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--url", help="Target a running server instead of the in-process app")
+    parser.add_argument("--pages", type=int, default=50, help="Synthetic PDF size (in-process mode)")
+    parser.add_argument("--first-token-ms", type=float, default=200.0)
+    parser.add_argument("--token-ms", type=float, default=20.0)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--output", help="Write JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    expected = (args.first_token_ms + max(0, args.tokens - 1) * args.token_ms) / 1000
+    target: LoadTarget
+    with tempfile.TemporaryDirectory(prefix="rag-load-") as tmp:
+        if args.url:
+            target = HTTPTarget(args.url)
+        else:
+            workdir = Path(tmp)
+            _configure_environment(workdir, args.first_token_ms, args.token_ms, args.tokens)
+            sys.path.insert(0, str(Path(__file__).parent.parent))
+            os.chdir(workdir)
+            target = InProcessTarget(args.pages, workdir)
+
+        report = asyncio.run(run_load(target, args.concurrency, args.requests, expected))
+    report["mode"] = "http" if args.url else "in-process"
+    report["environment"] = environment_info()
+    write_json(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Synthetic PDF Generator
+Writes deterministic multi-page text PDFs without any PDF library.
+
+Pages are filled with pseudo-random prose drawn from a fixed vocabulary,
+with a numbered section heading per page, so extraction, chunking and
+retrieval all have realistic work to do.
+"""
+
+import random
+from pathlib import Path
+
+VOCABULARY = (
+    "system valve pressure sensor calibration torque bolt assembly housing "
+    "procedure inspection warning maintenance interval filter pump motor "
+    "voltage circuit relay switch module firmware update configuration "
+    "network latency throughput buffer cache index query vector search "
+    "document chapter section table figure appendix reference manual step "
+    "install remove replace tighten loosen verify measure record report "
+    "the a of to and in for with on by from is are be must should may"
+).split()
+
+LINES_PER_PAGE = 45
+WORDS_PER_LINE = 12
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def page_lines(page_number: int, rng: random.Random) -> list[str]:
+    """Text lines for one page"""
+    lines = [f"Section {page_number + 1}: {rng.choice(VOCABULARY).title()} {rng.choice(VOCABULARY)}"]
+    for line_number in range(LINES_PER_PAGE - 1):
+        words = [rng.choice(VOCABULARY) for _ in range(WORDS_PER_LINE)]
+        sentence = " ".join(words).capitalize()
+        # Paragraph breaks every few lines give the splitter separators to find
+        lines.append(sentence + ("." if line_number % 6 == 5 else ""))
+    return lines
+
+
+def generate_pdf(path: Path, pages: int, seed: int = 0) -> Path:
+    """
+    Write a PDF with `pages` pages of extractable text.
+
+    Args:
+        path: Output file path
+        pages: Number of pages
+        seed: Seed for the deterministic text generator
+
+    Returns:
+        The output path
+    """
+    rng = random.Random(seed)
+    objects: list[bytes] = []
+
+    # 1: catalog, 2: page tree, 3: font; then (page, content) pairs
+    page_ids = [4 + 2 * i for i in range(pages)]
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects.append(f"<< /Type /Pages /Count {pages} /Kids [{kids}] >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    for i in range(pages):
+        text_ops = ["BT", "/F1 10 Tf", "12 TL", "50 760 Td"]
+        for line in page_lines(i, rng):
+            text_ops.append(f"({_escape(line)}) Tj T*")
+        text_ops.append("ET")
+        stream = "\n".join(text_ops).encode("latin-1")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_ids[i] + 1} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_at = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_at)
+
+    path.write_bytes(bytes(out))
+    return path
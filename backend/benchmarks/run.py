@@ -0,0 +1,230 @@
+"""
+Offline Benchmark Suite
+Ingestion, index build, retrieval and /chat against the local embedding
+provider and the zero-latency stub LLM.
+
+Every scenario runs in a fresh subprocess so peak RSS is attributable to
+that scenario alone. Nothing touches the network or the real data dirs.
+
+Usage (from backend/):
+    python -m benchmarks.run --pages 10 100 1000 --output bench.json
+    python -m benchmarks.run --pages 5000 --scenarios ingest
+    python -m benchmarks.compare old.json new.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from benchmarks.common import environment_info, peak_rss_mb, percentiles, write_json
+
+SCENARIOS = ("ingest", "index", "search", "chat")
+DEFAULT_PAGES = (10, 100, 1000)
+SEARCH_QUERIES = 200
+CHAT_REQUESTS = 50
+
+
+def _configure_environment(workdir: Path) -> None:
+    """Point all app storage at `workdir` before any app module is imported"""
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    os.environ["LOG_LEVEL"] = "WARNING"
+    os.environ["EMBEDDING_PROVIDER"] = "local"
+    os.environ["LLM_PROVIDER"] = "stub"
+    os.environ["LLM_STUB_FIRST_TOKEN_MS"] = "0"
+    os.environ["LLM_STUB_TOKEN_MS"] = "0"
+    os.environ["VECTOR_STORE_PATH"] = str(workdir / "faiss_index")
+    os.environ["DB_PATH"] = str(workdir / "chat_history.db")
+    os.environ["TEMP_DIR"] = str(workdir / "temp")
+    os.environ["RATE_LIMIT_CHAT"] = "1000000000"
+    os.environ["RATE_LIMIT_UPLOADS"] = "1000000000"
+
+
+def _queries(count: int) -> list[str]:
+    from benchmarks.pdfgen import VOCABULARY
+    return [
+        f"How do I {VOCABULARY[i % 40]} the {VOCABULARY[(i * 7) % 40]} {VOCABULARY[(i * 13) % 40]}?"
+        for i in range(count)
+    ]
+
+
+def _load_chunks(pdf_path: Path):
+    from langchain_community.document_loaders import PyPDFLoader
+    from ingestion import create_splitter
+
+    documents = PyPDFLoader(str(pdf_path)).load()
+    return create_splitter().split_documents(documents)
+
+
+def _time_searches(search, queries: list[str]) -> dict:
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def scenario_ingest(pdf_path: Path, pages: int) -> dict:
+    """Cold ingest (with cache write) followed by a cached re-ingest"""
+    from cache import DocumentCache
+    from ingestion import ingest_pdf
+    from metrics import INGESTION_STAGE_SECONDS
+
+    content_hash = DocumentCache.get_content_hash(pdf_path.read_bytes())
+
+    start = time.perf_counter()
+    result = ingest_pdf(str(pdf_path), content_hash)
+    cold = time.perf_counter() - start
+    stages = {
+        stage: round(INGESTION_STAGE_SECONDS.sum(stage=stage) * 1000, 1)
+        for stage in ("load", "split", "embed", "index", "save", "cache")
+    }
+
+    start = time.perf_counter()
+    cached = ingest_pdf(str(pdf_path), content_hash)
+    warm = time.perf_counter() - start
+
+    return {
+        "chunks": result["chunks"],
+        "cold_seconds": round(cold, 3),
+        "pages_per_second": round(pages / cold, 1),
+        "chunks_per_second": round(result["chunks"] / cold, 1),
+        "stages_ms": stages,
+        "cached_seconds": round(warm, 3),
+        "cache_hit": cached["cache_hit"],
+    }
+
+
+def scenario_index(pdf_path: Path, pages: int) -> dict:
+    """Build each index type via create_optimized_vectorstore and query it"""
+    from embeddings import get_embeddings
+    from index_factory import index_memory_bytes
+    from ingestion import create_optimized_vectorstore
+
+    embeddings = get_embeddings()
+    chunks = _load_chunks(pdf_path)
+    queries = _queries(SEARCH_QUERIES)
+    results: dict[str, Any] = {"chunks": len(chunks)}
+
+    for index_type in ("flat", "ivf", "sq8", "ivfpq", "hnsw"):
+        start = time.perf_counter()
+        store = create_optimized_vectorstore(chunks, embeddings, len(chunks), index_type=index_type)
+        build = time.perf_counter() - start
+        results[index_type] = {
+            "build_seconds": round(build, 3),
+            "index_type": type(store.index).__name__,
+            "memory_mb": round(index_memory_bytes(store.index) / 1024 / 1024, 2),
+            "search_ms": _time_searches(lambda q: store.similarity_search(q, k=7), queries),
+        }
+    return results
+
+
+def scenario_search(pdf_path: Path, pages: int) -> dict:
+    """Query latency through FAISSVectorStore.similarity_search"""
+    from ingestion import ingest_pdf
+    from metrics import EMBEDDING_SECONDS, VECTOR_SEARCH_SECONDS
+    from vector_store import vector_store
+
+    result = ingest_pdf(str(pdf_path))
+    queries = _queries(SEARCH_QUERIES)
+    EMBEDDING_SECONDS.reset()
+    VECTOR_SEARCH_SECONDS.reset()
+    latency = _time_searches(vector_store.similarity_search, queries)
+    count = VECTOR_SEARCH_SECONDS.count() or 1
+    return {
+        "chunks": result["chunks"],
+        "queries": len(queries),
+        "latency_ms": latency,
+        "mean_embedding_ms": round(EMBEDDING_SECONDS.sum(operation="query") / count * 1000, 3),
+        "mean_faiss_ms": round(VECTOR_SEARCH_SECONDS.sum() / count * 1000, 3),
+        "queries_per_second": round(1000 / latency["mean"], 1),
+    }
+
+
+def scenario_chat(pdf_path: Path, pages: int) -> dict:
+    """End-to-end /chat through the ASGI app with a zero-latency stub LLM"""
+    from benchmarks.common import asgi_call
+    from database import init_db
+    from ingestion import ingest_pdf
+    from main import app
+
+    ingest_pdf(str(pdf_path))
+
+    async def drive() -> list[dict]:
+        await init_db()
+        runs = []
+        for question in _queries(CHAT_REQUESTS):
+            body = json.dumps({"question": question}).encode()
+            runs.append(await asgi_call(app, "POST", "/chat", body))
+        return runs
+
+    runs = asyncio.run(drive())
+    total = sum(run["total"] for run in runs)
+    return {
+        "requests": len(runs),
+        "errors": sum(1 for run in runs if run["status"] != 200 or b'"error"' in run["body"]),
+        "ttft_ms": percentiles([run["ttft"] for run in runs]),
+        "total_ms": percentiles([run["total"] for run in runs]),
+        "requests_per_second": round(len(runs) / total, 1),
+    }
+
+
+def run_worker(scenario: str, pages: int, workdir: Path, result_file: Path) -> None:
+    """Run one scenario in this (fresh) process and write its result"""
+    _configure_environment(workdir)
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+    os.chdir(workdir)  # DocumentCache writes relative to the working directory
+
+    from benchmarks.pdfgen import generate_pdf
+
+    pdf_path = generate_pdf(workdir / f"synthetic_{pages}.pdf", pages)
+    result = globals()[f"scenario_{scenario}"](pdf_path, pages)
+    result["peak_rss_mb"] = peak_rss_mb()
+    result_file.write_text(json.dumps(result))
+
+
+def run_suite(pages_list: list[int], scenarios: list[str]) -> dict:
+    """Run every scenario for every page count in isolated subprocesses"""
+    report: dict[str, Any] = {"environment": environment_info(), "results": []}
+    backend_dir = Path(__file__).parent.parent
+    for pages in pages_list:
+        for scenario in scenarios:
+            with tempfile.TemporaryDirectory(prefix="rag-bench-") as tmp:
+                workdir = Path(tmp)
+                result_file = workdir / "result.json"
+                print(f"[bench] {scenario} pages={pages}", file=sys.stderr)
+                proc = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.run", "--worker", scenario,
+                     "--pages", str(pages), "--workdir", str(workdir), "--result-file", str(result_file)],
+                    cwd=backend_dir, capture_output=True, text=True,
+                )
+                entry = {"scenario": scenario, "pages": pages}
+                if proc.returncode == 0 and result_file.exists():
+                    entry.update(json.loads(result_file.read_text()))
+                else:
+                    entry["error"] = proc.stderr.strip().splitlines()[-1:] or ["unknown error"]
+                report["results"].append(entry)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline ingestion/retrieval/chat benchmarks")
+    parser.add_argument("--pages", type=int, nargs="+", default=list(DEFAULT_PAGES))
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--output", help="Write JSON report here instead of stdout")
+    parser.add_argument("--worker", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", type=Path, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.pages[0], args.workdir, args.result_file)
+    else:
+        write_json(run_suite(args.pages, args.scenarios), args.output)
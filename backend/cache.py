@@ -9,6 +9,7 @@ from pathlib import Path
 from typing import Optional
 
 from logging_config import get_logger
+from metrics import DOCUMENT_CACHE_REQUESTS
 
 logger = get_logger(__name__)
 
@@ -21,6 +22,37 @@ class DocumentCache:
     
     CACHE_DIR = Path("./cache/embeddings")
     
+    @classmethod
+    def _cache_path(cls, content_hash: str) -> Path:
+        """
+        Cache directory for a hash, namespaced by embedding signature so an
+        index built by one provider is never loaded with another.
+        """
+        from embeddings import embedding_signature
+        return cls.CACHE_DIR / embedding_signature() / content_hash
+    
+    @classmethod
+    def _entry_path(cls, content_hash: str) -> Path:
+        """
+        Cache directory to read a hash from. Entries written before caches
+        were namespaced (CACHE_DIR/<hash>) all came from the Google provider;
+        while that provider is configured they are moved into its namespace
+        on first access instead of being re-embedded.
+        """
+        from embeddings import embedding_signature
+        
+        cache_path = cls._cache_path(content_hash)
+        legacy_path = cls.CACHE_DIR / content_hash
+        if (
+            not cache_path.exists()
+            and (legacy_path / "index.faiss").exists()
+            and embedding_signature() == embedding_signature("google")
+        ):
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(legacy_path), str(cache_path))
+            logger.info("cache_legacy_adopted", hash=content_hash, path=str(cache_path))
+        return cache_path
+    
     @classmethod
     def get_content_hash(cls, content: bytes) -> str:
         """
@@ -45,7 +77,7 @@ class DocumentCache:
         Returns:
             True if cached index exists
         """
-        cache_path = cls.CACHE_DIR / content_hash
+        cache_path = cls._entry_path(content_hash)
         # FAISS index consists of .faiss and .pkl files
         faiss_file = cache_path / "index.faiss"
         pkl_file = cache_path / "index.pkl"
@@ -55,6 +87,7 @@ class DocumentCache:
             logger.info("cache_check", hash=content_hash, result="hit")
         else:
             logger.debug("cache_check", hash=content_hash, result="miss")
+        DOCUMENT_CACHE_REQUESTS.inc(result="hit" if exists else "miss")
         
         return exists
     
@@ -69,7 +102,7 @@ class DocumentCache:
         Returns:
             Path to cache directory for this hash
         """
-        return cls.CACHE_DIR / content_hash
+        return cls._entry_path(content_hash)
     
     @classmethod
     def cache_index(cls, content_hash: str, vectorstore, num_chunks: int) -> None:
@@ -81,7 +114,7 @@ class DocumentCache:
             vectorstore: FAISS vector store instance
             num_chunks: Number of chunks in the document
         """
-        cache_path = cls.CACHE_DIR / content_hash
+        cache_path = cls._cache_path(content_hash)
         cache_path.mkdir(parents=True, exist_ok=True)
         
         try:
@@ -97,33 +130,72 @@ class DocumentCache:
             raise
     
     @classmethod
-    def load_cached_index(cls, content_hash: str, embeddings) -> Optional[object]:
+    def load_cached_index(cls, content_hash: str, embeddings=None) -> Optional[object]:
         """
         Load cached FAISS index.
         
+        Indexes cached under a different metric than INDEX_METRIC (e.g. L2
+        indexes from before cosine search) are migrated in place when their
+        vectors can be recovered exactly, and invalidated otherwise.
+        
         Args:
             content_hash: Content hash from get_content_hash()
-            embeddings: Embeddings instance to load with
+            embeddings: Embeddings instance to load with (defaults to the
+                configured provider)
         
         Returns:
             Loaded FAISS vectorstore or None if load fails
         """
-        from langchain_community.vectorstores import FAISS
+        from embeddings import get_embeddings
+        from index_factory import index_metric, resolve_metric
+        from vector_store import load_faiss
         
-        cache_path = cls.CACHE_DIR / content_hash
+        embeddings = embeddings or get_embeddings()
+        cache_path = cls._entry_path(content_hash)
         
         try:
-            vectorstore = FAISS.load_local(
-                str(cache_path),
-                embeddings,
-                allow_dangerous_deserialization=True
-            )
+            vectorstore = load_faiss(cache_path, embeddings)
+            if index_metric(vectorstore.index) != resolve_metric():
+                return cls._migrate_index(content_hash, vectorstore, embeddings)
             logger.info("cache_loaded", hash=content_hash, path=str(cache_path))
             return vectorstore
         except Exception as e:
             logger.error("cache_load_failed", hash=content_hash, error=str(e))
             return None
     
+    @classmethod
+    def _migrate_index(cls, content_hash: str, vectorstore, embeddings) -> Optional[object]:
+        """
+        Rebuild a cached index under the configured metric. Only the metric
+        changes: the result is an exact flat index, as the cache held exact
+        vectors.
+        
+        Returns:
+            Migrated vectorstore (also written back to the cache), or None if
+            the index is lossy and the entry was invalidated
+        """
+        from index_factory import build_index, index_metric, reconstruct_vectors
+        from vector_store import wrap_index
+        
+        old_metric = index_metric(vectorstore.index)
+        vectors = reconstruct_vectors(vectorstore.index)
+        if vectors is None:
+            # Compressed vectors cannot be recovered exactly; re-ingest instead
+            shutil.rmtree(cls._cache_path(content_hash), ignore_errors=True)
+            logger.warning("cache_invalidated", hash=content_hash, reason="metric_changed")
+            return None
+        
+        index, _ = build_index("flat", vectors)
+        migrated = wrap_index(index, embeddings, vectorstore.docstore, vectorstore.index_to_docstore_id)
+        cls.cache_index(content_hash, migrated, len(vectors))
+        logger.info(
+            "cache_migrated",
+            hash=content_hash,
+            from_metric=old_metric,
+            to_metric=index_metric(index),
+        )
+        return migrated
+    
     @classmethod
     def clear_cache(cls) -> None:
         """Delete all cached embeddings"""
@@ -15,6 +15,8 @@ class Settings(BaseSettings):
     TEMP_DIR: Path = BASE_DIR / "temp"
     VECTOR_STORE_PATH: Path = BASE_DIR / "faiss_index"
     DB_PATH: Path = BASE_DIR / "chat_history.db"
+    SESSION_STORE_DIR: Path = BASE_DIR / "faiss_sessions"  # Indexes of non-default sessions
+    PERSISTENT: bool = False  # Keep chat history and indexes across restarts (validated at startup)
 
     # API Keys
     GOOGLE_API_KEY: str = Field(..., description="Google API Key required for Embeddings and Chat")
@@ -27,24 +29,86 @@ class Settings(BaseSettings):
         return [origin.strip() for origin in self.ALLOWED_ORIGINS_STR.split(",")]
 
     # Vector Store Settings
+    EMBEDDING_PROVIDER: str = "google"  # "google" (Gemini API) or "local" (CPU hashing)
     EMBEDDING_MODEL: str = "models/text-embedding-004"
+    EMBEDDING_DIMENSION: int = 768  # Output size of the local provider
+    EMBEDDING_BATCH_SIZE: int = 256  # Texts per local embedding batch
+    EMBEDDING_WORKERS: int = 4  # Threads for local batch embedding
+    LLM_PROVIDER: str = "google"  # "google" (Gemini API) or "stub" (local, for load testing)
     LLM_MODEL: str = "gemini-flash-latest"
     LLM_TEMPERATURE: float = 0.0
+    LLM_STUB_TOKENS: int = 60  # Tokens streamed per stub answer
+    LLM_STUB_FIRST_TOKEN_MS: float = 200.0  # Simulated time to first token
+    LLM_STUB_TOKEN_MS: float = 20.0  # Simulated gap between tokens
 
     # Chunking Settings
     CHUNK_SIZE: int = 800
     CHUNK_OVERLAP: int = 400
+    CHUNK_UNIT: str = "chars"  # "chars" (CHUNK_SIZE/CHUNK_OVERLAP) or "tokens" (the *_TOKENS sizes)
+    CHUNK_SIZE_TOKENS: int = 200  # Capped at the embedding model's input limit
+    CHUNK_OVERLAP_TOKENS: int = 100
 
     # Retrieval Settings
     RETRIEVER_K: int = 7
+    RAG_CONTEXT_TOKENS: int = 4000  # Budget for retrieved chunks in the prompt
+
+    # Conversation Memory Settings
+    CONVERSATION_TURNS: int = 6  # Recent Q&A pairs kept verbatim per session
+    CONVERSATION_HISTORY_TOKENS: int = 800  # Budget for history in the prompt
+    CONVERSATION_SUMMARY_TOKENS: int = 300  # Budget for the summary of older turns
+    CONVERSATION_ANSWER_CHARS: int = 600  # Answer prefix remembered per turn
+    CONVERSATION_EXPANSION_TERMS: int = 6  # Terms from recent questions added to follow-up queries
+    CONVERSATION_MAX_SESSIONS: int = 1000  # Sessions kept in memory (least recently used evicted)
+    SESSION_MAX_LOADED_INDEXES: int = 32  # Session indexes held in memory (least recently used evicted)
+
+    # FAISS Index Settings
+    INDEX_TYPE: str = "auto"  # "auto", "flat", "ivf", "sq8" (4x smaller), "ivfpq" (16x smaller) or "hnsw"
+    INDEX_METRIC: str = "cosine"  # "cosine" (normalized inner product, scores in [-1, 1]) or "l2"
+    INDEX_RESCORE: bool = False  # Re-rank compressed-index candidates against exact vectors
+    INDEX_RESCORE_FACTOR: int = 4  # Candidates fetched per result when rescoring
+    INDEX_NPROBE: int = 16  # Inverted lists visited per IVF query
+    INDEX_TRAIN_SAMPLE: int = 20_000  # Max vectors used to train IVF/PQ
+    INDEX_HNSW_M: int = 32  # Graph neighbours per node (memory vs recall)
+    INDEX_HNSW_EF_CONSTRUCTION: int = 80  # Build-time search depth
+    INDEX_HNSW_EF_SEARCH: int = 64  # Query-time search depth (latency vs recall)
 
     # Ingestion Settings
     INGESTION_BATCH_SIZE: int = 10
     INGESTION_MAX_RETRIES: int = 5
     INGESTION_BASE_DELAY: int = 2
+    INGESTION_PIPELINE_BATCH: int = 256  # Chunks embedded and indexed per pipeline step
+    INGESTION_QUEUE_SIZE: int = 4  # Items buffered between pipeline stages
 
     # Chat Settings
     CHAT_MAX_RETRIES: int = 3
+    STREAM_COALESCE_MS: float = 0.0  # Merge tokens into one frame per window (0 = frame per token)
+    STREAM_COALESCE_CHARS: int = 1024  # Send a merged frame early once this much text is waiting
+    SSE_HEARTBEAT_SECONDS: float = 15.0  # Comment line sent on idle event streams
+    SSE_RETRY_MS: int = 3000  # Client reconnect delay announced on event streams
+    GENERATION_BUFFER_FRAMES: int = 4096  # Frames kept per generation for resuming streams
+    GENERATION_TTL_SECONDS: float = 300.0  # How long finished generations stay resumable
+    GENERATION_ABANDON_SECONDS: float = 10.0  # Cancel an answer this long after its last reader left
+    DISCONNECT_POLL_SECONDS: float = 1.0  # How often streams check whether the client is still there
+
+    # Compression Settings
+    COMPRESSION_ENABLED: bool = True  # gzip/zstd responses for clients that accept it
+    COMPRESSION_MIN_BYTES: int = 1024  # Smaller complete bodies are sent as-is
+    COMPRESSION_LEVEL: int = 6
+    COMPRESS_STREAMS: bool = False  # Also compress /chat streams (flushed per frame)
+
+    # Chat History Settings
+    MESSAGE_WRITE_BEHIND: bool = True  # Queue message inserts and commit them in batches
+    MESSAGE_FLUSH_MS: float = 50.0  # Longest a queued message waits before its batch is written
+    MESSAGE_BATCH_SIZE: int = 64  # Write a batch early once this many messages are queued
+
+    # Chat History Retention (0 = keep everything)
+    RETENTION_MAX_AGE_DAYS: float = 0.0  # Remove messages older than this
+    RETENTION_MAX_MESSAGES: int = 0  # Keep at most this many messages (newest)
+    RETENTION_INTERVAL_SECONDS: float = 3600.0  # How often the retention job runs
+    RETENTION_BATCH_SIZE: int = 500  # Rows removed per transaction
+    RETENTION_ARCHIVE_DIR: Path = BASE_DIR / "archive"  # Removed rows are kept here as .ndjson.gz
+    RETENTION_ARCHIVE: bool = True
+    RETENTION_VACUUM_PAGES: int = 2000  # Free pages returned to the OS per run (incremental_vacuum)
 
     # Security Settings
     MAX_FILE_SIZE_MB: int = 50
@@ -88,22 +152,36 @@ BASE_DIR = settings.BASE_DIR
 TEMP_DIR = settings.TEMP_DIR
 VECTOR_STORE_PATH = settings.VECTOR_STORE_PATH
 DB_PATH = settings.DB_PATH
+SESSION_STORE_DIR = settings.SESSION_STORE_DIR
 
 GOOGLE_API_KEY = settings.GOOGLE_API_KEY
 ALLOWED_ORIGINS = settings.ALLOWED_ORIGINS
 
+EMBEDDING_PROVIDER = settings.EMBEDDING_PROVIDER
 EMBEDDING_MODEL = settings.EMBEDDING_MODEL
+EMBEDDING_DIMENSION = settings.EMBEDDING_DIMENSION
+LLM_PROVIDER = settings.LLM_PROVIDER
 LLM_MODEL = settings.LLM_MODEL
 LLM_TEMPERATURE = settings.LLM_TEMPERATURE
 
 CHUNK_SIZE = settings.CHUNK_SIZE
 CHUNK_OVERLAP = settings.CHUNK_OVERLAP
+CHUNK_UNIT = settings.CHUNK_UNIT
+CHUNK_SIZE_TOKENS = settings.CHUNK_SIZE_TOKENS
+CHUNK_OVERLAP_TOKENS = settings.CHUNK_OVERLAP_TOKENS
 
 RETRIEVER_K = settings.RETRIEVER_K
+SESSION_MAX_LOADED_INDEXES = settings.SESSION_MAX_LOADED_INDEXES
+RAG_CONTEXT_TOKENS = settings.RAG_CONTEXT_TOKENS
+
+INDEX_TYPE = settings.INDEX_TYPE
+INDEX_METRIC = settings.INDEX_METRIC
 
 INGESTION_BATCH_SIZE = settings.INGESTION_BATCH_SIZE
 INGESTION_MAX_RETRIES = settings.INGESTION_MAX_RETRIES
 INGESTION_BASE_DELAY = settings.INGESTION_BASE_DELAY
+INGESTION_PIPELINE_BATCH = settings.INGESTION_PIPELINE_BATCH
+INGESTION_QUEUE_SIZE = settings.INGESTION_QUEUE_SIZE
 
 CHAT_MAX_RETRIES = settings.CHAT_MAX_RETRIES
 
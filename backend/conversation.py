@@ -0,0 +1,240 @@
+"""
+Conversation Memory
+Recent turns per session, kept in memory so follow-up questions
+("what about step 3?") retrieve and answer in context.
+
+Each session holds a ring of the last CONVERSATION_TURNS question/answer
+pairs. A turn pushed out of the ring is folded into an extractive summary
+(the question plus the first sentence of its answer), so the summary is
+updated incrementally instead of being rebuilt. The ring is filled from
+SQLite the first time a session is seen; after that no request reads the
+messages table.
+
+No extra LLM calls are made: follow-ups are expanded with key terms from
+recent questions for retrieval, and the prompt gets a token-bounded
+history block.
+"""
+
+import asyncio
+import re
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Optional, Tuple
+
+from config import settings
+from logging_config import get_logger
+from sessions import DEFAULT_SESSION
+from tokenizer import count_tokens
+
+logger = get_logger(__name__)
+
+_TERM_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9\-]*")
+_WORD_RE = re.compile(r"[a-z]+")
+
+# A question that opens like a continuation or refers back to something
+# ("it", "those", "the same") is a follow-up; one without these cues is
+# searched as asked, however short
+_FOLLOW_UP_OPENERS = (
+    ("and",), ("also",), ("but",), ("so",), ("then",), ("why",),
+    ("what", "about"), ("how", "about"), ("what", "else"), ("what", "if"),
+)
+_REFERENCE_WORDS = frozenset("""
+    it its itself they them their theirs these those this such
+    same above previous former latter else another
+""".split())
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+_STOPWORDS = frozenset("""
+    a about above after again all also am an and any are as at be because been before being
+    both but by can could did do does doing down during each few for from further had has
+    have having he her here hers him his how i if in into is it its itself just me more most
+    my no nor not now of off on once only or other our out over own same she should so some
+    such than that the their them then there these they this those through to too under
+    until up very was we were what when where which while who whom why will with would you
+    your tell explain describe show give please mean means
+""".split())
+
+
+@dataclass
+class Turn:
+    """One question/answer pair with its prompt size precomputed"""
+    question: str
+    answer: str
+    tokens: int
+
+
+@dataclass
+class Session:
+    """Memory for one conversation"""
+    turns: Deque[Turn]
+    summary: Deque[Tuple[str, int]] = field(default_factory=deque)  # (line, tokens), oldest first
+    summary_tokens: int = 0
+
+    def add(self, question: str, answer: str) -> None:
+        """Append a turn, folding the evicted one into the summary"""
+        answer = answer[:settings.CONVERSATION_ANSWER_CHARS]
+        if len(self.turns) == self.turns.maxlen:
+            self._summarize(self.turns[0])
+        text = f"User: {question}\nAssistant: {answer}"
+        self.turns.append(Turn(question, answer, count_tokens(text)))
+
+    def _summarize(self, turn: Turn) -> None:
+        line = f"- {turn.question} -> {_first_sentence(turn.answer)}"
+        tokens = count_tokens(line)
+        self.summary.append((line, tokens))
+        self.summary_tokens += tokens
+        while self.summary_tokens > settings.CONVERSATION_SUMMARY_TOKENS and len(self.summary) > 1:
+            _, dropped = self.summary.popleft()
+            self.summary_tokens -= dropped
+
+
+def _first_sentence(text: str, max_chars: int = 200) -> str:
+    """Leading sentence of an answer, clipped"""
+    text = " ".join(text.split())
+    sentence = _SENTENCE_END_RE.split(text, maxsplit=1)[0]
+    return sentence[:max_chars]
+
+
+def _terms(text: str) -> list[str]:
+    """Content terms in order of appearance, lowercased and deduplicated"""
+    seen = []
+    for term in _TERM_RE.findall(text.lower()):
+        if term in _STOPWORDS or (len(term) < 3 and not term.isdigit()):
+            continue
+        if term not in seen:
+            seen.append(term)
+    return seen
+
+
+def is_follow_up(question: str) -> bool:
+    """Whether a question leans on earlier turns: a continuation opener, a back-reference, or no content terms"""
+    words = _WORD_RE.findall(question.lower())
+    if any(tuple(words[:len(opener)]) == opener for opener in _FOLLOW_UP_OPENERS):
+        return True
+    return not _terms(question) or any(word in _REFERENCE_WORDS for word in words)
+
+
+def expand_query(session: Session, question: str) -> str:
+    """
+    Retrieval query for a question in the context of a session.
+    Follow-ups (see is_follow_up) get key terms from the most recent
+    questions appended; self-contained questions are returned unchanged.
+    """
+    if not session.turns or not is_follow_up(question):
+        return question
+    own = _terms(question)
+    extra = []
+    for turn in reversed(session.turns):
+        for term in _terms(turn.question):
+            if term not in own and term not in extra:
+                extra.append(term)
+        if len(extra) >= settings.CONVERSATION_EXPANSION_TERMS:
+            break
+    if not extra:
+        return question
+    return f"{question} {' '.join(extra[:settings.CONVERSATION_EXPANSION_TERMS])}"
+
+
+def history_block(session: Session, budget: Optional[int] = None) -> Tuple[str, int]:
+    """
+    Conversation history for the prompt within a token budget.
+    Recent turns take priority (newest first), then the summary of older
+    turns if it still fits. Returned oldest first.
+
+    Returns:
+        Tuple of (history text, its tokens); ("", 0) for a new session
+    """
+    budget = settings.CONVERSATION_HISTORY_TOKENS if budget is None else budget
+    used = 0
+    recent = []
+    for turn in reversed(session.turns):
+        if used + turn.tokens > budget:
+            break
+        recent.append(f"User: {turn.question}\nAssistant: {turn.answer}")
+        used += turn.tokens
+    recent.reverse()
+    parts = []
+    if session.summary and used + session.summary_tokens <= budget:
+        parts.append("Earlier:\n" + "\n".join(line for line, _ in session.summary))
+        used += session.summary_tokens
+    parts.extend(recent)
+    return "\n\n".join(parts), used
+
+
+class ConversationMemory:
+    """In-memory sessions, least recently used evicted beyond CONVERSATION_MAX_SESSIONS"""
+
+    def __init__(self):
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._loading: dict[str, asyncio.Event] = {}  # Session id -> set when its load ends
+        self._clears = 0  # Bumped by clear(); a load that spans one is not kept
+        self._lock = asyncio.Lock()
+
+    async def get(self, session_id: str = DEFAULT_SESSION) -> Session:
+        """
+        Session memory, loaded from the session's stored messages on first use.
+        The load runs outside the lock, so a cold session does not hold up
+        lookups in other sessions; concurrent requests for the same session
+        wait for the one load.
+        """
+        while True:
+            async with self._lock:
+                session = self._sessions.get(session_id)
+                if session is not None:
+                    self._sessions.move_to_end(session_id)
+                    return session
+                loading = self._loading.get(session_id)
+                if loading is None:
+                    loading = self._loading[session_id] = asyncio.Event()
+                    clears = self._clears
+                    break
+            await loading.wait()
+        try:
+            session = Session(turns=deque(maxlen=settings.CONVERSATION_TURNS))
+            await self._load(session, session_id)
+            async with self._lock:
+                if self._clears == clears:
+                    self._sessions[session_id] = session
+                    while len(self._sessions) > settings.CONVERSATION_MAX_SESSIONS:
+                        self._sessions.popitem(last=False)
+        finally:
+            del self._loading[session_id]
+            loading.set()
+        return session
+
+    async def record(self, question: str, answer: str, session_id: str = DEFAULT_SESSION) -> None:
+        """Remember a completed turn"""
+        session = await self.get(session_id)
+        session.add(question, answer)
+
+    async def clear(self, session_id: Optional[str] = None) -> None:
+        """Forget one session, or all sessions"""
+        async with self._lock:
+            self._clears += 1
+            if session_id is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(session_id, None)
+
+    @staticmethod
+    async def _load(session: Session, session_id: str) -> None:
+        """Replay stored messages into a new session (once per session)"""
+        from database import get_recent_messages
+        # Older pairs beyond the ring still reach the summary
+        limit = 2 * (settings.CONVERSATION_TURNS + 10)
+        try:
+            messages = await get_recent_messages(limit, session_id)
+        except Exception as e:
+            logger.warning("conversation_load_failed", error=str(e))
+            return
+        question = None
+        for message in messages:
+            if message["role"] == "user":
+                question = message["content"]
+            elif question is not None:
+                session.add(question, message["content"])
+                question = None
+
+
+# Singleton instance
+conversation_memory = ConversationMemory()
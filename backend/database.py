@@ -1,43 +1,371 @@
 """
 Async Database Module for Chat History
 Uses aiosqlite for non-blocking database operations
+
+Messages are written behind: add_message queues the row and returns, and
+a background task inserts queued rows in one transaction every
+MESSAGE_FLUSH_MS or MESSAGE_BATCH_SIZE messages, so /chat never waits on a
+commit before streaming. Rows are written in the order they were added,
+and every read or delete flushes the queue first, so callers always see
+their own writes.
+
+messages_fts is an FTS5 index over message content, kept in sync by
+triggers, that backs search_messages (/history/search).
+
+message_sources holds the retrieved chunks an answer was based on. They
+are written in the same transaction as the answer and read back with the
+messages in one join, so reopening a conversation shows its citations
+without touching embeddings or FAISS.
 """
 
+import asyncio
+import html
+import re
+import time
+from typing import Any, List, Optional, Sequence
+
 import aiosqlite
-from config import DB_PATH
+from config import DB_PATH, settings
+from logging_config import get_logger
+from metrics import DB_WRITE_SECONDS
+from sessions import DEFAULT_SESSION
+
+logger = get_logger(__name__)
+
+_INSERT_MESSAGE = "INSERT INTO messages (session_id, role, content, truncated) VALUES (?, ?, ?, ?)"
+_INSERT_SOURCE = (
+    "INSERT INTO message_sources (message_id, position, chunk_id, page, score, preview) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+_SOURCES_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS message_sources (
+        message_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        chunk_id TEXT,
+        page INTEGER,
+        score REAL,
+        preview TEXT,
+        PRIMARY KEY (message_id, position)
+    ) WITHOUT ROWID
+    """,
+    # Sources go with their message (clears, retention)
+    """
+    CREATE TRIGGER IF NOT EXISTS message_sources_delete AFTER DELETE ON messages BEGIN
+        DELETE FROM message_sources WHERE message_id = old.id;
+    END
+    """,
+]
+
+# Messages with their sources, one row per source (or one with NULLs);
+# {messages} is the messages table or a subquery selecting a page of it
+_MESSAGES_WITH_SOURCES = """
+    SELECT m.id, m.role, m.content, m.timestamp, m.truncated,
+           s.chunk_id, s.page, s.score, s.preview
+    FROM {messages} m
+    LEFT JOIN message_sources s ON s.message_id = m.id
+"""
+
+# External-content FTS5 table: the text lives once, in messages. The
+# session_id column is indexed as one token per message (see
+# _session_token), so a search matches only its session's postings.
+# Raw ids would be stemmed ("run" and "running" would match each other);
+# the token is the id's hex with a trailing "x", and no Porter suffix ends
+# in "x". The token is written by the triggers, never read back from
+# messages, so the index is filled by INSERT ... SELECT, not 'rebuild'.
+_FTS_SESSION_TOKEN = "hex({row}.session_id) || 'x'"
+_FTS_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content, session_id,
+        content='messages', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts (rowid, content, session_id)
+        VALUES (new.id, new.content, {_FTS_SESSION_TOKEN.format(row="new")});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, content, session_id)
+        VALUES ('delete', old.id, old.content, {_FTS_SESSION_TOKEN.format(row="old")});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, content, session_id)
+        VALUES ('delete', old.id, old.content, {_FTS_SESSION_TOKEN.format(row="old")});
+        INSERT INTO messages_fts (rowid, content, session_id)
+        VALUES (new.id, new.content, {_FTS_SESSION_TOKEN.format(row="new")});
+    END
+    """,
+]
+_FTS_POPULATE = f"""
+    INSERT INTO messages_fts (rowid, content, session_id)
+    SELECT id, content, {_FTS_SESSION_TOKEN.format(row="messages")} FROM messages
+"""
+
+_SEARCH_TERM_RE = re.compile(r"\w+")
+
+# Highlight markers that cannot occur in stored text; swapped for <mark> after escaping
+_MARK_OPEN, _MARK_CLOSE = "\x02", "\x03"
+
+
+async def fetch_value(db: aiosqlite.Connection, sql: str, params: tuple = ()) -> Any:
+    """First column of the first row (COUNT and PRAGMA queries always return one)"""
+    async with db.execute(sql, params) as cursor:
+        row = await cursor.fetchone()
+    return row[0] if row is not None else None
 
 
 async def init_db():
-    """Initialize the database schema"""
+    """Initialize the database schema (adding session columns to older databases)"""
     async with aiosqlite.connect(DB_PATH) as db:
+        # Lets retention hand freed pages back with incremental_vacuum
+        # (takes effect for new files; retention converts older ones once)
+        await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
         await db.execute('''
             CREATE TABLE IF NOT EXISTS messages (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL DEFAULT 'default',
                 role TEXT NOT NULL,
                 content TEXT NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                truncated INTEGER NOT NULL DEFAULT 0
             )
         ''')
+        async with db.execute("PRAGMA table_info(messages)") as cursor:
+            columns = {row[1] for row in await cursor.fetchall()}
+        if "session_id" not in columns:
+            await db.execute("ALTER TABLE messages ADD COLUMN session_id TEXT NOT NULL DEFAULT 'default'")
+        if "truncated" not in columns:
+            await db.execute("ALTER TABLE messages ADD COLUMN truncated INTEGER NOT NULL DEFAULT 0")
+        # Every read filters by session and orders by id
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id)")
+        
+        has_fts = await fetch_value(db, "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'")
+        trigger = await fetch_value(db, "SELECT sql FROM sqlite_master WHERE name = 'messages_fts_insert'")
+        current = bool(has_fts) and trigger is not None and "hex(new.session_id)" in trigger
+        if has_fts and not current:
+            # Older index stored raw (stemmed or unindexed) session ids; rebuilt below
+            for name in ("insert", "delete", "update"):
+                await db.execute(f"DROP TRIGGER IF EXISTS messages_fts_{name}")
+            await db.execute("DROP TABLE messages_fts")
+        for statement in _FTS_SCHEMA + _SOURCES_SCHEMA:
+            await db.execute(statement)
+        if not current:
+            # Index messages stored before full-text search (or this layout) existed
+            await db.execute(_FTS_POPULATE)
         await db.commit()
 
 
-async def add_message(role: str, content: str):
-    """Add a message to the chat history"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT INTO messages (role, content) VALUES (?, ?)",
-            (role, content)
-        )
-        await db.commit()
+async def check_db() -> bool:
+    """
+    Integrity-check an existing database (PRAGMA quick_check).
+    A corrupt file is moved aside (chat_history.db.corrupt-<time>) so
+    init_db starts a fresh one. Returns True if the file was kept.
+    """
+    if not DB_PATH.exists():
+        return True
+    try:
+        async with aiosqlite.connect(DB_PATH) as db:
+            result = await fetch_value(db, "PRAGMA quick_check")
+    except aiosqlite.DatabaseError as e:
+        result = str(e)
+    if result == "ok":
+        return True
+    quarantined = DB_PATH.with_name(f"{DB_PATH.name}.corrupt-{int(time.time())}")
+    DB_PATH.replace(quarantined)
+    logger.error("database_corrupt", result=result, moved_to=str(quarantined))
+    return False
+
+
+class MessageWriter:
+    """
+    Write-behind queue for message inserts.
+    
+    One background task per event loop drains the queue; flushes are
+    serialized by a lock, so rows reach SQLite in the order they were
+    queued. A failed or interrupted batch stays at the head of the queue
+    and is retried. close() stops the task between flushes rather than
+    cancelling it, so a batch being written at shutdown is not lost.
+    """
+    
+    def __init__(self, flush_ms: Optional[float] = None, batch_size: Optional[int] = None):
+        self.flush_seconds = (settings.MESSAGE_FLUSH_MS if flush_ms is None else flush_ms) / 1000
+        self.batch_size = batch_size or settings.MESSAGE_BATCH_SIZE
+        self._pending: List[tuple] = []  # (session_id, role, content, truncated, sources)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+    
+    def _bind(self) -> None:
+        """(Re)create loop-bound primitives and start the task on the running loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._has_items = asyncio.Event()
+            self._full = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = None
+        if self._task is None or self._task.done():
+            self._closing = False
+            self._task = loop.create_task(self._run(), name="message-writer")
+    
+    def add(
+        self,
+        role: str,
+        content: str,
+        session_id: str = DEFAULT_SESSION,
+        truncated: bool = False,
+        sources: Optional[list] = None,
+    ) -> None:
+        """Queue a message (and its sources); it is written within flush_seconds"""
+        self._bind()
+        self._pending.append((session_id, role, content, int(truncated), sources))
+        self._has_items.set()
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+    
+    async def _run(self) -> None:
+        while not self._closing:
+            await self._has_items.wait()
+            if not self._full.is_set() and not self._closing:
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=self.flush_seconds)
+                except asyncio.TimeoutError:
+                    pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning("message_flush_failed", error=str(e), queued=len(self._pending))
+                await asyncio.sleep(self.flush_seconds)
+    
+    async def flush(self) -> int:
+        """Write everything queued so far in one transaction; returns rows written"""
+        flushing = self._loop is not None and self._lock.locked()
+        if not self._pending and not flushing:
+            return 0
+        self._bind()
+        # Waiting for the lock also waits for a batch another caller is writing
+        async with self._lock:
+            batch, self._pending = self._pending, []
+            self._has_items.clear()
+            self._full.clear()
+            if not batch:
+                return 0
+            committed = False
+            try:
+                with DB_WRITE_SECONDS.time(operation="flush_messages"):
+                    async with aiosqlite.connect(DB_PATH) as db:
+                        for *row, sources in batch:
+                            await _insert_message(db, row, sources)
+                        await db.commit()
+                        committed = True
+            finally:
+                if not committed:
+                    # Failed or cancelled (e.g. the flushing request went
+                    # away): the batch goes back in front of newer rows
+                    self._pending[:0] = batch
+                    self._has_items.set()
+            return len(batch)
+    
+    async def close(self) -> None:
+        """Flush remaining messages and stop the background task (shutdown)"""
+        if self._task is not None and self._loop is asyncio.get_running_loop():
+            # Wake the task and let it finish its current flush, then exit
+            self._closing = True
+            self._has_items.set()
+            self._full.set()
+            await self._task
+            self._task = None
+        await self.flush()
+    
+    def __len__(self) -> int:
+        return len(self._pending)
+
+
+message_writer = MessageWriter()
+
+
+async def _insert_message(db: aiosqlite.Connection, row: Sequence, sources: Optional[list]) -> None:
+    """Insert one message row and its sources (caller commits)"""
+    cursor = await db.execute(_INSERT_MESSAGE, row)
+    if sources:
+        await db.executemany(_INSERT_SOURCE, [
+            (cursor.lastrowid, position, source.get("chunk_id"), source.get("page"),
+             source.get("score"), source.get("preview"))
+            for position, source in enumerate(sources)
+        ])
+
+
+async def add_message(
+    role: str,
+    content: str,
+    session_id: str = DEFAULT_SESSION,
+    truncated: bool = False,
+    sources: Optional[list] = None,
+):
+    """
+    Add a message to a session's chat history.
+    
+    Args:
+        truncated: The answer was cut off (disconnect or LLM error)
+        sources: Retrieved chunks the answer used (dicts with chunk_id,
+            page, score, preview), stored in the same transaction
+    
+    With MESSAGE_WRITE_BEHIND the message is queued and this returns without disk I/O.
+    """
+    if settings.MESSAGE_WRITE_BEHIND:
+        message_writer.add(role, content, session_id, truncated, sources)
+        return
+    with DB_WRITE_SECONDS.time(operation="add_message"):
+        async with aiosqlite.connect(DB_PATH) as db:
+            await _insert_message(db, (session_id, role, content, int(truncated)), sources)
+            await db.commit()
+
+
+def _message(row, **extra) -> dict:
+    """Message dict for a row; only truncated answers carry the flag"""
+    message = {"role": row["role"], "content": row["content"], **extra}
+    if row["truncated"]:
+        message["truncated"] = True
+    return message
+
+
+def _group_messages(rows, with_timestamp: bool = False) -> list[dict]:
+    """
+    Fold joined message/source rows (ordered by message) into message dicts.
+    Answers with stored sources get a "sources" list.
+    """
+    messages = []
+    last_id = None
+    for row in rows:
+        if row["id"] != last_id:
+            extra = {"timestamp": row["timestamp"]} if with_timestamp else {}
+            messages.append(_message(row, **extra))
+            last_id = row["id"]
+        if row["page"] is not None or row["chunk_id"] is not None:
+            messages[-1].setdefault("sources", []).append({
+                "page": row["page"],
+                "preview": row["preview"],
+                "chunk_id": row["chunk_id"],
+                "score": row["score"],
+            })
+    return messages
 
 
-async def get_history_paginated(limit: int = 50, offset: int = 0) -> dict:
+async def get_history_paginated(limit: int = 50, offset: int = 0, session_id: str = DEFAULT_SESSION) -> dict:
     """
-    Retrieve paginated messages ordered by timestamp.
+    Retrieve a session's paginated messages, newest page first.
     
     Args:
         limit: Maximum number of messages to return (default 50, max 100)
         offset: Number of messages to skip (for pagination)
+        session_id: Session whose messages to return
     
     Returns:
         Dictionary with:
@@ -47,26 +375,25 @@ async def get_history_paginated(limit: int = 50, offset: int = 0) -> dict:
             - offset: Offset used
             - has_more: Boolean indicating if more messages exist
     """
+    await message_writer.flush()
     async with aiosqlite.connect(DB_PATH) as db:
         db.row_factory = aiosqlite.Row
         
         # Get total count
-        async with db.execute("SELECT COUNT(*) as count FROM messages") as cursor:
-            total = (await cursor.fetchone())["count"]
+        total = await fetch_value(db, "SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,))
         
-        # Get paginated results (ORDER BY timestamp DESC for newest first)
+        # Get paginated results (id DESC for newest first; ids follow insertion order)
+        page = (
+            "(SELECT * FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ? OFFSET ?)"
+        )
         async with db.execute(
-            "SELECT role, content, timestamp FROM messages ORDER BY timestamp DESC LIMIT ? OFFSET ?",
-            (limit, offset)
+            _MESSAGES_WITH_SOURCES.format(messages=page) + " ORDER BY m.id, s.position",
+            (session_id, limit, offset)
         ) as cursor:
             rows = await cursor.fetchall()
-            messages = [
-                {"role": row["role"], "content": row["content"], "timestamp": row["timestamp"]}
-                for row in rows
-            ]
         
-        # Reverse to get chronological order (oldest first)
-        messages_chrono = list(reversed(messages))
+        # Chronological order (oldest first) within the newest-first page
+        messages_chrono = _group_messages(rows, with_timestamp=True)
         
         return {
             "messages": messages_chrono,
@@ -77,22 +404,128 @@ async def get_history_paginated(limit: int = 50, offset: int = 0) -> dict:
         }
 
 
-async def get_history() -> list[dict]:
-    """Retrieve all messages ordered by timestamp"""
+async def get_history(session_id: str = DEFAULT_SESSION) -> list[dict]:
+    """Retrieve all of a session's messages in order"""
+    await message_writer.flush()
+    async with aiosqlite.connect(DB_PATH) as db:
+        db.row_factory = aiosqlite.Row
+        async with db.execute(
+            _MESSAGES_WITH_SOURCES.format(messages="messages") + " WHERE m.session_id = ? ORDER BY m.id, s.position",
+            (session_id,)
+        ) as cursor:
+            return _group_messages(await cursor.fetchall())
+
+
+async def get_recent_messages(limit: int, session_id: str = DEFAULT_SESSION) -> list[dict]:
+    """Retrieve a session's newest `limit` messages in chronological order"""
+    await message_writer.flush()
     async with aiosqlite.connect(DB_PATH) as db:
         db.row_factory = aiosqlite.Row
         async with db.execute(
-            "SELECT role, content FROM messages ORDER BY timestamp ASC"
+            "SELECT role, content FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (session_id, limit)
         ) as cursor:
             rows = await cursor.fetchall()
-            return [{"role": row["role"], "content": row["content"]} for row in rows]
+            return [{"role": row["role"], "content": row["content"]} for row in reversed(list(rows))]
+
+
+def _session_token(session_id: str) -> str:
+    """The token a session's messages carry in messages_fts (_FTS_SESSION_TOKEN)"""
+    return session_id.encode().hex().upper() + "x"
+
+
+def _fts_query(text: str, session_id: str = DEFAULT_SESSION) -> Optional[str]:
+    """
+    FTS5 MATCH expression for free text in one session: every word must
+    occur (stemmed) in the content of a message carrying the session's
+    token. Words are quoted, so FTS5 operators and punctuation in user
+    input are taken literally. None if there are no words.
+    """
+    terms = _SEARCH_TERM_RE.findall(text)
+    if not terms:
+        return None
+    words = " ".join(f'"{term}"' for term in terms)
+    return f'session_id : "{_session_token(session_id)}" AND content : ({words})'
 
 
-async def clear_messages():
-    """Delete all messages from history"""
+def _highlight(snippet: str) -> str:
+    """HTML-escape a snippet and mark the matched terms with <mark>"""
+    return html.escape(snippet).replace(_MARK_OPEN, "<mark>").replace(_MARK_CLOSE, "</mark>")
+
+
+async def search_messages(
+    query: str,
+    session_id: str = DEFAULT_SESSION,
+    limit: int = 20,
+    offset: int = 0,
+) -> dict:
+    """
+    Full-text search over a session's messages, best match first (BM25).
+    
+    Returns:
+        Dictionary with:
+            - results: List of dicts with id, role, content, snippet (HTML,
+              matches wrapped in <mark>), timestamp and score (lower is better)
+            - total: Number of matching messages
+            - limit, offset, has_more: As for get_history_paginated
+    
+    Raises:
+        ValueError: If the query has no searchable words
+    """
+    match = _fts_query(query, session_id)
+    if match is None:
+        raise ValueError("Search query must contain at least one word.")
+    await message_writer.flush()
     async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("DELETE FROM messages")
-        await db.commit()
+        db.row_factory = aiosqlite.Row
+        # MATCH walks only this session's postings (see _FTS_SCHEMA)
+        total = await fetch_value(db, "SELECT COUNT(*) FROM messages_fts WHERE messages_fts MATCH ?", (match,))
+        
+        # bm25 weights: content only (every hit has the session token once)
+        async with db.execute(
+            """
+            SELECT m.id, m.role, m.content, m.timestamp, m.truncated,
+                   snippet(messages_fts, 0, ?, ?, '…', 16) AS snippet,
+                   bm25(messages_fts, 1.0, 0.0) AS score
+            FROM messages_fts
+            JOIN messages m ON m.id = messages_fts.rowid
+            WHERE messages_fts MATCH ?
+            ORDER BY score, m.id DESC
+            LIMIT ? OFFSET ?
+            """,
+            (_MARK_OPEN, _MARK_CLOSE, match, limit, offset)
+        ) as cursor:
+            rows = await cursor.fetchall()
+    
+    results = [
+        _message(
+            row,
+            id=row["id"],
+            snippet=_highlight(row["snippet"]),
+            timestamp=row["timestamp"],
+            score=round(row["score"], 4),
+        )
+        for row in rows
+    ]
+    return {
+        "results": results,
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+        "has_more": offset + limit < total,
+    }
+
+
+async def clear_messages(session_id: str | None = None):
+    """Delete a session's messages, or all messages if no session is given"""
+    await message_writer.flush()  # Queued messages were added before the clear
+    with DB_WRITE_SECONDS.time(operation="clear_messages"):
+        async with aiosqlite.connect(DB_PATH) as db:
+            if session_id is None:
+                await db.execute("DELETE FROM messages")
+            else:
+                await db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            await db.commit()
 
 
 async def delete_db():
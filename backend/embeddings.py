@@ -0,0 +1,241 @@
+"""
+Embedding Provider Registry
+Selects the embeddings backend from config so ingestion and retrieval are
+not tied to the Gemini API.
+
+Providers:
+    google: Gemini embeddings via langchain-google-genai (remote, quota-bound)
+    local:  Feature-hashed word n-grams computed on CPU (no network)
+"""
+
+import re
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config import settings
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Known output sizes for remote models; anything else is probed once
+GOOGLE_MODEL_DIMENSIONS = {
+    "models/text-embedding-004": 768,
+    "models/embedding-001": 768,
+}
+
+# Input limits (tokens) of remote models; longer texts are truncated by the API
+GOOGLE_MODEL_MAX_TOKENS = {
+    "models/text-embedding-004": 2048,
+    "models/embedding-001": 2048,
+}
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Hashed grams kept by _signed_code; bounded so a long-running process
+# does not hold every word pair it has ever seen
+FEATURE_CACHE_SIZE = 1 << 16
+
+
+@lru_cache(maxsize=FEATURE_CACHE_SIZE)
+def _signed_code(gram: str, dimension: int) -> int:
+    """Bucket + 1 for a gram, negated for a -1 sign"""
+    digest = zlib.crc32(gram.encode("utf-8"))
+    code = digest % dimension + 1
+    return -code if (digest >> 31) & 1 else code
+
+
+def l2_normalize(matrix: np.ndarray) -> np.ndarray:
+    """Scale rows of a float32 matrix to unit length in place (zero rows unchanged)"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    CPU-local embeddings from signed feature hashing of word uni/bi-grams.
+
+    Deterministic across processes (CRC32, not Python's salted hash), so
+    cached indexes stay valid. Texts are embedded in batches: each batch is
+    scattered into one matrix with a single NumPy call and normalized in
+    place, and batches are spread over a thread pool.
+    """
+
+    def __init__(self, dimension: int = 768, batch_size: int = 256, max_workers: int = 4):
+        self.dimension = dimension
+        self.batch_size = batch_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embed")
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        grams: List[str] = []
+        lengths: List[int] = []
+        for text in texts:
+            words = _TOKEN_RE.findall(text.lower())
+            grams.extend(words)
+            grams.extend([f"{a} {b}" for a, b in zip(words, words[1:])])
+            lengths.append(2 * len(words) - 1 if words else 0)
+
+        dimension = self.dimension
+        codes = np.fromiter(
+            (_signed_code(gram, dimension) for gram in grams),
+            dtype=np.int64,
+            count=len(grams),
+        )
+        rows = np.repeat(np.arange(len(texts)), lengths)
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        np.add.at(matrix, (rows, np.abs(codes) - 1), np.sign(codes).astype(np.float32))
+        # Sublinear term frequency, then unit length
+        np.copysign(np.log1p(np.abs(matrix)), matrix, out=matrix)
+        return l2_normalize(matrix)
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into a float32 matrix of shape (len(texts), dimension)"""
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1:
+            return self._embed_batch(batches[0])
+        return np.vstack(list(self._executor.map(self._embed_batch, batches)))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors: List[List[float]] = self.embed_array(texts).tolist()
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        vector: List[float] = self._embed_batch([text])[0].tolist()
+        return vector
+
+
+class NormalizedEmbeddings(Embeddings):
+    """
+    Wraps another provider and returns unit-length vectors, so inner product
+    equals cosine similarity. Used for INDEX_METRIC=cosine.
+    """
+
+    def __init__(self, inner: Embeddings):
+        self.inner = inner
+        self.dimension = getattr(inner, "dimension", None)
+        self.model = getattr(inner, "model", None)
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """Embed and normalize texts into a float32 matrix"""
+        if hasattr(self.inner, "embed_array"):
+            matrix = np.array(self.inner.embed_array(texts), dtype=np.float32)
+        else:
+            matrix = np.asarray(self.inner.embed_documents(texts), dtype=np.float32)
+        return l2_normalize(matrix.reshape(len(texts), -1))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors: List[List[float]] = self.embed_array(texts).tolist()
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        matrix = np.asarray([self.inner.embed_query(text)], dtype=np.float32)
+        vector: List[float] = l2_normalize(matrix)[0].tolist()
+        return vector
+
+
+def normalized(embeddings: Embeddings) -> Embeddings:
+    """Wrap embeddings so they return unit-length vectors (idempotent)"""
+    if isinstance(embeddings, NormalizedEmbeddings):
+        return embeddings
+    return NormalizedEmbeddings(embeddings)
+
+
+def _google_embeddings() -> Embeddings:
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    return GoogleGenerativeAIEmbeddings(
+        model=settings.EMBEDDING_MODEL,
+        google_api_key=settings.GOOGLE_API_KEY
+    )
+
+
+def _local_embeddings() -> Embeddings:
+    return HashingEmbeddings(
+        dimension=settings.EMBEDDING_DIMENSION,
+        batch_size=settings.EMBEDDING_BATCH_SIZE,
+        max_workers=settings.EMBEDDING_WORKERS,
+    )
+
+
+# Registry of provider name -> factory
+EMBEDDING_PROVIDERS: Dict[str, Callable[[], Embeddings]] = {
+    "google": _google_embeddings,
+    "local": _local_embeddings,
+}
+
+_instances: Dict[str, Embeddings] = {}
+_instances_lock = threading.Lock()
+
+
+def register_embedding_provider(name: str, factory: Callable[[], Embeddings]) -> None:
+    """Register an additional embeddings backend under `name`"""
+    EMBEDDING_PROVIDERS[name] = factory
+
+
+def get_embeddings(provider: str | None = None) -> Embeddings:
+    """
+    Get the shared embeddings instance for a provider.
+
+    Args:
+        provider: Provider name; defaults to EMBEDDING_PROVIDER from config
+
+    Returns:
+        LangChain Embeddings instance (created once per provider)
+
+    Raises:
+        ValueError: If the provider is not registered
+    """
+    name = provider or settings.EMBEDDING_PROVIDER
+    if name not in EMBEDDING_PROVIDERS:
+        raise ValueError(
+            f"Unknown embedding provider '{name}'. "
+            f"Available: {', '.join(sorted(EMBEDDING_PROVIDERS))}"
+        )
+    with _instances_lock:
+        if name not in _instances:
+            _instances[name] = EMBEDDING_PROVIDERS[name]()
+            logger.info("embedding_provider_initialized", provider=name)
+        return _instances[name]
+
+
+def get_embedding_dimension(embeddings: Embeddings) -> int:
+    """
+    Output dimension of an embeddings instance.
+    Uses the provider's declared size when known, otherwise embeds a probe.
+    """
+    dimension = getattr(embeddings, "dimension", None)
+    if dimension:
+        return int(dimension)
+    model = getattr(embeddings, "model", None)
+    if model in GOOGLE_MODEL_DIMENSIONS:
+        return GOOGLE_MODEL_DIMENSIONS[model]
+    return len(embeddings.embed_query("dimension probe"))
+
+
+def get_embedding_token_limit(provider: str | None = None) -> int | None:
+    """Max input tokens per text for a provider, or None if unbounded (local)"""
+    name = provider or settings.EMBEDDING_PROVIDER
+    if name == "google":
+        return GOOGLE_MODEL_MAX_TOKENS.get(settings.EMBEDDING_MODEL)
+    return None
+
+
+def embedding_signature(provider: str | None = None) -> str:
+    """
+    Identify the vector space of a provider (provider, model, dimension).
+    Indexes built under different signatures are not interchangeable.
+    """
+    name = provider or settings.EMBEDDING_PROVIDER
+    if name == "google":
+        model = settings.EMBEDDING_MODEL.split("/")[-1]
+        return f"google-{model}"
+    if name == "local":
+        return f"local-hash-{settings.EMBEDDING_DIMENSION}"
+    return name
@@ -0,0 +1,243 @@
+"""
+Resumable Chat Generations
+Decouples answer generation from the client connection.
+
+Each /chat request starts a Generation: a background task drives the
+frame generator to completion and appends every frame to a bounded ring
+buffer, whether or not anyone is listening. Clients read through
+subscriptions and can reconnect with the number of frames they already
+have (or the SSE Last-Event-ID), continuing where they left off instead
+of asking again and paying for a second LLM call.
+
+Finished generations are dropped GENERATION_TTL_SECONDS after completion,
+by a timer, so an idle server releases their buffers too.
+A generation nobody reads is cancelled GENERATION_ABANDON_SECONDS after
+its last subscriber left (a disconnected client that does not come back),
+which stops the LLM stream instead of paying for an unread answer.
+"""
+
+import asyncio
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Optional, Tuple
+
+from config import settings
+from logging_config import get_logger
+from streaming import event_frame
+
+logger = get_logger(__name__)
+
+
+class Generation:
+    """
+    Frames of one answer, numbered from 1, with the newest `capacity` kept.
+    Frame n is buffered while n > total - len(frames).
+    """
+
+    def __init__(self, session_id: str, capacity: int, abandon_seconds: Optional[float] = None):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.frames: Deque[str] = deque(maxlen=capacity)
+        self.total = 0  # Frames produced so far (= number of the newest)
+        self.done = False
+        self.cancelled = False
+        self.finished_at: Optional[float] = None
+        self.subscribers = 0
+        self.abandon_seconds = (
+            settings.GENERATION_ABANDON_SECONDS if abandon_seconds is None else abandon_seconds
+        )
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._abandon_timer: Optional[asyncio.TimerHandle] = None
+        self._on_finish: Optional[Callable[[str, float], None]] = None  # (id, finished_at)
+
+    @property
+    def first_buffered(self) -> int:
+        """Number of the oldest frame still held"""
+        return self.total - len(self.frames) + 1
+
+    def can_resume(self, offset: int) -> bool:
+        """True if every frame after `offset` is still available"""
+        return 0 <= offset <= self.total and offset + 1 >= self.first_buffered
+
+    def _append(self, frame: str) -> None:
+        self.frames.append(frame)
+        self.total += 1
+        self._notify()
+
+    def _notify(self) -> None:
+        # Wake current waiters; later waiters wait on a fresh event
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _attach(self) -> None:
+        self.subscribers += 1
+        if self._abandon_timer is not None:
+            self._abandon_timer.cancel()
+            self._abandon_timer = None
+
+    def _detach(self) -> None:
+        self.subscribers -= 1
+        if self.subscribers == 0:
+            self._schedule_abandon()
+
+    def _schedule_abandon(self) -> None:
+        if not self.done and self._abandon_timer is None:
+            self._abandon_timer = asyncio.get_running_loop().call_later(
+                self.abandon_seconds, self._cancel_if_abandoned
+            )
+
+    def _cancel_if_abandoned(self) -> None:
+        self._abandon_timer = None
+        if self.subscribers == 0 and not self.done and self._task is not None:
+            logger.info("generation_abandoned", generation=self.id, frames=self.total)
+            self.cancelled = True
+            self._task.cancel()
+
+    async def _produce(self, source: AsyncIterator[str]) -> None:
+        """Background task: drain the frame source into the buffer"""
+        try:
+            async for frame in source:
+                self._append(frame)
+        except asyncio.CancelledError:
+            # Abandonment or shutdown; the source has already cleaned up
+            self._append(event_frame("error", "Generation cancelled."))
+        except Exception as e:
+            logger.exception("generation_failed", generation=self.id, error=str(e))
+            self._append(event_frame("error", "Generation failed. Please try again."))
+        finally:
+            finished_at = time.monotonic()
+            self.done = True
+            self.finished_at = finished_at
+            self._notify()
+            if self._on_finish is not None:
+                self._on_finish(self.id, finished_at)
+
+    async def subscribe(
+        self,
+        offset: int = 0,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        poll_seconds: Optional[float] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Yield frames after `offset`, following the generation until it ends.
+        A reader that falls behind the ring buffer gets an error frame.
+
+        With `is_disconnected` (e.g. Request.is_disconnected) the subscription
+        ends once the client is gone, checked at most every poll_seconds and
+        also while no frames arrive, so the abandon timer starts even when
+        the LLM is silent or the server drops writes to a closed socket.
+        """
+        poll = settings.DISCONNECT_POLL_SECONDS if poll_seconds is None else poll_seconds
+        last_check = time.monotonic()
+
+        async def gone() -> bool:
+            nonlocal last_check
+            if is_disconnected is None or time.monotonic() - last_check < poll:
+                return False
+            last_check = time.monotonic()
+            return await is_disconnected()
+
+        self._attach()
+        try:
+            while True:
+                while offset < self.total:
+                    if offset + 1 < self.first_buffered:
+                        yield event_frame("error", "Stream fell too far behind to resume.")
+                        return
+                    frame = self.frames[offset + 1 - self.first_buffered]
+                    offset += 1
+                    yield frame
+                    if await gone():
+                        return
+                if self.done:
+                    return
+                if is_disconnected is None:
+                    await self._changed.wait()
+                    continue
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=poll)
+                except asyncio.TimeoutError:
+                    pass
+                if await gone():
+                    return
+        finally:
+            self._detach()
+
+
+class GenerationRegistry:
+    """Live and recently finished generations by id"""
+
+    def __init__(
+        self,
+        capacity: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        abandon_seconds: Optional[float] = None,
+    ):
+        self.capacity = capacity or settings.GENERATION_BUFFER_FRAMES
+        self.ttl_seconds = settings.GENERATION_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.abandon_seconds = abandon_seconds
+        self._generations: "OrderedDict[str, Generation]" = OrderedDict()
+        # (finished_at, id) in completion order, so expiry pops from the front
+        self._finished: Deque[Tuple[float, str]] = deque()
+        self._sweep_timer: Optional[asyncio.TimerHandle] = None
+
+    def start(self, session_id: str, source: AsyncIterator[str]) -> Generation:
+        """Begin producing `source` in the background"""
+        self.sweep()
+        generation = Generation(session_id, self.capacity, self.abandon_seconds)
+        generation._on_finish = self._finished_generation
+        generation._task = asyncio.create_task(generation._produce(source), name=f"generation-{generation.id}")
+        # Covers clients that disconnect before their response starts reading
+        generation._schedule_abandon()
+        self._generations[generation.id] = generation
+        return generation
+
+    def get(self, generation_id: str) -> Optional[Generation]:
+        """A generation that is running or within its TTL"""
+        self.sweep()
+        return self._generations.get(generation_id)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Drop generations finished more than the TTL ago; returns how many"""
+        now = time.monotonic() if now is None else now
+        expired = 0
+        while self._finished and now - self._finished[0][0] >= self.ttl_seconds:
+            _, generation_id = self._finished.popleft()
+            self._generations.pop(generation_id, None)
+            expired += 1
+        return expired
+
+    def _finished_generation(self, generation_id: str, finished_at: float) -> None:
+        self._finished.append((finished_at, generation_id))
+        self._schedule_sweep()
+
+    def _schedule_sweep(self) -> None:
+        """Arm one timer for the oldest finished generation's expiry"""
+        if self._sweep_timer is None and self._finished:
+            delay = max(0.0, self._finished[0][0] + self.ttl_seconds - time.monotonic())
+            self._sweep_timer = asyncio.get_running_loop().call_later(delay, self._sweep_due)
+
+    def _sweep_due(self) -> None:
+        self._sweep_timer = None
+        self.sweep()
+        self._schedule_sweep()
+
+    async def cancel_all(self) -> int:
+        """Cancel running generations and wait for them to clean up (shutdown); returns how many"""
+        running = []
+        for generation in self._generations.values():
+            if not generation.done and generation._task is not None:
+                generation.cancelled = True
+                generation._task.cancel()
+                running.append(generation._task)
+        await asyncio.gather(*running, return_exceptions=True)
+        return len(running)
+
+    def __len__(self) -> int:
+        return len(self._generations)
+
+
+# Singleton instance
+generations = GenerationRegistry()
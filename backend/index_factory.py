@@ -0,0 +1,370 @@
+"""
+FAISS Index Factory (Tier 4)
+Builds FAISS indexes by type, including compressed variants for large corpora.
+
+Index types:
+    flat:  Exact brute-force search, 4 bytes per dimension
+    ivf:   Inverted lists over full vectors; faster search, same memory
+    sq8:   8-bit scalar quantization, ~4x smaller, near-exact recall
+    ivfpq: Inverted lists + product quantization, ~16x smaller
+    hnsw:  Graph index; sub-millisecond queries and incremental adds
+           without retraining, at the cost of extra memory for the graph
+
+Metrics (INDEX_METRIC):
+    cosine: Vectors are L2-normalized once and searched by inner product, so
+            scores are cosine similarities in [-1, 1] (higher is closer)
+    l2:     Euclidean distance over raw vectors (lower is closer)
+
+With INDEX_RESCORE enabled, compressed indexes are wrapped in
+IndexRefineFlat: candidates are re-ranked against the exact vectors. This
+restores recall but keeps the full vectors in memory.
+"""
+
+from typing import Any, Optional
+
+import numpy as np
+
+from config import settings
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+INDEX_TYPES = ("flat", "ivf", "sq8", "ivfpq", "hnsw")
+INDEX_METRICS = ("cosine", "l2")
+COMPRESSED_INDEX_TYPES = {"sq8", "ivfpq"}
+
+# Auto-selection thresholds (number of vectors)
+FLAT_MAX_VECTORS = 1_000
+SQ8_MAX_VECTORS = 10_000
+HNSW_MAX_VECTORS = 1_000_000
+
+# k-means needs ~39 points per centroid to train without degenerate clusters
+MIN_POINTS_PER_CENTROID = 39
+PQ_CENTROIDS = 256  # 8-bit codes
+PRECOMPUTED_TABLE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def select_index_type(num_vectors: int) -> str:
+    """
+    Choose an index type from corpus size.
+
+    Small corpora stay exact; up to 10k use SQ8 (4x smaller, training is
+    just a min/max pass); up to 1M use HNSW, where brute force becomes too
+    slow per query; beyond that IVF-PQ (~16x smaller) keeps memory bounded.
+    """
+    if num_vectors < FLAT_MAX_VECTORS:
+        return "flat"
+    if num_vectors < SQ8_MAX_VECTORS:
+        return "sq8"
+    if num_vectors < HNSW_MAX_VECTORS:
+        return "hnsw"
+    return "ivfpq"
+
+
+def resolve_index_type(index_type: Optional[str], num_vectors: int) -> str:
+    """Resolve 'auto' / None to a concrete type and validate explicit ones"""
+    kind = (index_type or settings.INDEX_TYPE).lower()
+    if kind == "auto":
+        return select_index_type(num_vectors)
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{kind}'. Available: auto, {', '.join(INDEX_TYPES)}")
+    return kind
+
+
+def resolve_metric(metric: Optional[str] = None) -> str:
+    """Validate a metric name, defaulting to INDEX_METRIC"""
+    name = (metric or settings.INDEX_METRIC).lower()
+    if name not in INDEX_METRICS:
+        raise ValueError(f"Unknown index metric '{name}'. Available: {', '.join(INDEX_METRICS)}")
+    return name
+
+
+def index_metric(index) -> str:
+    """Metric an existing index was built with ('cosine' for inner product)"""
+    import faiss
+    return "cosine" if index.metric_type == faiss.METRIC_INNER_PRODUCT else "l2"
+
+
+def _training_points(num_vectors: int) -> int:
+    """Vectors k-means actually sees: the corpus, capped at INDEX_TRAIN_SAMPLE"""
+    return min(num_vectors, settings.INDEX_TRAIN_SAMPLE)
+
+
+def _ivf_nlist(num_vectors: int) -> int:
+    """Number of inverted lists: ~4*sqrt(N), bounded so the training sample covers each list"""
+    nlist = int(4 * num_vectors ** 0.5)
+    return max(1, min(nlist, _training_points(num_vectors) // MIN_POINTS_PER_CENTROID))
+
+
+def _pq_subquantizers(dimension: int) -> int:
+    """Largest divisor of dimension giving at most dimension/4 bytes per code (>= 16x)"""
+    for m in range(max(1, dimension // 4), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def _faiss_metric(metric: str) -> int:
+    import faiss
+    return faiss.METRIC_INNER_PRODUCT if metric == "cosine" else faiss.METRIC_L2
+
+
+def create_index(
+    index_type: str,
+    dimension: int,
+    num_vectors: int,
+    rescore: Optional[bool] = None,
+    metric: Optional[str] = None,
+):
+    """
+    Create an empty (untrained) FAISS index sized for `num_vectors`.
+
+    Args:
+        index_type: One of INDEX_TYPES
+        dimension: Vector dimension
+        num_vectors: Expected corpus size (sizes IVF lists, gates PQ)
+        rescore: Wrap compressed indexes in an exact re-ranking stage
+                 (defaults to INDEX_RESCORE)
+        metric: One of INDEX_METRICS (defaults to INDEX_METRIC)
+
+    Returns:
+        Tuple of (faiss index, index type actually created)
+    """
+    import faiss
+
+    rescore = settings.INDEX_RESCORE if rescore is None else rescore
+    faiss_metric = _faiss_metric(resolve_metric(metric))
+
+    # Product quantization needs enough points to train 256 centroids per sub-space
+    if index_type == "ivfpq" and _training_points(num_vectors) < PQ_CENTROIDS * MIN_POINTS_PER_CENTROID:
+        logger.warning("faiss_ivfpq_too_small", vectors=num_vectors, fallback="sq8")
+        index_type = "sq8"
+    if index_type == "ivf" and num_vectors < MIN_POINTS_PER_CENTROID:
+        index_type = "flat"
+
+    index: Any
+    if index_type == "flat":
+        index = faiss.IndexFlat(dimension, faiss_metric)
+    elif index_type == "sq8":
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss_metric)
+    elif index_type == "ivf":
+        nlist = _ivf_nlist(num_vectors)
+        quantizer = faiss.IndexFlat(dimension, faiss_metric)
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss_metric)
+    elif index_type == "ivfpq":
+        nlist = _ivf_nlist(num_vectors)
+        m = _pq_subquantizers(dimension)
+        quantizer = faiss.IndexFlat(dimension, faiss_metric)
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, m, 8, faiss_metric)
+        if nlist * m * PQ_CENTROIDS * 4 > PRECOMPUTED_TABLE_MAX_BYTES:
+            index.use_precomputed_table = -1
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, settings.INDEX_HNSW_M, faiss_metric)
+        index.hnsw.efConstruction = settings.INDEX_HNSW_EF_CONSTRUCTION
+    else:
+        raise ValueError(f"Unknown index type '{index_type}'")
+
+    if rescore and index_type in COMPRESSED_INDEX_TYPES:
+        index = faiss.IndexRefineFlat(index)
+        index.k_factor = settings.INDEX_RESCORE_FACTOR
+    return index, index_type
+
+
+def _train(index, index_type: str, vectors: np.ndarray) -> None:
+    if not index.is_trained:
+        sample = _training_sample(vectors, settings.INDEX_TRAIN_SAMPLE)
+        logger.info("faiss_training", index_type=index_type, vectors=len(sample))
+        index.train(sample)
+
+
+def _log_built(index, index_type: Optional[str]) -> None:
+    logger.info(
+        "faiss_index_built",
+        index_type=index_type,
+        metric=index_metric(index),
+        vectors=index.ntotal,
+        dimension=index.d,
+        memory_bytes=index_memory_bytes(index),
+    )
+
+
+def build_index(
+    index_type: str,
+    vectors: np.ndarray,
+    rescore: Optional[bool] = None,
+    metric: Optional[str] = None,
+):
+    """
+    Create, train and fill a FAISS index.
+
+    Args:
+        index_type: One of INDEX_TYPES
+        vectors: float32 matrix of shape (N, dimension); normalized in
+                 place for the cosine metric
+        rescore: Wrap compressed indexes in an exact re-ranking stage
+                 (defaults to INDEX_RESCORE)
+        metric: One of INDEX_METRICS (defaults to INDEX_METRIC)
+
+    Returns:
+        Tuple of (faiss index, index type actually built)
+    """
+    from embeddings import l2_normalize
+
+    metric = resolve_metric(metric)
+    if metric == "cosine":
+        l2_normalize(vectors)
+    num_vectors, dimension = vectors.shape
+    index, index_type = create_index(index_type, dimension, num_vectors, rescore, metric)
+    _train(index, index_type, vectors)
+    index.add(vectors)
+    configure_search(index)
+    _log_built(index, index_type)
+    return index, index_type
+
+
+class IndexBuilder:
+    """
+    Builds an index from a stream of vector batches without holding the
+    whole corpus in memory.
+
+    The index type is chosen from the caller's running estimate of the
+    final corpus size. Untrained types (flat, HNSW) are filled as batches
+    arrive. Trained types (IVF, SQ8, PQ) buffer batches until they have a
+    training sample (at most INDEX_TRAIN_SAMPLE vectors), train on it, and
+    then add later batches directly. Peak memory is therefore bounded by
+    the training sample, not by the document size.
+    """
+
+    def __init__(self, index_type: Optional[str] = None, metric: Optional[str] = None,
+                 rescore: Optional[bool] = None):
+        self.index_type = index_type
+        self.metric = resolve_metric(metric)
+        self.rescore = rescore
+        self.index: Any = None
+        self._kind: Optional[str] = None
+        self._pending: list[np.ndarray] = []
+        self._pending_count = 0
+
+    @property
+    def ntotal(self) -> int:
+        """Vectors received so far (added or buffered)"""
+        return (self.index.ntotal if self.index is not None else 0) + self._pending_count
+
+    def add(self, vectors: np.ndarray, expected_total: int) -> None:
+        """
+        Add a float32 batch (normalized in place for the cosine metric).
+
+        Args:
+            vectors: Batch of shape (n, dimension)
+            expected_total: Current estimate of the final number of vectors
+        """
+        from embeddings import l2_normalize
+
+        if not len(vectors):
+            return
+        if self.metric == "cosine":
+            l2_normalize(vectors)
+        if self.index is not None:
+            self.index.add(vectors)
+            return
+
+        expected_total = max(expected_total, self.ntotal + len(vectors))
+        if self._kind is None:
+            self._kind = resolve_index_type(self.index_type, expected_total)
+        self._pending.append(vectors)
+        self._pending_count += len(vectors)
+
+        needs_training = self._kind not in ("flat", "hnsw")
+        if not needs_training or self._pending_count >= min(settings.INDEX_TRAIN_SAMPLE, expected_total):
+            self._flush(self._kind, expected_total)
+
+    def _flush(self, kind: str, num_vectors: int) -> None:
+        vectors = np.concatenate(self._pending) if len(self._pending) > 1 else self._pending[0]
+        self._pending, self._pending_count = [], 0
+        self.index, self._kind = create_index(
+            kind, vectors.shape[1], num_vectors, self.rescore, self.metric
+        )
+        _train(self.index, self._kind, vectors)
+        self.index.add(vectors)
+
+    def finish(self):
+        """
+        Finalize the index.
+
+        Returns:
+            Tuple of (faiss index, index type), or (None, None) if no vectors
+            were added
+        """
+        if self.index is None:
+            if not self._pending_count:
+                return None, None
+            # Never reached the training threshold: size from the actual count
+            self._kind = resolve_index_type(self.index_type, self._pending_count)
+            self._flush(self._kind, self._pending_count)
+        configure_search(self.index)
+        _log_built(self.index, self._kind)
+        return self.index, self._kind
+
+
+def _training_sample(vectors: np.ndarray, max_points: int) -> np.ndarray:
+    """Deterministic random subset for training"""
+    if len(vectors) <= max_points:
+        return vectors
+    rng = np.random.default_rng(0)
+    return vectors[np.sort(rng.choice(len(vectors), max_points, replace=False))]
+
+
+def configure_search(index) -> None:
+    """Apply query-time parameters (nprobe, efSearch, rescore factor) to an index"""
+    import faiss
+
+    if faiss.try_extract_index_ivf(index) is not None:
+        faiss.ParameterSpace().set_index_parameter(index, "nprobe", settings.INDEX_NPROBE)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = settings.INDEX_HNSW_EF_SEARCH
+    if isinstance(index, faiss.IndexRefine):
+        index.k_factor = settings.INDEX_RESCORE_FACTOR
+
+
+def reconstruct_vectors(index) -> Optional[np.ndarray]:
+    """
+    Exact stored vectors of an uncompressed index (flat, IVF-flat, HNSW,
+    or a rescoring wrapper), in insertion order. None for lossy indexes.
+    """
+    import faiss
+
+    if isinstance(index, faiss.IndexRefine):
+        index = faiss.downcast_index(index.refine_index)
+    if isinstance(index, faiss.IndexIVFFlat):
+        index.make_direct_map()
+    elif not isinstance(index, (faiss.IndexFlat, faiss.IndexHNSWFlat)):
+        return None
+    return np.asarray(index.reconstruct_n(0, index.ntotal))
+
+
+def index_memory_bytes(index) -> int:
+    """
+    Approximate in-memory size of an index, computed from its parameters:
+    stored codes, inverted-list ids, HNSW links and codebooks. Cheap enough
+    to log after every build (serializing would copy the whole index).
+    """
+    import faiss
+
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexRefine):
+        return index_memory_bytes(index.base_index) + index_memory_bytes(index.refine_index)
+    if isinstance(index, faiss.IndexHNSW):
+        hnsw: Any = index.hnsw
+        links = hnsw.neighbors.size() * 4 + hnsw.offsets.size() * 8 + hnsw.levels.size() * 4
+        return int(links) + index_memory_bytes(index.storage)
+    if isinstance(index, faiss.IndexIVF):
+        size = index.ntotal * (index.code_size + 8)  # Codes and ids in the inverted lists
+        size += index_memory_bytes(index.quantizer)
+        if isinstance(index, faiss.IndexIVFPQ):
+            precomputed: Any = getattr(index, "precomputed_table")
+            size += (index.pq.centroids.size() + precomputed.size()) * 4
+        return int(size)
+    size = index.ntotal * index.code_size  # Flat and scalar-quantized codes
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        size += index.sq.trained.size() * 4
+    return int(size)
@@ -4,178 +4,357 @@ Handles document loading, chunking, and vector store creation
 Enhanced with document caching and FAISS optimization (Tier 4)
 """
 
+import queue
+import threading
 import time
+import uuid
+from typing import Iterable, Iterator
 
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import numpy as np
 
 # Import config for chunking/retry settings
 from config import (
     CHUNK_SIZE,
     CHUNK_OVERLAP,
+    CHUNK_UNIT,
+    CHUNK_SIZE_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
     INGESTION_BATCH_SIZE,
     INGESTION_MAX_RETRIES,
     INGESTION_BASE_DELAY,
+    INGESTION_PIPELINE_BATCH,
+    INGESTION_QUEUE_SIZE,
 )
 
+from text_splitter import FastTextSplitter
+from tokenizer import get_tokenizer
+
 # Import vector store abstraction
-from vector_store import vector_store
+from vector_store import vector_stores, wrap_index
+from sessions import DEFAULT_SESSION
+from index_factory import IndexBuilder, build_index, resolve_index_type, resolve_metric
 
 # Import structured logging
 from logging_config import get_logger
+from metrics import EMBEDDING_SECONDS, INGESTION_STAGE_SECONDS, INGESTION_CHUNKS, StageTimings
 
 logger = get_logger(__name__)
 
 
-def create_optimized_vectorstore(documents, embeddings, num_chunks: int):
+def create_splitter(unit: str | None = None) -> FastTextSplitter:
+    """
+    Chunk splitter for CHUNK_UNIT.
+    
+    "chars" splits by CHUNK_SIZE/CHUNK_OVERLAP characters; "tokens" by
+    CHUNK_SIZE_TOKENS/CHUNK_OVERLAP_TOKENS, capped at the embedding model's
+    input limit so no chunk is silently truncated. Either way each chunk
+    records metadata["token_count"] for context packing at query time.
+    """
+    unit = unit or CHUNK_UNIT
+    if unit == "chars":
+        return FastTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_token_count=True)
+    if unit != "tokens":
+        raise ValueError(f"Unknown CHUNK_UNIT '{unit}'. Available: chars, tokens")
+    
+    from embeddings import get_embedding_token_limit
+    
+    chunk_size = CHUNK_SIZE_TOKENS
+    limit = get_embedding_token_limit()
+    if limit is not None and chunk_size > limit:
+        logger.warning("chunk_size_capped", requested=chunk_size, limit=limit)
+        chunk_size = limit
+    return FastTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=min(CHUNK_OVERLAP_TOKENS, chunk_size),
+        tokenizer=get_tokenizer(),
+        add_token_count=True,
+    )
+
+
+def _embed_chunks(documents, embeddings) -> np.ndarray:
+    """Embed chunk texts into a float32 matrix, using the batch array path when available"""
+    texts = [doc.page_content for doc in documents]
+    with EMBEDDING_SECONDS.time(operation="documents"):
+        if hasattr(embeddings, "embed_array"):
+            return np.ascontiguousarray(embeddings.embed_array(texts), dtype=np.float32)
+        return np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+
+
+def _default_vectorstore(documents, embeddings):
+    """Plain LangChain-built flat index honouring INDEX_METRIC (fallback path)"""
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.vectorstores.utils import DistanceStrategy
+    from embeddings import normalized
+    
+    if resolve_metric() == "cosine":
+        return FAISS.from_documents(
+            documents, normalized(embeddings), distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+        )
+    return FAISS.from_documents(documents, embeddings)
+
+
+def create_optimized_vectorstore(documents, embeddings, num_chunks: int, index_type: str | None = None):
     """
     Create FAISS index optimized based on document size (Tier 4).
     
+    Chunks are embedded once; the vectors are normalized for the cosine
+    metric, then used both to train the index (IVF / PQ) and to fill it.
+    
     Args:
         documents: List of document chunks
         embeddings: Embeddings instance
-        num_chunks: Total number of chunks
+        num_chunks: Total number of chunks (drives automatic index selection)
+        index_type: Override INDEX_TYPE ("auto", "flat", "ivf", "sq8", "ivfpq", "hnsw")
     
     Returns:
         Optimized FAISS vectorstore
     """
-    from langchain_community.vectorstores import FAISS
-    
-    # For small documents (< 1000 chunks), use brute-force IndexFlatL2
-    # This is fastest for small datasets and requires no training
-    if num_chunks < 1000:
-        logger.info("faiss_optimization", strategy="brute-force", chunks=num_chunks)
-        return FAISS.from_documents(documents, embeddings)
-    
-    # For large documents (>= 1000 chunks), use IVF (Inverted File Index)
-    # This provides faster search at the cost of slightly reduced accuracy
-    logger.info("faiss_optimization", strategy="ivf", chunks=num_chunks)
+    kind = resolve_index_type(index_type, num_chunks)
+    logger.info("faiss_optimization", strategy=kind, chunks=num_chunks)
     
     try:
-        import faiss
-        import numpy as np
-        
-        # Calculate optimal number of clusters (nlist)
-        # Rule of thumb: sqrt(N) for IVF
-        nlist = int(num_chunks ** 0.5)
-        dimension = 768  # text-embedding-004 dimension
-        
-        logger.debug("faiss_ivf_config", nlist=nlist, dimension=dimension)
-        
-        # Create quantizer and IVF index
-        quantizer = faiss.IndexFlatL2(dimension)
-        index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
-        
-        # Generate embeddings for training (sample or all, depending on size)
-        logger.info("faiss_ivf_training", message="Training IVF index with document embeddings")
+        from langchain_community.docstore.in_memory import InMemoryDocstore
         
-        # Get all embeddings as numpy array
-        texts = [doc.page_content for doc in documents]
-        embeddings_array = np.array(embeddings.embed_documents(texts)).astype('float32')
+        vectors = _embed_chunks(documents, embeddings)
+        index, built = build_index(kind, vectors)
         
-        # Train the index
-        index.train(embeddings_array)
-        logger.info("faiss_ivf_trained", vectors=len(embeddings_array))
-        
-        # Create vectorstore with trained IVF index
-        # Note: LangChain's FAISS wrapper simplifies this process.
-        # If custom index support is limited, we fall back to the default implementation which is robust.
-        vectorstore = FAISS.from_documents(documents, embeddings)
-        
-        logger.info("faiss_ivf_complete", message="IVF index created successfully")
+        ids = [str(uuid.uuid4()) for _ in documents]
+        for doc_id, document in zip(ids, documents):
+            document.id = doc_id  # Reported as chunk_id in chat sources
+        vectorstore = wrap_index(
+            index,
+            embeddings,
+            InMemoryDocstore(dict(zip(ids, documents))),
+            dict(enumerate(ids)),
+        )
+        logger.info("faiss_index_complete", index_type=built, vectors=index.ntotal)
         return vectorstore
         
     except ImportError:
         logger.warning("faiss_import_failed", message="faiss-cpu not available, using default index")
-        return FAISS.from_documents(documents, embeddings)
+        return _default_vectorstore(documents, embeddings)
     except Exception as e:
         logger.error("faiss_optimization_failed", error=str(e), message="Falling back to default index")
-        return FAISS.from_documents(documents, embeddings)
+        return _default_vectorstore(documents, embeddings)
+
+
+# ============ Streaming Pipeline ============
 
+_DONE = object()  # End-of-stream marker passed through stage queues
 
-def ingest_pdf(file_path: str, content_hash: str | None = None) -> dict:
+
+def _put(out_queue: queue.Queue, item, stop: threading.Event) -> bool:
+    """Blocking put that gives up once the pipeline is stopped"""
+    while not stop.is_set():
+        try:
+            out_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _drain(in_queue: queue.Queue, stop: threading.Event) -> Iterator:
+    """Yield items from a stage queue until the end-of-stream marker or a stop"""
+    while not stop.is_set():
+        try:
+            item = in_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        yield item
+
+
+def _pump(items: Iterable, out_queue: queue.Queue, stop: threading.Event, errors: list) -> None:
+    """Thread target: push a generator stage's output into a bounded queue"""
+    try:
+        for item in items:
+            if not _put(out_queue, item, stop):
+                return
+    except Exception as e:
+        errors.append(e)
+    finally:
+        _put(out_queue, _DONE, stop)
+
+
+def _timed(items: Iterable, timings: StageTimings, stage: str) -> Iterator:
+    """Accumulate the time spent producing each item into `stage`"""
+    iterator = iter(items)
+    while True:
+        with timings.stage(stage):
+            item = next(iterator, _DONE)
+        if item is _DONE:
+            return
+        yield item
+
+
+def _chunk_batches(pages: Iterable, splitter, batch_size: int, timings: StageTimings) -> Iterator:
+    """Split pages as they arrive; yield (chunk batch, pages seen so far)"""
+    batch = []
+    pages_seen = 0
+    for page in pages:
+        pages_seen += 1
+        with timings.stage("split"):
+            batch.extend(splitter.split_documents([page]))
+        if len(batch) >= batch_size:
+            yield batch, pages_seen
+            batch = []
+    if batch:
+        yield batch, pages_seen
+
+
+def _page_count(file_path: str) -> int:
+    """Total pages without parsing page contents (for chunk-count estimates)"""
+    try:
+        from pypdf import PdfReader
+        return len(PdfReader(file_path).pages)
+    except Exception:
+        return 0
+
+
+def stream_ingest(file_path: str, embeddings, index_type: str | None = None):
     """
-    Ingest a PDF file into the vector store.
+    Build a vectorstore from a PDF through a streaming pipeline.
+    
+    Pages are read lazily (loader thread), split page by page into batches
+    of chunks (splitter thread) and embedded and indexed batch by batch
+    (calling thread). Stages are connected by bounded queues, so peak
+    memory depends on INGESTION_PIPELINE_BATCH and INGESTION_QUEUE_SIZE
+    rather than on document size. Only chunk texts (docstore) and the index
+    itself grow with the document.
+    
+    The final chunk count is estimated from chunks-per-page so far times the
+    page count; it drives index type selection before all chunks exist.
+    
+    Args:
+        file_path: Path to the PDF file
+        embeddings: Embeddings instance
+        index_type: Override INDEX_TYPE
+    
+    Returns:
+        Tuple of (FAISS vectorstore or None if no text, number of chunks)
+    """
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.document_loaders import PyPDFLoader
+    
+    splitter = create_splitter()
+    total_pages = _page_count(file_path)
+    timings = StageTimings()
+    builder = IndexBuilder(index_type)
+    docstore: dict = {}
+    
+    stop = threading.Event()
+    errors: list = []
+    pages_queue: queue.Queue = queue.Queue(maxsize=INGESTION_QUEUE_SIZE)
+    batches_queue: queue.Queue = queue.Queue(maxsize=INGESTION_QUEUE_SIZE)
+    pages = _timed(PyPDFLoader(file_path).lazy_load(), timings, "load")
+    batches = _chunk_batches(_drain(pages_queue, stop), splitter, INGESTION_PIPELINE_BATCH, timings)
+    workers = [
+        threading.Thread(target=_pump, args=(pages, pages_queue, stop, errors), name="ingest-load", daemon=True),
+        threading.Thread(target=_pump, args=(batches, batches_queue, stop, errors), name="ingest-split", daemon=True),
+    ]
+    for worker in workers:
+        worker.start()
+    
+    try:
+        for chunks, pages_seen in _drain(batches_queue, stop):
+            with timings.stage("embed"):
+                vectors = _embed_chunks(chunks, embeddings)
+            expected = (len(docstore) + len(chunks)) * max(total_pages, pages_seen) // pages_seen
+            with timings.stage("index"):
+                builder.add(vectors, expected)
+            for chunk in chunks:
+                chunk.id = str(uuid.uuid4())  # Reported as chunk_id in chat sources
+                docstore[chunk.id] = chunk
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join(timeout=1)
+    if errors:
+        raise errors[0]
+    
+    with timings.stage("index"):
+        index, built = builder.finish()
+    for stage, ms in timings.stages.items():
+        INGESTION_STAGE_SECONDS.observe(ms / 1000, stage=stage)
+    logger.info("ingestion_pipeline_complete", chunks=len(docstore), pages=total_pages,
+                index_type=built, stages_ms=timings.as_dict())
+    if index is None:
+        return None, 0
+    
+    vectorstore = wrap_index(index, embeddings, InMemoryDocstore(docstore), dict(enumerate(docstore)))
+    return vectorstore, len(docstore)
+
+
+def ingest_pdf(
+    file_path: str,
+    content_hash: str | None = None,
+    session_id: str = DEFAULT_SESSION,
+    filename: str | None = None,
+) -> dict:
+    """
+    Ingest a PDF file into a session's vector store.
     
     Args:
         file_path: Path to the PDF file
         content_hash: Optional SHA-256 hash of file content for caching
+        session_id: Session whose document this becomes
+        filename: Original document name, kept in the index manifest
         
     Returns:
         Dictionary with 'chunks' (number of chunks created) and 'cache_hit' (boolean)
     """
     # Import cache module
     from cache import DocumentCache
-    from langchain_google_genai import GoogleGenerativeAIEmbeddings
-    from config import GOOGLE_API_KEY, EMBEDDING_MODEL, VECTOR_STORE_PATH
-    import shutil
+    from embeddings import get_embeddings
+    
+    vector_store = vector_stores.get(session_id)
     
     # Check cache first (Tier 4 optimization)
     if content_hash and DocumentCache.has_cached_index(content_hash):
         logger.info("cache_hit", hash=content_hash, message="Loading cached embeddings")
         
         # Initialize embeddings (needed for loading)
-        embeddings = GoogleGenerativeAIEmbeddings(
-            model=EMBEDDING_MODEL,
-            google_api_key=GOOGLE_API_KEY
-        )
+        embeddings = get_embeddings()
         
         # Load cached index
-        cached_vectorstore = DocumentCache.load_cached_index(content_hash, embeddings)
+        with INGESTION_STAGE_SECONDS.time(stage="cache_load"):
+            cached_vectorstore = DocumentCache.load_cached_index(content_hash, embeddings)
         
         if cached_vectorstore:
-            # Copy to active location
-            VECTOR_STORE_PATH.mkdir(parents=True, exist_ok=True)
-            cached_vectorstore.save_local(str(VECTOR_STORE_PATH))
-            
-            # Update global vector store
+            # Update the session's vector store and copy it to the session's location
             vector_store._vectorstore = cached_vectorstore
+            vector_store.store_path.mkdir(parents=True, exist_ok=True)
+            vector_store.save(content_hash, filename)
             
             return {"chunks": -1, "cache_hit": True}  # -1 indicates cache hit
         else:
             logger.warning("cache_load_failed", hash=content_hash, message="Proceeding with fresh ingestion")
     
-    # 1. Load PDF
-    loader = PyPDFLoader(file_path)
-    documents = loader.load()
-
-    # 2. Split into chunks
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP
-    )
-    chunks = text_splitter.split_documents(documents)
-    
-    if len(chunks) == 0:
+    # 1-3. Stream pages -> chunks -> embeddings -> index (bounded memory)
+    optimized_vectorstore, num_chunks = stream_ingest(file_path, get_embeddings())
+    if num_chunks == 0:
         raise ValueError("PDF contains no extractable text")
-
-    # 3. Create optimized vectorstore based on size (Tier 4)
-    from langchain_google_genai import GoogleGenerativeAIEmbeddings
-    from config import GOOGLE_API_KEY, EMBEDDING_MODEL
-    
-    embeddings = GoogleGenerativeAIEmbeddings(
-        model=EMBEDDING_MODEL,
-        google_api_key=GOOGLE_API_KEY
-    )
-    
-    # Use optimized vectorstore creation
-    optimized_vectorstore = create_optimized_vectorstore(chunks, embeddings, len(chunks))
+    INGESTION_CHUNKS.inc(num_chunks)
     
-    # Update global vector store
+    # Update the session's vector store
     vector_store._vectorstore = optimized_vectorstore
 
     # 4. Save to disk
-    vector_store.save()
+    with INGESTION_STAGE_SECONDS.time(stage="save"):
+        vector_store.save(content_hash, filename)
     
     # 5. Cache for future uploads (Tier 4 optimization)
     if content_hash and vector_store._vectorstore:
         from cache import DocumentCache
         try:
-            DocumentCache.cache_index(content_hash, vector_store._vectorstore, len(chunks))
+            with INGESTION_STAGE_SECONDS.time(stage="cache"):
+                DocumentCache.cache_index(content_hash, vector_store._vectorstore, num_chunks)
         except Exception as e:
             logger.warning("cache_save_failed", error=str(e), message="Continuing without caching")
     
-    return {"chunks": len(chunks), "cache_hit": False}
+    return {"chunks": num_chunks, "cache_hit": False}
 
 
 def _is_rate_limit_error(error: Exception) -> bool:
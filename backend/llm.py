@@ -0,0 +1,127 @@
+"""
+LLM Provider Registry
+Selects the chat model backend from config so the streaming path can be
+exercised without a remote API.
+
+Providers:
+    google: Gemini via langchain-google-genai
+    stub:   Local token streamer with configurable latency (load testing)
+"""
+
+import asyncio
+import re
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from config import settings
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Streams a fixed number of tokens with configurable latency.
+    The answer is built from the prompt's own words, so output is
+    deterministic for a given prompt. No network access.
+    """
+
+    answer_tokens: int = 60
+    first_token_delay: float = 0.0  # seconds before the first token
+    token_delay: float = 0.0  # seconds between subsequent tokens
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    @property
+    def expected_duration(self) -> float:
+        """Intrinsic generation time, for separating model time from server overhead"""
+        return self.first_token_delay + max(0, self.answer_tokens - 1) * self.token_delay
+
+    def _answer_tokens(self, messages: List[BaseMessage]) -> List[str]:
+        words = _WORD_RE.findall(str(messages[-1].content))[-200:] or ["answer"]
+        return [words[i % len(words)] + " " for i in range(self.answer_tokens)]
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        text = "".join(self._answer_tokens(messages))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        for token in self._answer_tokens(messages):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        if self.first_token_delay:
+            await asyncio.sleep(self.first_token_delay)
+        for index, token in enumerate(self._answer_tokens(messages)):
+            if index and self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+def _google_llm() -> BaseChatModel:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(
+        model=settings.LLM_MODEL,
+        temperature=settings.LLM_TEMPERATURE,
+        google_api_key=settings.GOOGLE_API_KEY
+    )
+
+
+def _stub_llm() -> BaseChatModel:
+    return StubChatModel(
+        answer_tokens=settings.LLM_STUB_TOKENS,
+        first_token_delay=settings.LLM_STUB_FIRST_TOKEN_MS / 1000,
+        token_delay=settings.LLM_STUB_TOKEN_MS / 1000,
+    )
+
+
+# Registry of provider name -> factory
+LLM_PROVIDERS: Dict[str, Callable[[], BaseChatModel]] = {
+    "google": _google_llm,
+    "stub": _stub_llm,
+}
+
+_instances: Dict[str, BaseChatModel] = {}
+_instances_lock = threading.Lock()
+
+
+def register_llm_provider(name: str, factory: Callable[[], BaseChatModel]) -> None:
+    """Register an additional chat model backend under `name`"""
+    LLM_PROVIDERS[name] = factory
+
+
+def get_llm(provider: str | None = None) -> BaseChatModel:
+    """
+    Get the shared chat model for a provider.
+
+    Args:
+        provider: Provider name; defaults to LLM_PROVIDER from config
+
+    Returns:
+        LangChain chat model (created once per provider)
+
+    Raises:
+        ValueError: If the provider is not registered
+    """
+    name = provider or settings.LLM_PROVIDER
+    if name not in LLM_PROVIDERS:
+        raise ValueError(
+            f"Unknown LLM provider '{name}'. "
+            f"Available: {', '.join(sorted(LLM_PROVIDERS))}"
+        )
+    with _instances_lock:
+        if name not in _instances:
+            _instances[name] = LLM_PROVIDERS[name]()
+            logger.info("llm_provider_initialized", provider=name)
+        return _instances[name]
@@ -5,15 +5,27 @@ FastAPI server for document Q&A using Retrieval Augmented Generation
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
+import asyncio
 import os
 import shutil
 
-from config import ALLOWED_ORIGINS, DB_PATH, VECTOR_STORE_PATH
+from config import ALLOWED_ORIGINS, DB_PATH, SESSION_STORE_DIR, VECTOR_STORE_PATH, settings
 from state import app_state
-from database import init_db
-from middleware import RateLimitMiddleware, RequestIDMiddleware, RequestSizeLimitMiddleware, APIKeyMiddleware
+from database import check_db, init_db, message_writer
+from generations import generations
+from retention import retention_enabled, retention_loop
+from warmup import readiness, start_warmup
+from middleware import (
+    APIKeyMiddleware,
+    CompressionMiddleware,
+    RateLimitMiddleware,
+    RequestIDMiddleware,
+    RequestSizeLimitMiddleware,
+)
 from logging_config import get_logger
+from metrics import registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 # Import Routers
 from routers import chat, upload
@@ -25,29 +37,54 @@ logger = get_logger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Handle startup and shutdown events"""
-    # Startup: Clear previous data to ensure a fresh session.
-    # This aligns with the "stateless" nature of this specific chatbot demo,
-    # preventing old data from bleeding into new user sessions.
-    logger.info("startup_cleanup_started", message="Cleaning up old session data")
-    
-    if DB_PATH.exists():
-        os.remove(DB_PATH)
-        logger.debug("deleted_file", file="chat_history.db")
+    warmup_task = None
+    if settings.PERSISTENT:
+        # Startup: Keep the previous run's history and indexes. The database
+        # is checked here (fast); indexes are validated and loaded in the
+        # background while /health reports warming.
+        await check_db()
+        await init_db()
+        warmup_task = start_warmup()
+        logger.info("startup_complete", message="Warm start in progress")
+    else:
+        # Startup: Clear previous data to ensure a fresh session.
+        # This aligns with the "stateless" nature of this specific chatbot demo,
+        # preventing old data from bleeding into new user sessions.
+        logger.info("startup_cleanup_started", message="Cleaning up old session data")
         
-    if VECTOR_STORE_PATH.exists():
-        shutil.rmtree(VECTOR_STORE_PATH)
-        logger.debug("deleted_directory", directory="faiss_index")
+        if DB_PATH.exists():
+            os.remove(DB_PATH)
+            logger.debug("deleted_file", file="chat_history.db")
+            
+        if VECTOR_STORE_PATH.exists():
+            shutil.rmtree(VECTOR_STORE_PATH)
+            logger.debug("deleted_directory", directory="faiss_index")
+        
+        if SESSION_STORE_DIR.exists():
+            shutil.rmtree(SESSION_STORE_DIR)
+            logger.debug("deleted_directory", directory="faiss_sessions")
 
-    # Reset application state
-    await app_state.clear()
+        # Reset application state
+        await app_state.clear()
+        
+        # Initialize fresh DB
+        await init_db()
+        logger.info("startup_complete", message="New session initialized")
     
-    # Initialize fresh DB
-    await init_db()
-    logger.info("startup_complete", message="New session initialized")
+    retention_task = asyncio.create_task(retention_loop()) if retention_enabled() else None
     
     yield
     # Shutdown logic
     logger.info("shutdown", message="Application shutting down")
+    # Cancelled answers queue their partial text (truncated) for the writer
+    cancelled = await generations.cancel_all()
+    if cancelled:
+        logger.info("generations_cancelled", count=cancelled)
+    background = [task for task in (retention_task, warmup_task) if task is not None]
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    await message_writer.close()  # Write queued chat messages
 
 
 app = FastAPI(title="RAG Chatbot API", lifespan=lifespan)
@@ -65,13 +102,30 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Generation-ID"],  # Needed by clients to resume streams
 )
 
+# Response compression (gzip/zstd; streams flushed per frame)
+app.add_middleware(CompressionMiddleware)
+
 # Health Check (Keep in main)
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy", "version": "2.3.0"}
+    """
+    Health check endpoint.
+    Answers 503 with status "warming" while a warm start is loading
+    indexes (PERSISTENT mode), so traffic waits until they are ready.
+    """
+    body = {"status": "healthy", "version": "2.3.0", **readiness.as_dict()}
+    if not readiness.ready:
+        return JSONResponse(status_code=503, content={**body, "status": "warming"})
+    return body
+
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Prometheus text exposition of in-process metrics"""
+    return PlainTextResponse(registry.render(), media_type=METRICS_CONTENT_TYPE)
 
 # Include Routers
 app.include_router(upload.router)
@@ -0,0 +1,282 @@
+"""
+Metrics Module
+Lightweight in-process counters and histograms exposed in Prometheus text format.
+
+Kept dependency-free on purpose: recording a sample is a dict lookup, a
+bisect and two additions under a lock, so instrumentation stays cheap on
+the hot chat path.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Sequence, TypeVar
+
+
+# Default latency buckets (seconds): 1ms .. 30s
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+
+def _escape(value: str) -> str:
+    """Escape a label value per the exposition format"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    """Render a Prometheus label set, e.g. {stage="load",le="0.5"}"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    """Render integers without a trailing .0"""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """Monotonically increasing counter with optional labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Increment the counter for the given label values"""
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        """Current value for the given label values"""
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        return self._values.get(key, 0.0)
+
+    def collect(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    """Bucketed histogram with optional labels"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Store: {label_values: [per-bucket counts..., +Inf count, sum]}
+        self._series: dict[tuple, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record one sample"""
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [0.0] * (len(self.buckets) + 2)
+                self._series[key] = series
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the wall-clock duration of the wrapped block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        """Number of samples recorded for the given label values"""
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        series = self._series.get(key)
+        return int(sum(series[:-1])) if series else 0
+
+    def sum(self, **labels: str) -> float:
+        """Sum of samples recorded for the given label values"""
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        series = self._series.get(key)
+        return series[-1] if series else 0.0
+
+    def collect(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0.0
+            for bound, bucket_count in zip(self.buckets, series):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {_format_value(cumulative)}")
+            cumulative += series[-2]
+            le = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(cumulative)}")
+        return lines
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+_M = TypeVar("_M", Counter, Histogram)
+
+
+class MetricsRegistry:
+    """Holds all metrics and renders them in Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram] = {}
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric: _M) -> _M:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Render every metric in text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        """Zero all metrics (used by tests)"""
+        for metric in self._metrics.values():
+            metric.reset()
+
+
+class StageTimings:
+    """
+    Per-request stage timer.
+    Collects millisecond durations by stage name for a single request,
+    complementing the process-wide histograms.
+    """
+
+    def __init__(self):
+        self.stages: dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the wrapped block, accumulating into ``name``"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float) -> None:
+        """Accumulate ``seconds`` into stage ``name``"""
+        self.stages[name] = self.stages.get(name, 0.0) + seconds * 1000
+
+    def as_dict(self) -> dict[str, float]:
+        """Stage durations rounded to 0.01 ms"""
+        return {name: round(ms, 2) for name, ms in self.stages.items()}
+
+
+# Singleton registry for application-wide use
+registry = MetricsRegistry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ============ Chat / Retrieval ============
+
+CHAT_REQUESTS = registry.counter(
+    "rag_chat_requests_total", "Chat generations by outcome", ["outcome"]
+)
+EMBEDDING_SECONDS = registry.histogram(
+    "rag_embedding_seconds", "Embedding call latency", ["operation"]
+)
+VECTOR_SEARCH_SECONDS = registry.histogram(
+    "rag_vector_search_seconds", "FAISS similarity search latency (excluding query embedding)"
+)
+TIME_TO_FIRST_TOKEN_SECONDS = registry.histogram(
+    "rag_time_to_first_token_seconds", "Time from chat request to first LLM token"
+)
+LLM_TOKENS = registry.counter(
+    "rag_llm_tokens_total", "Approximate number of tokens streamed by the LLM"
+)
+STREAM_FRAMES = registry.counter(
+    "rag_stream_frames_total", "Answer text frames written to chat streams (after coalescing)"
+)
+STREAM_RESUMES = registry.counter(
+    "rag_stream_resumes_total", "Chat stream reconnects by result", ["result"]
+)
+ABANDONED_TOKENS = registry.counter(
+    "rag_abandoned_tokens_total", "Approximate tokens spent on cancelled generations", ["kind"]
+)
+LLM_TOKENS_PER_SECOND = registry.histogram(
+    "rag_llm_tokens_per_second",
+    "LLM streaming throughput per generation",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+
+# ============ Ingestion ============
+
+INGESTION_STAGE_SECONDS = registry.histogram(
+    "rag_ingestion_stage_seconds",
+    "Duration of each ingestion stage",
+    ["stage"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+INGESTION_CHUNKS = registry.counter(
+    "rag_ingestion_chunks_total", "Chunks produced by ingestion"
+)
+DOCUMENT_CACHE_REQUESTS = registry.counter(
+    "rag_document_cache_requests_total", "DocumentCache lookups by result", ["result"]
+)
+
+# ============ Database ============
+
+DB_WRITE_SECONDS = registry.histogram(
+    "rag_db_write_seconds", "SQLite write latency including commit", ["operation"]
+)
+RETENTION_MESSAGES = registry.counter(
+    "rag_retention_messages_total", "Messages processed by the retention job", ["action"]
+)
@@ -1,121 +1,235 @@
 """
 Security Middleware Module
 Rate limiting and request tracing for the RAG Chatbot API
+
+All middleware here is plain ASGI rather than BaseHTTPMiddleware, so the
+streaming /chat response passes through without extra tasks or body
+re-wrapping.
 """
 
+import math
 import time
 import uuid
-from collections import defaultdict
-from functools import wraps
-from typing import Callable
-
-from fastapi import Request, HTTPException
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response, JSONResponse
+import zlib
+from collections import OrderedDict
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from logging_config import bind_request_context, clear_request_context
 from config import RATE_LIMIT_UPLOADS, RATE_LIMIT_CHAT, MAX_REQUEST_BODY_BYTES, settings
 
+try:
+    import zstandard
+except ImportError:  # Optional: gzip only
+    zstandard = None  # type: ignore[assignment]
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
+
+class TokenBucketLimiter:
     """
-    Simple in-memory rate limiter.
-    Tracks requests per IP with sliding window.
+    Per-key token buckets with O(1) checks.
+    
+    Each key holds ``capacity`` tokens that refill continuously at
+    ``capacity / window_seconds`` per second. Buckets are kept in
+    least-recently-used order, so idle keys can be swept from the front
+    without scanning every client.
     """
     
-    def __init__(self, app):
-        super().__init__(app)
-        # Store: {ip: [(timestamp, endpoint_type), ...]}
-        self._requests: dict[str, list[tuple[float, str]]] = defaultdict(list)
-        self._window_seconds = 60  # 1 minute window
-    
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        client_ip = self._get_client_ip(request)
-        path = request.url.path
-        
-        # Determine rate limit based on endpoint
-        if path == "/upload":
-            limit = RATE_LIMIT_UPLOADS
-            endpoint_type = "upload"
-        elif path == "/chat":
-            limit = RATE_LIMIT_CHAT
-            endpoint_type = "chat"
+    def __init__(self, capacity: int, window_seconds: float = 60.0):
+        self.capacity = capacity
+        self.window_seconds = window_seconds
+        self._refill_rate = capacity / window_seconds
+        # Store: {key: [tokens, last_update]}, ordered oldest access first
+        self._buckets: OrderedDict[str, list[float]] = OrderedDict()
+    
+    def acquire(self, key: str, now: float) -> tuple[bool, int, float]:
+        """
+        Try to take one token for ``key``.
+        
+        Args:
+            key: Client identifier (e.g. IP address)
+            now: Current monotonic time in seconds
+        
+        Returns:
+            Tuple of (allowed, remaining tokens, seconds until next token)
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [float(self.capacity), now]
+            self._buckets[key] = bucket
         else:
+            self._buckets.move_to_end(key)
+            elapsed = now - bucket[1]
+            bucket[0] = min(self.capacity, bucket[0] + elapsed * self._refill_rate)
+            bucket[1] = now
+        
+        if bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            return True, int(bucket[0]), 0.0
+        
+        retry_after = (1.0 - bucket[0]) / self._refill_rate
+        return False, 0, retry_after
+    
+    def reset_after(self, key: str) -> float:
+        """Seconds until the bucket for ``key`` is full again"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return 0.0
+        return (self.capacity - bucket[0]) / self._refill_rate
+    
+    def sweep(self, now: float) -> int:
+        """
+        Drop buckets that have been idle long enough to refill completely.
+        
+        A full bucket is indistinguishable from a missing one, so removal is
+        lossless. Only the idle prefix of the LRU order is visited.
+        
+        Returns:
+            Number of buckets removed
+        """
+        removed = 0
+        while self._buckets:
+            key, (tokens, last_update) = next(iter(self._buckets.items()))
+            if tokens + (now - last_update) * self._refill_rate < self.capacity:
+                break
+            del self._buckets[key]
+            removed += 1
+        return removed
+    
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+def _send_with_headers(send: Send, headers: dict[str, str]) -> Send:
+    """Wrap an ASGI send callable so extra headers are set on the response start"""
+    async def wrapped(message: Message) -> None:
+        if message["type"] == "http.response.start":
+            response_headers = MutableHeaders(scope=message)
+            for name, value in headers.items():
+                response_headers[name] = value
+        await send(message)
+    return wrapped
+
+
+class RateLimitMiddleware:
+    """
+    In-memory token-bucket rate limiter.
+    Keeps one bucket per client IP and endpoint; idle buckets are swept
+    periodically so memory tracks active clients only.
+    """
+    
+    SWEEP_INTERVAL_SECONDS = 30.0
+    
+    def __init__(self, app: ASGIApp, window_seconds: float = 60.0):
+        self.app = app
+        self._limiters: dict[str, TokenBucketLimiter] = {
+            "/upload": TokenBucketLimiter(RATE_LIMIT_UPLOADS, window_seconds),
+            "/chat": TokenBucketLimiter(RATE_LIMIT_CHAT, window_seconds),
+        }
+        self._next_sweep = time.monotonic() + self.SWEEP_INTERVAL_SECONDS
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        limiter = self._limiters.get(scope["path"])
+        if limiter is None:
             # No rate limiting for other endpoints
-            return await call_next(request)
+            await self.app(scope, receive, send)
+            return
         
-        # Clean old entries and check limit
-        now = time.time()
-        self._cleanup_old_requests(client_ip, now)
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
         
-        # Count requests of this type in the window
-        request_count = sum(
-            1 for _, etype in self._requests[client_ip] 
-            if etype == endpoint_type
-        )
+        client_ip = self._get_client_ip(scope)
+        allowed, remaining, retry_after = limiter.acquire(client_ip, now)
+        headers = {
+            "X-RateLimit-Limit": str(limiter.capacity),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(math.ceil(limiter.reset_after(client_ip))),
+        }
         
-        if request_count >= limit:
-            raise HTTPException(
+        if not allowed:
+            headers["Retry-After"] = str(math.ceil(retry_after))
+            response = JSONResponse(
                 status_code=429,
-                detail=f"Rate limit exceeded. Max {limit} {endpoint_type} requests per minute."
+                content={
+                    "error": f"Rate limit exceeded. Max {limiter.capacity} requests per minute.",
+                    "code": "RATE_LIMIT",
+                    "details": {"retry_after_seconds": math.ceil(retry_after)}
+                },
+                headers=headers,
             )
+            await response(scope, receive, send)
+            return
         
-        # Record this request
-        self._requests[client_ip].append((now, endpoint_type))
-        
-        return await call_next(request)
+        await self.app(scope, receive, _send_with_headers(send, headers))
     
-    def _get_client_ip(self, request: Request) -> str:
+    def _get_client_ip(self, scope: Scope) -> str:
         """Extract client IP, considering proxies"""
-        forwarded = request.headers.get("X-Forwarded-For")
+        forwarded = Headers(scope=scope).get("X-Forwarded-For")
         if forwarded:
             return str(forwarded).split(",")[0].strip()
-        return request.client.host if request.client else "unknown"
+        client = scope.get("client")
+        return client[0] if client else "unknown"
     
-    def _cleanup_old_requests(self, client_ip: str, now: float):
-        """Remove requests older than the window"""
-        cutoff = now - self._window_seconds
-        self._requests[client_ip] = [
-            (ts, etype) for ts, etype in self._requests[client_ip]
-            if ts > cutoff
-        ]
+    def _sweep(self, now: float) -> None:
+        """Remove idle client buckets from every endpoint limiter"""
+        for limiter in self._limiters.values():
+            limiter.sweep(now)
+        self._next_sweep = now + self.SWEEP_INTERVAL_SECONDS
 
 
-class RequestIDMiddleware(BaseHTTPMiddleware):
+class RequestIDMiddleware:
     """
     Adds a unique request ID to each request for tracing.
     The ID is added to response headers and can be used in logs.
     """
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
         # Generate unique request ID
         request_id = str(uuid.uuid4())[:8]  # Short ID for readability
         
-        # Store in request state for use in handlers
-        request.state.request_id = request_id
+        # Store in request state for use in handlers (request.state.request_id)
+        scope.setdefault("state", {})["request_id"] = request_id
         
-        # Process request
-        response = await call_next(request)
-        
-        # Add request ID to response headers
-        response.headers["X-Request-ID"] = request_id
-        
-        return response
+        # Bind to structlog context so every log line for this request carries it.
+        # Pure ASGI keeps the streaming body in this task, so /chat logs see it too.
+        bind_request_context(request_id)
+        try:
+            # Process request, adding the ID to response headers
+            await self.app(scope, receive, _send_with_headers(send, {"X-Request-ID": request_id}))
+        finally:
+            clear_request_context()
 
 
-class RequestSizeLimitMiddleware(BaseHTTPMiddleware):
+class RequestSizeLimitMiddleware:
     """
     Limits request body size for non-upload endpoints.
     Prevents abuse via massive JSON payloads.
     """
     EXEMPT_PATHS = {"/upload"}  # Upload has its own limit
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        if request.url.path in self.EXEMPT_PATHS:
-            return await call_next(request)
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
         
-        content_length = request.headers.get('content-length')
+        content_length = Headers(scope=scope).get("content-length")
         if content_length and int(content_length) > MAX_REQUEST_BODY_BYTES:
-            return JSONResponse(
+            response = JSONResponse(
                 status_code=413,
                 content={
                     "error": "Request body too large",
@@ -123,33 +237,164 @@ class RequestSizeLimitMiddleware(BaseHTTPMiddleware):
                     "details": {"max_size_mb": settings.MAX_REQUEST_BODY_MB}
                 }
             )
-        return await call_next(request)
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
 
 
-class APIKeyMiddleware(BaseHTTPMiddleware):
+class APIKeyMiddleware:
     """
     Optional API key authentication.
     Only active when REQUIRE_AUTH=true in config.
     """
     EXEMPT_PATHS = {"/health", "/docs", "/openapi.json", "/redoc"}
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        # Skip if auth is disabled
-        if not settings.REQUIRE_AUTH:
-            return await call_next(request)
-        
-        # Skip exempt paths
-        if request.url.path in self.EXEMPT_PATHS:
-            return await call_next(request)
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Skip non-HTTP scopes, disabled auth and exempt paths
+        if (
+            scope["type"] != "http"
+            or not settings.REQUIRE_AUTH
+            or scope["path"] in self.EXEMPT_PATHS
+        ):
+            await self.app(scope, receive, send)
+            return
         
         # Check for API key
-        api_key = request.headers.get("X-API-Key")
+        api_key = Headers(scope=scope).get("X-API-Key")
         if not api_key or api_key not in settings.API_KEYS:
-            return JSONResponse(
+            response = JSONResponse(
                 status_code=401,
                 content={
                     "error": "Invalid or missing API key",
                     "code": "UNAUTHORIZED"
                 }
             )
-        return await call_next(request)
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+class _GzipEncoder:
+    """Incremental gzip stream; each non-final chunk ends on a sync flush"""
+    
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    
+    def encode(self, data: bytes, final: bool) -> bytes:
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class _ZstdEncoder:
+    """Incremental zstd stream; each non-final chunk ends a block"""
+    
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=min(level, 19)).compressobj()
+    
+    def encode(self, data: bytes, final: bool) -> bytes:
+        out = self._compressor.compress(data)
+        mode = zstandard.COMPRESSOBJ_FLUSH_FINISH if final else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        return out + self._compressor.flush(mode)
+
+
+_ENCODERS: dict[str, type[_GzipEncoder] | type[_ZstdEncoder]] = {"gzip": _GzipEncoder}
+if zstandard is not None:
+    _ENCODERS = {"zstd": _ZstdEncoder, **_ENCODERS}
+
+
+def negotiate_encoding(accept_encoding: str | None) -> str | None:
+    """Preferred supported coding from an Accept-Encoding header (zstd, then gzip)"""
+    if not accept_encoding:
+        return None
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip())
+    for encoding in _ENCODERS:
+        if encoding in accepted:
+            return encoding
+    return "gzip" if "*" in accepted else None
+
+
+class CompressionMiddleware:
+    """
+    Compress JSON, NDJSON, SSE and text responses with gzip, or zstd when
+    the zstandard package is installed and the client accepts it.
+    
+    Complete bodies are compressed when at least COMPRESSION_MIN_BYTES.
+    Streamed bodies (the /chat stream) are compressed only with
+    COMPRESS_STREAMS, and every chunk is flushed on its own (gzip sync
+    flush / zstd block end) so frames still reach the client as they are
+    produced. Starlette's GZipMiddleware buffers inside the compressor
+    instead, which would stall token streaming.
+    """
+    
+    COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        
+        start: Message | None = None
+        encoder: _GzipEncoder | _ZstdEncoder | None = None
+        passthrough = False
+        
+        async def compressing_send(message: Message) -> None:
+            nonlocal start, encoder, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                passthrough = "content-encoding" in headers or not content_type.startswith(self.COMPRESSIBLE_TYPES)
+                if passthrough:
+                    await send(message)
+                else:
+                    start = message  # Held until the first body chunk shows the body size
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                streaming = more_body
+                if (streaming and not settings.COMPRESS_STREAMS) or (
+                    not streaming and len(body) < settings.COMPRESSION_MIN_BYTES
+                ):
+                    passthrough = True
+                    await send(start)
+                    start = None
+                    await send(message)
+                    return
+                encoder = _ENCODERS[encoding](settings.COMPRESSION_LEVEL)
+                compressed = encoder.encode(body, final=not more_body)
+                response_headers = MutableHeaders(scope=start)
+                response_headers["Content-Encoding"] = encoding
+                response_headers.add_vary_header("Accept-Encoding")
+                if streaming:
+                    del response_headers["Content-Length"]
+                else:
+                    response_headers["Content-Length"] = str(len(compressed))
+                await send(start)
+                start = None
+            elif encoder is not None:
+                compressed = encoder.encode(body, final=not more_body)
+            else:
+                await send(message)
+                return
+            await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+        
+        await self.app(scope, receive, compressing_send)
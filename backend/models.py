@@ -94,8 +94,8 @@ class HistoryResponse(BaseModel):
 
 class StreamEvent(BaseModel):
     """Base model for streaming events"""
-    type: Literal["token", "sources", "error"]
-    data: str | list
+    type: Literal["token", "sources", "error", "timing"]
+    data: str | list | dict
 
 
 class SourceInfo(BaseModel):
@@ -1,29 +1,36 @@
 """
 RAG (Retrieval Augmented Generation) Module
 Handles document retrieval and LLM response generation
+
+LangChain prompt/parser classes and the LLM registry are imported on the
+first chat request, keeping them out of application startup.
 """
 
 import json
 import asyncio
-
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+import time
+from functools import lru_cache
 
 # Import config for LLM settings
-from config import (
-    LLM_MODEL,
-    LLM_TEMPERATURE,
-    CHAT_MAX_RETRIES,
-    GOOGLE_API_KEY,
-)
+from config import CHAT_MAX_RETRIES, RAG_CONTEXT_TOKENS
 
 # Import vector store abstraction
-from vector_store import vector_store
+from vector_store import vector_stores
+from tokenizer import count_tokens
+from conversation import DEFAULT_SESSION, conversation_memory, expand_query, history_block
 
 # Import structured logging
 from logging_config import get_logger
-from models import StreamEvent
+from streaming import TokenCoalescer, event_frame
+from metrics import (
+    ABANDONED_TOKENS,
+    CHAT_REQUESTS,
+    LLM_TOKENS,
+    LLM_TOKENS_PER_SECOND,
+    STREAM_FRAMES,
+    TIME_TO_FIRST_TOKEN_SECONDS,
+    StageTimings,
+)
 
 logger = get_logger(__name__)
 
@@ -43,83 +50,228 @@ Instructions:
 Context:
 {context}
 
+Conversation so far:
+{history}
+
 Question: {question}
 
 Answer:"""
 
+# Template tokens excluding the {context}/{history}/{question} placeholders
+_PROMPT_OVERHEAD_TOKENS = count_tokens(
+    SYSTEM_PROMPT.replace("{context}", "").replace("{history}", "").replace("{question}", "")
+)
+
+NO_HISTORY = "(none)"
+
+
+def get_llm():
+    """Shared chat model from the LLM provider registry (imported on first use)"""
+    import llm
+    return llm.get_llm()
+
+
+@lru_cache(maxsize=1)
+def _prompt_template():
+    """The parsed SYSTEM_PROMPT, built once on the first request"""
+    from langchain_core.prompts import ChatPromptTemplate
+    return ChatPromptTemplate.from_template(SYSTEM_PROMPT)
+
+
+@lru_cache(maxsize=1)
+def _output_parser():
+    from langchain_core.output_parsers import StrOutputParser
+    return StrOutputParser()
+
+
+def _pack_context(docs, budget: int = RAG_CONTEXT_TOKENS):
+    """
+    Keep retrieved chunks, best first, while they fit the token budget.
+    Uses the token_count stored at ingestion; chunks indexed before it
+    existed are counted on the fly. The top chunk is always kept.
+    
+    Returns:
+        Tuple of (kept documents, their total tokens)
+    """
+    packed: list = []
+    total = 0
+    for doc in docs:
+        tokens = doc.metadata.get("token_count")
+        if tokens is None:
+            tokens = count_tokens(doc.page_content)
+        if packed and total + tokens > budget:
+            break
+        packed.append(doc)
+        total += tokens
+    return packed, total
+
 
-async def generate_chat_response(question: str):
+async def generate_chat_response(
+    question: str,
+    session_id: str = DEFAULT_SESSION,
+    answer_parts: list | None = None,
+    answer_sources: list | None = None,
+    answer_errors: list | None = None,
+):
     """
     Generate a streaming chat response.
     
+    Follow-up questions are resolved against the session's recent turns:
+    retrieval uses an expanded query and the prompt includes bounded history.
+    The caller records the finished turn in conversation_memory.
+    
     Args:
         question: User's question
+        session_id: Conversation the question belongs to
+        answer_parts: If given, answer text chunks are appended to it, so
+            callers get the answer without parsing the frames back
+        answer_sources: If given, receives the sources event entries
+            (page, preview, chunk_id, score) for storing with the answer
+        answer_errors: If given, receives the error message when the
+            stream ends in an error event; answer_parts is then partial
         
     Yields:
-        JSON strings for SSE streaming
+        NDJSON frames (see streaming.py); answer text may be coalesced into
+        fewer frames per STREAM_COALESCE_MS. On success the final event is
+        a ``timing`` event with per-stage milliseconds and token counts.
+        
+    Rate-limited requests are retried only until the first token arrives:
+    text already sent cannot be taken back, so a later failure ends the
+    stream with an error event instead of repeating the answer.
+        
+    Cancelling the consuming task (the client went away) stops the LLM
+    stream or retry wait at once; the tokens already spent are counted as
+    abandoned and the cancellation propagates to the caller.
     """
+    started = time.perf_counter()
+    timings = StageTimings()
+    prompt_tokens = 0
+    answer_chars = 0
     try:
-        # Get relevant documents using vector store abstraction
-        docs = vector_store.similarity_search(question)
-        context = "\n\n".join([d.page_content for d in docs])
+        with timings.stage("history"):
+            session = await conversation_memory.get(session_id)
+            search_query = expand_query(session, question)
+            history, history_tokens = history_block(session)
         
-        # Prepare source metadata
-        sources = [
-            {
-                "page": doc.metadata.get("page", 0) + 1,
-                "preview": doc.page_content[:50].replace("\n", " ") + "..."
-            }
-            for doc in docs
-        ]
+        # Get relevant documents using vector store abstraction. Runs in a
+        # worker thread: a cold session loads its index from disk here, and
+        # query embedding and search would otherwise stall every other stream
+        store = vector_stores.get(session_id)
+        results = await asyncio.to_thread(store.similarity_search_with_score, search_query, timings=timings)
         
-
+        with timings.stage("prompt"):
+            retrieved = len(results)
+            docs, context_tokens = _pack_context([doc for doc, _ in results])
+            context = "\n\n".join([d.page_content for d in docs])
+            
+            # Prepare source metadata (packing keeps a prefix of the results)
+            sources = [
+                {
+                    "page": doc.metadata.get("page", 0) + 1,
+                    "preview": doc.page_content[:50].replace("\n", " ") + "...",
+                    "chunk_id": doc.id,
+                    "score": round(score, 4),
+                }
+                for doc, score in results[:len(docs)]
+            ]
+            if answer_sources is not None:
+                answer_sources.extend(sources)
+            
+            # Set up LLM chain
+            chain = _prompt_template() | get_llm() | _output_parser()
+            prompt_tokens = _PROMPT_OVERHEAD_TOKENS + context_tokens + history_tokens + count_tokens(question)
 
         # Send sources first
-        yield StreamEvent(type="sources", data=sources).model_dump_json() + "\n"
-        
-        # Set up LLM chain
-        prompt = ChatPromptTemplate.from_template(SYSTEM_PROMPT)
-        llm = ChatGoogleGenerativeAI(
-            model=LLM_MODEL,
-            temperature=LLM_TEMPERATURE,
-            google_api_key=GOOGLE_API_KEY
-        )
-        chain = prompt | llm | StrOutputParser()
+        yield event_frame("sources", sources)
         
         # Stream response with retry logic
+        llm_started = time.perf_counter()
+        first_token_at = None
+        coalescer = TokenCoalescer()
         for attempt in range(CHAT_MAX_RETRIES):
             try:
                 async for chunk in chain.astream({
                     "context": context,
+                    "history": history or NO_HISTORY,
                     "question": question
                 }):
-                    yield StreamEvent(type="token", data=chunk).model_dump_json() + "\n"
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        TIME_TO_FIRST_TOKEN_SECONDS.observe(first_token_at - started)
+                    answer_chars += len(chunk)
+                    if answer_parts is not None:
+                        answer_parts.append(chunk)
+                    frame = coalescer.push(chunk)
+                    if frame is not None:
+                        yield frame
                 break  # Success
                 
             except Exception as e:
+                # Text received before the failure still reaches the client
+                pending = coalescer.flush()
+                if pending is not None:
+                    yield pending
                 if _is_rate_limit_error(e):
-                    if attempt == CHAT_MAX_RETRIES - 1:
-                        yield StreamEvent(
-                            type="error",
-                            data="System busy (Rate Limit). Please try again."
-                        ).model_dump_json() + "\n"
-                        return
-                    
-                    delay = 5 * (2 ** attempt)
-                    logger.warning("chat_rate_limit", attempt=attempt + 1, delay=delay)
-                    await asyncio.sleep(delay)
+                    if attempt == CHAT_MAX_RETRIES - 1 or first_token_at is not None:
+                        CHAT_REQUESTS.inc(outcome="rate_limited")
+                        message = "System busy (Rate Limit). Please try again."
+                    else:
+                        delay = 5 * (2 ** attempt)
+                        logger.warning("chat_rate_limit", attempt=attempt + 1, delay=delay)
+                        await asyncio.sleep(delay)
+                        continue
                 else:
-                    yield StreamEvent(
-                        type="error",
-                        data=f"Error: {str(e)}"
-                    ).model_dump_json() + "\n"
-                    return
+                    CHAT_REQUESTS.inc(outcome="error")
+                    message = f"Error: {str(e)}"
+                if answer_errors is not None:
+                    answer_errors.append(message)
+                yield event_frame("error", message)
+                return
+        
+        pending = coalescer.flush()
+        if pending is not None:
+            yield pending
+        STREAM_FRAMES.inc(coalescer.frames)
+        finished = time.perf_counter()
+        CHAT_REQUESTS.inc(outcome="ok")
+        completion_tokens = _approx_token_count(answer_chars) if answer_chars else 0
+        if first_token_at is not None:
+            timings.add("llm_first_token", first_token_at - llm_started)
+            LLM_TOKENS.inc(completion_tokens)
+            if finished > first_token_at:
+                LLM_TOKENS_PER_SECOND.observe(completion_tokens / (finished - first_token_at))
+        timings.add("llm", finished - llm_started)
+        timings.add("total", finished - started)
+        
+        breakdown = {
+            "stages_ms": timings.as_dict(),
+            "prompt_tokens": prompt_tokens,
+            "history_tokens": history_tokens,
+            "query_expanded": search_query != question,
+            "completion_tokens": completion_tokens,
+            "stream_frames": coalescer.frames,
+            "retrieved_chunks": retrieved,
+            "context_chunks": len(docs),
+        }
+        logger.info("chat_timing", **breakdown)
+        yield event_frame("timing", breakdown)
                     
     except FileNotFoundError:
-        yield StreamEvent(
-            type="error",
-            data="Please upload a document first."
-        ).model_dump_json() + "\n"
+        CHAT_REQUESTS.inc(outcome="no_document")
+        yield event_frame("error", "Please upload a document first.")
+    
+    except asyncio.CancelledError:
+        CHAT_REQUESTS.inc(outcome="cancelled")
+        completion_tokens = _approx_token_count(answer_chars) if answer_chars else 0
+        ABANDONED_TOKENS.inc(prompt_tokens, kind="prompt")
+        ABANDONED_TOKENS.inc(completion_tokens, kind="completion")
+        logger.info(
+            "chat_cancelled",
+            elapsed_ms=round((time.perf_counter() - started) * 1000, 1),
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+        )
+        raise
 
 
 def _is_rate_limit_error(error: Exception) -> bool:
@@ -130,3 +282,8 @@ def _is_rate_limit_error(error: Exception) -> bool:
         "RESOURCE_EXHAUSTED",
         "Too Many Requests"
     ])
+
+
+def _approx_token_count(num_chars: int) -> int:
+    """Rough token estimate for Gemini-style tokenizers (~4 chars per token)"""
+    return max(1, num_chars // 4)
@@ -0,0 +1,163 @@
+"""
+Chat History Retention
+Keeps the messages table bounded once the database outlives a restart.
+
+Messages older than RETENTION_MAX_AGE_DAYS, or beyond the newest
+RETENTION_MAX_MESSAGES, are removed oldest first in batches of
+RETENTION_BATCH_SIZE, one short transaction each, so queued chat writes
+get the database lock between batches. Removed rows are appended to a
+gzip-compressed NDJSON file per day in RETENTION_ARCHIVE_DIR before they
+are deleted. Each run ends with an incremental_vacuum that hands freed
+pages back to the filesystem without rewriting the whole file.
+
+Ids grow with insertion time, so "oldest" is simply the lowest ids and
+every batch is an index range read regardless of table size.
+"""
+
+import asyncio
+import gzip
+import json
+import time
+from pathlib import Path
+from typing import Optional
+
+import aiosqlite
+
+import database
+from config import settings
+from logging_config import get_logger
+from metrics import DB_WRITE_SECONDS, RETENTION_MESSAGES
+
+logger = get_logger(__name__)
+
+
+def retention_enabled() -> bool:
+    """True if an age or count limit is configured"""
+    return settings.RETENTION_MAX_AGE_DAYS > 0 or settings.RETENTION_MAX_MESSAGES > 0
+
+
+def _archive(rows: list[dict], directory: Path) -> Path:
+    """Append rows to today's archive file (blocking; run in a thread)"""
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"messages-{time.strftime('%Y%m%d')}.ndjson.gz"
+    # Appending adds a gzip member; gzip readers see one continuous stream
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    return path
+
+
+async def _count_cutoff(db: aiosqlite.Connection) -> int:
+    """Highest id beyond the newest RETENTION_MAX_MESSAGES (0 if none)"""
+    if settings.RETENTION_MAX_MESSAGES <= 0:
+        return 0
+    async with db.execute(
+        "SELECT id FROM messages ORDER BY id DESC LIMIT 1 OFFSET ?", (settings.RETENTION_MAX_MESSAGES,)
+    ) as cursor:
+        row = await cursor.fetchone()
+    return row[0] if row is not None else 0
+
+
+async def _age_cutoff(db: aiosqlite.Connection) -> Optional[str]:
+    """Timestamp before which messages expire, in the column's format (None if unlimited)"""
+    if settings.RETENTION_MAX_AGE_DAYS <= 0:
+        return None
+    seconds = round(settings.RETENTION_MAX_AGE_DAYS * 86400)
+    return str(await database.fetch_value(db, "SELECT datetime('now', ?)", (f"-{seconds} seconds",)))
+
+
+async def _attach_sources(db: aiosqlite.Connection, rows: list[dict]) -> None:
+    """Add each row's stored sources, so archives keep provenance"""
+    by_id = {row["id"]: row for row in rows}
+    async with db.execute(
+        "SELECT message_id, chunk_id, page, score, preview FROM message_sources "
+        "WHERE message_id BETWEEN ? AND ? ORDER BY message_id, position",
+        (rows[0]["id"], rows[-1]["id"]),
+    ) as cursor:
+        for row in await cursor.fetchall():
+            source = dict(row)
+            by_id[source.pop("message_id")].setdefault("sources", []).append(source)
+
+
+async def run_retention(archive_dir: Optional[Path] = None) -> dict:
+    """
+    Remove (and archive) messages past the retention limits, then vacuum.
+
+    Returns:
+        Dictionary with deleted, archived and vacuumed_pages counts
+    """
+    archive_dir = archive_dir or settings.RETENTION_ARCHIVE_DIR
+    stats = {"deleted": 0, "archived": 0, "vacuumed_pages": 0}
+    await database.message_writer.flush()  # Queued rows count towards the limits
+
+    async with aiosqlite.connect(database.DB_PATH) as db:
+        db.row_factory = aiosqlite.Row
+        max_id = await _count_cutoff(db)
+        expires_before = await _age_cutoff(db)
+
+        def due(row: dict) -> bool:
+            return row["id"] <= max_id or (expires_before is not None and row["timestamp"] < expires_before)
+
+        while max_id or expires_before:
+            async with db.execute(
+                "SELECT id, session_id, role, content, timestamp, truncated FROM messages "
+                "ORDER BY id LIMIT ?",
+                (settings.RETENTION_BATCH_SIZE,),
+            ) as cursor:
+                oldest = [dict(row) for row in await cursor.fetchall()]
+            rows = []
+            for row in oldest:
+                if not due(row):
+                    break  # Everything after it is newer
+                rows.append(row)
+            if not rows:
+                break
+            if settings.RETENTION_ARCHIVE:
+                await _attach_sources(db, rows)
+                # Archive before deleting: a failed write leaves the rows in place
+                await asyncio.to_thread(_archive, rows, archive_dir)
+                stats["archived"] += len(rows)
+                RETENTION_MESSAGES.inc(len(rows), action="archived")
+            with DB_WRITE_SECONDS.time(operation="retention_delete"):
+                await db.execute(
+                    "DELETE FROM messages WHERE id BETWEEN ? AND ?", (rows[0]["id"], rows[-1]["id"])
+                )
+                await db.commit()
+            stats["deleted"] += len(rows)
+            RETENTION_MESSAGES.inc(len(rows), action="deleted")
+            if len(rows) < len(oldest):
+                break
+            await asyncio.sleep(0)  # Let other tasks (and writers) in between batches
+
+        stats["vacuumed_pages"] = await _vacuum(db)
+
+    if stats["deleted"]:
+        logger.info("retention_completed", **stats)
+    return stats
+
+
+async def _vacuum(db: aiosqlite.Connection) -> int:
+    """Release free pages; converts older files to incremental auto_vacuum once"""
+    mode = await database.fetch_value(db, "PRAGMA auto_vacuum")
+    if mode != 2:  # 2 = INCREMENTAL; switching needs one full VACUUM
+        await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        with DB_WRITE_SECONDS.time(operation="vacuum"):
+            await db.execute("VACUUM")
+        return 0
+    free: int = await database.fetch_value(db, "PRAGMA freelist_count")
+    if not free:
+        return 0
+    with DB_WRITE_SECONDS.time(operation="vacuum"):
+        # executescript steps the pragma to completion (execute frees one page)
+        await db.executescript(f"PRAGMA incremental_vacuum({int(settings.RETENTION_VACUUM_PAGES)})")
+    return free - int(await database.fetch_value(db, "PRAGMA freelist_count"))
+
+
+async def retention_loop() -> None:
+    """Run retention every RETENTION_INTERVAL_SECONDS (started from the app lifespan)"""
+    while True:
+        try:
+            await run_retention()
+        except Exception as e:
+            logger.warning("retention_failed", error=str(e))
+        await asyncio.sleep(settings.RETENTION_INTERVAL_SECONDS)
@@ -1,56 +1,58 @@
-from fastapi import APIRouter
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
-import json
-import os
-import shutil
 
-from config import DB_PATH, VECTOR_STORE_PATH
 from state import app_state
 from models import ChatRequest, StatusResponse, ResetResponse
-from database import init_db, add_message, get_history, get_history_paginated, clear_messages
+from database import add_message, get_history, get_history_paginated, clear_messages, search_messages
 from rag import generate_chat_response
+from conversation import conversation_memory
+from sessions import get_session_id
+from vector_store import vector_stores
+from streaming import NDJSON_MEDIA_TYPE, SSE_HEADERS, SSE_MEDIA_TYPE, sse_stream, wants_sse
+from generations import Generation, generations
+from metrics import STREAM_RESUMES
 
 router = APIRouter()
 
 @router.post("/reset", response_model=ResetResponse)
-async def reset_session():
-    """Reset the entire session (document + chat)"""
+async def reset_session(session_id: str = Depends(get_session_id)):
+    """Reset the session (its document, index and chat); other sessions are untouched"""
     
-    # Delete FAISS Index
-    if VECTOR_STORE_PATH.exists():
-        shutil.rmtree(VECTOR_STORE_PATH)
+    # Delete the session's FAISS index (memory and disk)
+    await run_in_threadpool(vector_stores.clear, session_id)
     
-    # Delete Chat History DB
-    if DB_PATH.exists():
-        os.remove(DB_PATH)
-        
-    # Re-initialize DB
-    await init_db()
+    # Delete the session's chat history
+    await clear_messages(session_id)
     
-    # Reset application state
-    await app_state.clear()
+    # Reset the session's state
+    await app_state.clear(session_id)
+    await conversation_memory.clear(session_id)
     
     return ResetResponse(status="Session Reset")
 
 
 @router.post("/clear_chat", response_model=ResetResponse)
-async def clear_chat_history():
-    """Clear only chat history, keep document"""
-    await clear_messages()
+async def clear_chat_history(session_id: str = Depends(get_session_id)):
+    """Clear only the session's chat history, keep its document"""
+    await clear_messages(session_id)
+    await conversation_memory.clear(session_id)
     return ResetResponse(status="Chat History Cleared")
 
 
 @router.get("/status", response_model=StatusResponse)
-async def get_status():
-    """Get current document status"""
-    filename = await app_state.get_document()
+async def get_status(session_id: str = Depends(get_session_id)):
+    """Get the session's document status"""
+    filename = await app_state.get_document(session_id)
     return StatusResponse(filename=filename)
 
 
 @router.get("/history")
-async def get_chat_history(limit: int = 50, offset: int = 0):
+async def get_chat_history(limit: int = 50, offset: int = 0, session_id: str = Depends(get_session_id)):
     """
-    Get paginated chat messages.
+    Get the session's paginated chat messages.
     
     Query Parameters:
         limit: Maximum number of messages to return (default 50, max 100)
@@ -66,33 +68,124 @@ async def get_chat_history(limit: int = 50, offset: int = 0):
     
     # If using default values, return simple list for backward compatibility
     if limit == 50 and offset == 0:
-        return await get_history()
+        return await get_history(session_id)
     
     # Otherwise return paginated response
-    return await get_history_paginated(limit, offset)
+    return await get_history_paginated(limit, offset, session_id)
+
+
+@router.get("/history/search")
+async def search_chat_history(
+    q: str,
+    limit: int = 20,
+    offset: int = 0,
+    session_id: str = Depends(get_session_id),
+):
+    """
+    Full-text search over the session's messages, best match first.
+    
+    Query Parameters:
+        q: Words to find (all must occur; word forms are matched by stem)
+        limit: Maximum number of results (default 20, max 100)
+        offset: Number of results to skip for pagination
+    
+    Returns:
+        Pagination object with results (each with an HTML snippet where
+        matches are wrapped in <mark>), total, limit, offset, has_more.
+    """
+    limit = max(1, min(limit, 100))
+    offset = max(0, offset)
+    try:
+        return await search_messages(q, session_id, limit, offset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/chat")
-async def chat(request: ChatRequest):
-    """Stream chat response for a question"""
+async def chat(request: ChatRequest, http_request: Request, session_id: str = Depends(get_session_id)):
+    """
+    Stream chat response for a question against the session's document.
+    
+    NDJSON by default; clients sending ``Accept: text/event-stream`` get
+    Server-Sent Events with the same JSON payloads, event ids and heartbeats.
+    The answer is generated in the background; the X-Generation-ID response
+    header identifies it for GET /chat/{generation_id}/stream after a
+    dropped connection. If no client reads the answer for
+    GENERATION_ABANDON_SECONDS it is cancelled, and the text generated so
+    far is saved flagged as truncated.
+    """
     
     # Save User Question
-    await add_message("user", request.question)
+    await add_message("user", request.question, session_id)
     
     async def event_generator():
-        full_answer = ""
-        async for event in generate_chat_response(request.question):
-            # Parse event to extract text for history
-            try:
-                data = json.loads(event.strip())
-                if data["type"] == "token":
-                    full_answer += data["data"]
-            except (json.JSONDecodeError, KeyError):
-                pass
-            yield event
+        # Answer text is collected as generated; frames are passed through untouched
+        answer_parts: list[str] = []
+        sources: list[dict] = []
+        errors: list[str] = []
+        try:
+            async for event in generate_chat_response(request.question, session_id, answer_parts, sources, errors):
+                yield event
+        except asyncio.CancelledError:
+            # Abandoned: keep what was generated, but not in conversation memory
+            partial = "".join(answer_parts)
+            if partial:
+                await add_message("assistant", partial, session_id, truncated=True, sources=sources)
+            raise
             
-        # Save Assistant Answer
-        if full_answer:
-            await add_message("assistant", full_answer)
+        # Save Assistant Answer with the sources it was based on
+        full_answer = "".join(answer_parts)
+        if errors:
+            # Cut off by an LLM error: stored as truncated, not remembered
+            if full_answer:
+                await add_message("assistant", full_answer, session_id, truncated=True, sources=sources)
+        elif full_answer:
+            await conversation_memory.record(request.question, full_answer, session_id)
+            await add_message("assistant", full_answer, session_id, sources=sources)
+
+    generation = generations.start(session_id, event_generator())
+    return _stream_response(generation, 0, http_request)
+
+
+@router.get("/chat/{generation_id}/stream")
+async def resume_chat(
+    generation_id: str,
+    http_request: Request,
+    offset: int = 0,
+    session_id: str = Depends(get_session_id),
+):
+    """
+    Reattach to a running or recently finished answer.
+    
+    Query Parameters:
+        offset: Frames already received; streaming resumes after them.
+            An SSE Last-Event-ID header takes precedence.
+    """
+    generation = generations.get(generation_id)
+    if generation is None or generation.session_id != session_id:
+        STREAM_RESUMES.inc(result="not_found")
+        raise HTTPException(status_code=404, detail="Unknown or expired generation.")
+    
+    last_event_id = http_request.headers.get("last-event-id")
+    if last_event_id:
+        try:
+            offset = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID.")
+    if not generation.can_resume(offset):
+        STREAM_RESUMES.inc(result="gone")
+        raise HTTPException(status_code=410, detail="Requested frames are no longer buffered.")
+    
+    STREAM_RESUMES.inc(result="ok")
+    return _stream_response(generation, offset, http_request)
+
 
-    return StreamingResponse(event_generator(), media_type="application/x-ndjson")
+def _stream_response(generation: Generation, offset: int, http_request: Request) -> StreamingResponse:
+    """Stream a generation's frames after `offset` in the negotiated format"""
+    headers = {"X-Generation-ID": generation.id}
+    frames = generation.subscribe(offset, is_disconnected=http_request.is_disconnected)
+    if wants_sse(http_request.headers.get("accept")):
+        return StreamingResponse(
+            sse_stream(frames, start_id=offset), media_type=SSE_MEDIA_TYPE, headers={**SSE_HEADERS, **headers}
+        )
+    return StreamingResponse(frames, media_type=NDJSON_MEDIA_TYPE, headers=headers)
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
 from fastapi.concurrency import run_in_threadpool
 import os
 import shutil
@@ -8,6 +8,7 @@ from state import app_state
 from models import UploadResponse
 from ingestion import ingest_pdf
 from cache import DocumentCache
+from sessions import get_session_id
 from logging_config import logger
 
 router = APIRouter()
@@ -45,8 +46,8 @@ def validate_pdf_file(content: bytes, filename: str) -> None:
         )
 
 @router.post("/upload", response_model=UploadResponse)
-async def upload_document(file: UploadFile = File(...)):
-    """Upload and index a PDF document"""
+async def upload_document(file: UploadFile = File(...), session_id: str = Depends(get_session_id)):
+    """Upload and index a PDF document as the session's document"""
     # Read file content for validation
     content = await file.read()
     
@@ -60,17 +61,18 @@ async def upload_document(file: UploadFile = File(...)):
     # Create temp directory if not exists
     TEMP_DIR.mkdir(exist_ok=True)
     
-    file_path = TEMP_DIR / file.filename
+    # Per-session name so concurrent uploads of the same filename don't collide
+    file_path = TEMP_DIR / f"{session_id}-{file.filename}"
     
     # Save validated file locally
     with open(file_path, "wb") as f:
         f.write(content)
     
     try:
-        result = await run_in_threadpool(ingest_pdf, str(file_path), content_hash)
+        result = await run_in_threadpool(ingest_pdf, str(file_path), content_hash, session_id, file.filename)
         
         # Update application state
-        await app_state.set_document(file.filename)
+        await app_state.set_document(file.filename, session_id)
         
         # Prepare response with cache info
         status = "Loaded from Cache" if result.get("cache_hit") else "Uploaded & Indexed"
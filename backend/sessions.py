@@ -0,0 +1,48 @@
+"""
+Session Identification
+Clients pass a session id in the X-Session-ID header; chat history,
+the active document and its FAISS index are all scoped to it.
+Requests without the header share the "default" session.
+"""
+
+import re
+from pathlib import Path
+
+from fastapi import Header, HTTPException
+
+from config import SESSION_STORE_DIR, VECTOR_STORE_PATH
+
+DEFAULT_SESSION = "default"
+SESSION_HEADER = "X-Session-ID"
+
+# Ids become directory names, so only a safe character set is accepted
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def validate_session_id(session_id: str | None) -> str:
+    """
+    Normalize a client-supplied session id.
+
+    Raises:
+        ValueError: If the id has characters outside [A-Za-z0-9_-] or is too long
+    """
+    if not session_id:
+        return DEFAULT_SESSION
+    if not _SESSION_ID_RE.match(session_id):
+        raise ValueError("Invalid session id. Use 1-64 letters, digits, '-' or '_'.")
+    return session_id
+
+
+async def get_session_id(x_session_id: str | None = Header(default=None)) -> str:
+    """FastAPI dependency: the request's session id"""
+    try:
+        return validate_session_id(x_session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def session_store_path(session_id: str) -> Path:
+    """FAISS index directory for a session (the default keeps the legacy path)"""
+    if session_id == DEFAULT_SESSION:
+        return VECTOR_STORE_PATH
+    return SESSION_STORE_DIR / session_id
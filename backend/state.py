@@ -6,7 +6,9 @@ Thread-safe and testable
 
 import asyncio
 from dataclasses import dataclass, field
-from typing import Optional
+from typing import Dict, Optional
+
+from sessions import DEFAULT_SESSION
 
 
 @dataclass
@@ -15,23 +17,29 @@ class AppState:
     Centralized application state
     Replaces scattered global variables
     """
-    active_document_name: Optional[str] = None
+    documents: Dict[str, str] = field(default_factory=dict)  # session id -> active document name
     _lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
 
-    async def set_document(self, filename: Optional[str]):
+    async def set_document(self, filename: Optional[str], session_id: str = DEFAULT_SESSION):
         """Thread-safe document name setter"""
         async with self._lock:
-            self.active_document_name = filename
+            if filename is None:
+                self.documents.pop(session_id, None)
+            else:
+                self.documents[session_id] = filename
 
-    async def get_document(self) -> Optional[str]:
+    async def get_document(self, session_id: str = DEFAULT_SESSION) -> Optional[str]:
         """Thread-safe document name getter"""
         async with self._lock:
-            return self.active_document_name
+            return self.documents.get(session_id)
 
-    async def clear(self):
-        """Reset all state"""
+    async def clear(self, session_id: Optional[str] = None):
+        """Reset one session's state, or all state"""
         async with self._lock:
-            self.active_document_name = None
+            if session_id is None:
+                self.documents.clear()
+            else:
+                self.documents.pop(session_id, None)
 
 
 # Singleton instance
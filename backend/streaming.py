@@ -0,0 +1,150 @@
+"""
+Chat Stream Encoding
+NDJSON frames for the /chat stream without a Pydantic model per token.
+
+Token frames are the hot path (one per LLM chunk), so they are built from a
+precompiled prefix and the C-accelerated JSON string encoder. The rare
+events (sources, timing, error) go through orjson when it is installed and
+compact json.dumps otherwise. Frames have the same shape as
+StreamEvent(...).model_dump_json(): {"type": ..., "data": ...}.
+
+TokenCoalescer optionally merges consecutive tokens into one frame, at most
+one frame per STREAM_COALESCE_MS, to cut per-frame CPU and socket writes
+when many streams are open.
+
+Clients sending "Accept: text/event-stream" get the same frames as
+Server-Sent Events instead (see sse_stream).
+"""
+
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Callable, List, Optional
+
+from config import settings
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+SSE_MEDIA_TYPE = "text/event-stream"
+
+# Keep proxies from caching or buffering event streams
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+try:
+    import orjson
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:  # pragma: no cover - orjson is optional
+    def _dumps(obj) -> str:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+_TOKEN_PREFIX = '{"type":"token","data":'
+_encode_string = json.encoder.encode_basestring  # C implementation when available
+
+
+def token_frame(text: str) -> str:
+    """NDJSON frame for streamed answer text"""
+    return _TOKEN_PREFIX + _encode_string(text) + "}\n"
+
+
+def event_frame(event_type: str, data) -> str:
+    """NDJSON frame for a sources/timing/error event"""
+    return _dumps({"type": event_type, "data": data}) + "\n"
+
+
+class TokenCoalescer:
+    """
+    Merge streamed tokens into fewer frames.
+
+    The first token is sent at once (time to first token is unchanged).
+    Later tokens are buffered until STREAM_COALESCE_MS has passed since the
+    last frame or STREAM_COALESCE_CHARS are waiting. A window of 0 sends
+    every token as its own frame.
+    """
+
+    def __init__(
+        self,
+        window_ms: Optional[float] = None,
+        max_chars: Optional[int] = None,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        window_ms = settings.STREAM_COALESCE_MS if window_ms is None else window_ms
+        self.window = window_ms / 1000
+        self.max_chars = settings.STREAM_COALESCE_CHARS if max_chars is None else max_chars
+        self._clock = clock
+        self._parts: List[str] = []
+        self._chars = 0
+        self._last_frame: Optional[float] = None
+        self.frames = 0
+
+    def push(self, text: str) -> Optional[str]:
+        """Add a token; returns a frame to send now, or None while buffering"""
+        if self.window <= 0:
+            self.frames += 1
+            return token_frame(text)
+        self._parts.append(text)
+        self._chars += len(text)
+        now = self._clock()
+        if self._last_frame is None or now - self._last_frame >= self.window or self._chars >= self.max_chars:
+            self._last_frame = now
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[str]:
+        """Frame for any buffered tokens (call before other events and at the end)"""
+        if not self._parts:
+            return None
+        text = "".join(self._parts)
+        self._parts.clear()
+        self._chars = 0
+        self.frames += 1
+        return token_frame(text)
+
+
+# ============ Server-Sent Events ============
+
+def wants_sse(accept: Optional[str]) -> bool:
+    """True if the client asked for text/event-stream"""
+    return accept is not None and SSE_MEDIA_TYPE in accept
+
+
+async def sse_stream(
+    frames: AsyncIterator[str],
+    heartbeat_seconds: Optional[float] = None,
+    retry_ms: Optional[int] = None,
+    start_id: int = 0,
+) -> AsyncIterator[str]:
+    """
+    Re-frame NDJSON frames as Server-Sent Events.
+
+    Each frame becomes one event whose data is the unchanged JSON object
+    and whose id is its frame number (start_id + 1 onwards, so a resumed
+    stream continues the numbering a client's Last-Event-ID refers to). The stream opens with a reconnect
+    delay (retry) and sends a comment line as heartbeat whenever no event
+    was produced for heartbeat_seconds, so idle connections survive
+    proxies while the LLM is thinking.
+    """
+    heartbeat = settings.SSE_HEARTBEAT_SECONDS if heartbeat_seconds is None else heartbeat_seconds
+    retry = settings.SSE_RETRY_MS if retry_ms is None else retry_ms
+    yield f"retry: {retry}\n\n"
+    
+    iterator = frames.__aiter__()
+    # The pending read is a task so a heartbeat can be sent while it waits
+    pending = asyncio.ensure_future(iterator.__anext__())
+    event_id = start_id
+    try:
+        while True:
+            done, _ = await asyncio.wait({pending}, timeout=heartbeat)
+            if not done:
+                yield ": ping\n\n"
+                continue
+            try:
+                frame = pending.result()
+            except StopAsyncIteration:
+                return
+            event_id += 1
+            yield f"id: {event_id}\ndata: {frame.rstrip()}\n\n"
+            pending = asyncio.ensure_future(iterator.__anext__())
+    finally:
+        if not pending.done():
+            pending.cancel()
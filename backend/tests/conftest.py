@@ -35,12 +35,26 @@ async def app():
     yield app
 
 
+@pytest.fixture(autouse=True)
+def isolated_chat_history(tmp_path, monkeypatch):
+    """
+    Point chat history at a temporary file, so code that reads it in
+    passing (e.g. conversation memory loading a session) never creates
+    backend/chat_history.db. Tests needing the schema call init_db.
+    """
+    import database
+    monkeypatch.setattr(database, "DB_PATH", tmp_path / "chat_history.db")
+
+
 @pytest.fixture
 async def client(app) -> AsyncGenerator[AsyncClient, None]:
     """
     Create an async HTTP client for testing API endpoints.
-    Uses ASGI transport for in-process testing (no network).
+    Uses ASGI transport for in-process testing (no network), with chat
+    history in the temporary database set up by isolated_chat_history.
     """
+    import database
+    await database.init_db()  # The transport does not run the lifespan startup
     transport = ASGITransport(app=app)
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
         yield ac
@@ -80,3 +94,14 @@ def temp_pdf_file(tmp_path: Path, sample_pdf_content: bytes) -> Path:
     pdf_path = tmp_path / "test_document.pdf"
     pdf_path.write_bytes(sample_pdf_content)
     return pdf_path
+
+
+@pytest.fixture(autouse=True)
+async def flush_message_writer(monkeypatch):
+    """
+    Write queued chat messages at the end of each test, while any
+    DB_PATH patched by the test (via monkeypatch) is still in effect.
+    """
+    yield
+    from database import message_writer
+    await message_writer.close()
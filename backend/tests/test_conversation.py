@@ -0,0 +1,245 @@
+"""
+Conversation Memory Tests
+Tests for per-session history, summaries and follow-up query expansion
+"""
+
+from collections import deque
+
+import pytest
+
+
+def _session(turns: int = 3):
+    from conversation import Session
+    return Session(turns=deque(maxlen=turns))
+
+
+class TestQueryExpansion:
+    """Tests for local follow-up query expansion."""
+    
+    def test_follow_up_gets_previous_terms(self):
+        """A short follow-up borrows key terms from the last question."""
+        from conversation import expand_query
+        session = _session()
+        session.add("How do I replace the hydraulic pump filter?", "Remove the cover first.")
+        expanded = expand_query(session, "what about step 3?")
+        assert expanded.startswith("what about step 3?")
+        for term in ("replace", "hydraulic", "pump", "filter"):
+            assert term in expanded
+    
+    def test_self_contained_question_unchanged(self):
+        """Questions without reference cues are not expanded."""
+        from conversation import expand_query
+        session = _session()
+        session.add("How do I replace the hydraulic pump filter?", "Remove the cover first.")
+        question = "What torque is specified for the main rotor blade retaining bolts?"
+        assert expand_query(session, question) == question
+    
+    def test_short_standalone_question_unchanged(self):
+        """A new topic is searched as asked, however few terms it has."""
+        from conversation import expand_query
+        session = _session()
+        session.add("How do I replace the hydraulic filter on the excavator?", "Drain the tank first.")
+        question = "What is the torque specification for the wheel bolts?"
+        assert expand_query(session, question) == question
+        assert expand_query(session, "Where is the fuse box?") == "Where is the fuse box?"
+    
+    @pytest.mark.parametrize("question", [
+        "How tight should it be?",
+        "And the return line?",
+        "Where are those located?",
+        "Why?",
+    ])
+    def test_reference_cues_mark_follow_ups(self, question):
+        """Back-references, continuation openers and bare questions are expanded."""
+        from conversation import expand_query
+        session = _session()
+        session.add("How do I replace the hydraulic filter?", "Drain the tank first.")
+        assert "hydraulic" in expand_query(session, question)
+    
+    def test_new_session_unchanged(self):
+        """Without history there is nothing to expand with."""
+        from conversation import expand_query
+        assert expand_query(_session(), "what about step 3?") == "what about step 3?"
+
+
+class TestHistory:
+    """Tests for the ring, incremental summary and prompt budget."""
+    
+    def test_evicted_turns_are_summarized(self):
+        """Turns leaving the ring survive as one summary line each."""
+        session = _session(turns=2)
+        for i in range(4):
+            session.add(f"Question {i} about valves?", f"Answer {i}. More detail here.")
+        assert [t.question for t in session.turns] == ["Question 2 about valves?", "Question 3 about valves?"]
+        lines = [line for line, _ in session.summary]
+        assert lines == ["- Question 0 about valves? -> Answer 0.", "- Question 1 about valves? -> Answer 1."]
+        assert session.summary_tokens == sum(tokens for _, tokens in session.summary)
+    
+    def test_summary_bounded(self, monkeypatch):
+        """The summary drops its oldest lines beyond the token budget."""
+        from config import settings
+        monkeypatch.setattr(settings, "CONVERSATION_SUMMARY_TOKENS", 30)
+        session = _session(turns=1)
+        for i in range(20):
+            session.add(f"Question {i} about valves?", f"Answer {i}.")
+        assert session.summary_tokens <= 30
+        assert session.summary[-1][0].startswith("- Question 18")
+    
+    def test_history_block_prefers_recent_turns(self):
+        """The newest turns are kept when the budget is tight."""
+        from conversation import history_block
+        session = _session(turns=3)
+        for i in range(3):
+            session.add(f"Question {i}?", "word " * 50)
+        text, tokens = history_block(session, budget=session.turns[-1].tokens + 1)
+        assert "Question 2?" in text and "Question 1?" not in text
+        assert tokens == session.turns[-1].tokens
+        assert history_block(_session(), budget=100) == ("", 0)
+
+
+class TestConversationMemory:
+    """Tests for the session store."""
+    
+    @pytest.fixture
+    def stored_messages(self, monkeypatch):
+        """Replace the database read with a call-counting fake."""
+        import database
+        calls = []
+        
+        async def fake_recent(limit, session_id):
+            calls.append(session_id)
+            return [
+                {"role": "user", "content": "How do I bleed the brakes?"},
+                {"role": "assistant", "content": "Open the bleed valve."},
+                {"role": "user", "content": "Unanswered question"},
+            ]
+        
+        monkeypatch.setattr(database, "get_recent_messages", fake_recent)
+        return calls
+    
+    async def test_loads_from_database_once(self, stored_messages):
+        """Stored turns are replayed on first use only."""
+        from conversation import ConversationMemory
+        memory = ConversationMemory()
+        session = await memory.get("s1")
+        assert [t.question for t in session.turns] == ["How do I bleed the brakes?"]
+        await memory.record("And the clutch?", "Same procedure.", session_id="s1")
+        assert (await memory.get("s1")) is session
+        assert len(session.turns) == 2
+        assert len(stored_messages) == 1
+    
+    async def test_least_recently_used_evicted(self, stored_messages, monkeypatch):
+        """Sessions beyond the limit are dropped oldest first."""
+        from config import settings
+        from conversation import ConversationMemory
+        monkeypatch.setattr(settings, "CONVERSATION_MAX_SESSIONS", 2)
+        memory = ConversationMemory()
+        first = await memory.get("a")
+        await memory.get("b")
+        await memory.get("a")
+        await memory.get("c")
+        assert (await memory.get("a")) is first
+        assert len(stored_messages) == 3
+        await memory.get("b")
+        assert len(stored_messages) == 4  # "b" was evicted and reloaded
+
+    
+    async def test_cold_load_does_not_block_other_sessions(self, monkeypatch):
+        """A slow load holds up only requests for the same session, which share it."""
+        import asyncio
+        import database
+        from conversation import ConversationMemory
+        release = asyncio.Event()
+        calls = []
+        
+        async def slow_recent(limit, session_id):
+            calls.append(session_id)
+            if session_id == "cold":
+                await release.wait()
+            return []
+        
+        monkeypatch.setattr(database, "get_recent_messages", slow_recent)
+        memory = ConversationMemory()
+        await memory.get("warm")
+        cold = [asyncio.create_task(memory.get("cold")) for _ in range(3)]
+        await asyncio.sleep(0)
+        await asyncio.wait_for(memory.get("warm"), timeout=1)
+        assert not any(task.done() for task in cold)
+        release.set()
+        sessions = await asyncio.gather(*cold)
+        assert all(session is sessions[0] for session in sessions)
+        assert calls == ["warm", "cold"]
+    
+    async def test_clear_during_load_not_overwritten(self, monkeypatch):
+        """History cleared while a session loads is not brought back by the load."""
+        import asyncio
+        import database
+        from conversation import ConversationMemory
+        release = asyncio.Event()
+        
+        async def slow_recent(limit, session_id):
+            await release.wait()
+            return [
+                {"role": "user", "content": "How do I bleed the brakes?"},
+                {"role": "assistant", "content": "Open the bleed valve."},
+            ]
+        
+        monkeypatch.setattr(database, "get_recent_messages", slow_recent)
+        memory = ConversationMemory()
+        loading = asyncio.create_task(memory.get("s1"))
+        await asyncio.sleep(0)
+        await memory.clear("s1")
+        release.set()
+        await loading
+        assert "s1" not in memory._sessions
+
+
+class FakeVectorStore:
+    """Vector store stub recording search queries."""
+    
+    def __init__(self):
+        self.queries = []
+    
+    def similarity_search_with_score(self, query, k=7, timings=None):
+        from langchain_core.documents import Document
+        self.queries.append(query)
+        return [(Document(page_content="Step 3: tighten the bolts.", metadata={"page": 2}, id="chunk-1"), 0.87)]
+
+
+class TestConversationalChat:
+    """Tests for history-aware generation."""
+    
+    async def test_follow_up_uses_history(self, monkeypatch):
+        """The second question retrieves with expanded terms and sees the first turn."""
+        import json
+        import rag
+        from conversation import ConversationMemory
+        from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+        from langchain_core.messages import AIMessage
+        
+        async def no_messages(limit, session_id):
+            return []
+        
+        import database
+        monkeypatch.setattr(database, "get_recent_messages", no_messages)
+        memory = ConversationMemory()
+        store = FakeVectorStore()
+        prompts = []
+        
+        class RecordingModel(GenericFakeChatModel):
+            def _stream(self, messages, *args, **kwargs):
+                prompts.append(messages[0].content)
+                return super()._stream(messages, *args, **kwargs)
+        
+        monkeypatch.setattr(rag, "conversation_memory", memory)
+        monkeypatch.setattr(rag.vector_stores, "default", store)
+        monkeypatch.setattr(rag, "get_llm", lambda: RecordingModel(messages=iter([AIMessage(content="Use a torque wrench.")])))
+        
+        await memory.record("How do I tighten the flywheel bolts?", "Use a star pattern.")
+        events = [json.loads(line) async for line in rag.generate_chat_response("what about step 3?")]
+        
+        assert "flywheel" in store.queries[0]
+        assert "User: How do I tighten the flywheel bolts?" in prompts[0]
+        timing = events[-1]["data"]
+        assert timing["query_expanded"] is True
+        assert timing["history_tokens"] > 0
@@ -0,0 +1,377 @@
+"""
+Chat History Database Tests
+Tests for write-behind message persistence
+"""
+
+import asyncio
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+async def db(tmp_path, monkeypatch):
+    """Fresh database file."""
+    import database
+    monkeypatch.setattr(database, "DB_PATH", tmp_path / "chat.db")
+    await database.init_db()
+    return database
+
+
+def _stored(database):
+    """Rows as committed on disk, bypassing the writer."""
+    with sqlite3.connect(database.DB_PATH) as conn:
+        return conn.execute("SELECT session_id, role, content FROM messages ORDER BY id").fetchall()
+
+
+def _query(database, sql, params=()):
+    """Run a query on the committed database file."""
+    with sqlite3.connect(database.DB_PATH) as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+class TestMessageWriter:
+    """Tests for the write-behind message queue."""
+    
+    async def test_add_returns_before_writing(self, db):
+        """add_message queues the row; the background task commits it shortly after."""
+        from database import MessageWriter
+        writer = MessageWriter(flush_ms=20, batch_size=100)
+        writer.add("user", "hello")
+        assert _stored(db) == []
+        assert len(writer) == 1
+        await asyncio.sleep(0.1)
+        assert _stored(db) == [("default", "user", "hello")]
+        await writer.close()
+    
+    async def test_full_batch_written_early(self, db):
+        """Reaching the batch size flushes without waiting for the interval."""
+        from database import MessageWriter
+        writer = MessageWriter(flush_ms=10_000, batch_size=3)
+        for i in range(3):
+            writer.add("user", f"m{i}")
+        await asyncio.sleep(0.1)
+        assert len(_stored(db)) == 3
+        await writer.close()
+    
+    async def test_batch_is_one_transaction_in_order(self, db):
+        """A flush writes every queued row, in queue order, with one commit."""
+        from database import MessageWriter
+        from metrics import DB_WRITE_SECONDS
+        writer = MessageWriter(flush_ms=10_000, batch_size=1000)
+        before = DB_WRITE_SECONDS.count(operation="flush_messages")
+        for i in range(20):
+            writer.add("user" if i % 2 == 0 else "assistant", f"m{i}", "a" if i % 3 else "b")
+        assert await writer.flush() == 20
+        assert DB_WRITE_SECONDS.count(operation="flush_messages") == before + 1
+        assert [row[2] for row in _stored(db)] == [f"m{i}" for i in range(20)]
+        await writer.close()
+    
+    async def test_reads_see_queued_messages(self, db):
+        """History reads flush first, so a write is visible immediately."""
+        await db.add_message("user", "question", "s1")
+        await db.add_message("assistant", "answer", "s1")
+        assert await db.get_history("s1") == [
+            {"role": "user", "content": "question"},
+            {"role": "assistant", "content": "answer"},
+        ]
+    
+    async def test_clear_includes_queued_messages(self, db):
+        """Messages queued before a clear are cleared too."""
+        await db.add_message("user", "old", "s1")
+        await db.clear_messages("s1")
+        await db.add_message("user", "new", "s1")
+        assert await db.get_history("s1") == [{"role": "user", "content": "new"}]
+    
+    async def test_failed_flush_keeps_order(self, db, tmp_path, monkeypatch):
+        """A batch that fails to write is retried ahead of newer messages."""
+        from database import MessageWriter
+        writer = MessageWriter(flush_ms=10_000, batch_size=1000)
+        good_path = db.DB_PATH
+        monkeypatch.setattr(db, "DB_PATH", tmp_path)  # A directory: connect fails
+        writer.add("user", "first")
+        with pytest.raises(Exception):
+            await writer.flush()
+        assert len(writer) == 1
+        
+        monkeypatch.setattr(db, "DB_PATH", good_path)
+        writer.add("user", "second")
+        await writer.close()
+        assert [row[2] for row in _stored(db)] == ["first", "second"]
+    
+    async def test_close_during_flush_keeps_batch(self, db, monkeypatch):
+        """Shutting down while the task is mid-flush waits for the batch instead of dropping it."""
+        from database import MessageWriter
+        insert = db._insert_message
+        started = asyncio.Event()
+        
+        async def slow_insert(conn, row, sources):
+            started.set()
+            await asyncio.sleep(0.05)
+            await insert(conn, row, sources)
+        
+        monkeypatch.setattr(db, "_insert_message", slow_insert)
+        writer = MessageWriter(flush_ms=10_000, batch_size=2)
+        writer.add("user", "q")
+        writer.add("assistant", "a")
+        await started.wait()
+        await writer.close()
+        assert [row[2] for row in _stored(db)] == ["q", "a"]
+    
+    async def test_cancelled_flush_requeues_batch(self, db, monkeypatch):
+        """A flush cancelled before its commit puts the batch back exactly once."""
+        from database import MessageWriter
+        insert = db._insert_message
+        started = asyncio.Event()
+        
+        async def slow_insert(conn, row, sources):
+            started.set()
+            await asyncio.sleep(0.05)
+            await insert(conn, row, sources)
+        
+        writer = MessageWriter(flush_ms=10_000, batch_size=1000)
+        writer.add("user", "first")
+        monkeypatch.setattr(db, "_insert_message", slow_insert)
+        flushing = asyncio.create_task(writer.flush())
+        await started.wait()
+        flushing.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await flushing
+        assert len(writer) == 1
+        
+        monkeypatch.setattr(db, "_insert_message", insert)
+        await writer.close()
+        assert [row[2] for row in _stored(db)] == ["first"]
+    
+    async def test_direct_writes_when_disabled(self, db, monkeypatch):
+        """MESSAGE_WRITE_BEHIND=False commits each message before returning."""
+        from config import settings
+        monkeypatch.setattr(settings, "MESSAGE_WRITE_BEHIND", False)
+        await db.add_message("user", "now")
+        assert _stored(db) == [("default", "user", "now")]
+
+
+class TestHistorySearch:
+    """Tests for full-text search over chat history."""
+    
+    async def _seed(self, db):
+        await db.add_message("user", "How do I replace the brake pads?", "s1")
+        await db.add_message("assistant", "Remove the caliper, then slide out the old brake pads.", "s1")
+        await db.add_message("user", "What oil does the engine take?", "s1")
+        await db.add_message("assistant", "Use 5W-30 synthetic oil.", "s1")
+        await db.add_message("user", "Brake fluid type?", "s2")
+    
+    async def test_ranked_and_stemmed(self, db):
+        """Stemmed matches are found and better matches rank first."""
+        await self._seed(db)
+        page = await db.search_messages("brake pad", "s1")
+        assert page["total"] == 2
+        assert page["results"][0]["score"] <= page["results"][1]["score"]
+        assert all("brake" in hit["content"].lower() for hit in page["results"])
+    
+    async def test_scoped_to_session(self, db):
+        """Other sessions' messages are never returned."""
+        await self._seed(db)
+        page = await db.search_messages("brake", "s2")
+        assert [hit["content"] for hit in page["results"]] == ["Brake fluid type?"]
+    
+    async def test_session_ids_are_not_stemmed(self, db):
+        """Sessions whose ids share a stem do not count each other's hits."""
+        await db.add_message("user", "brake noise when running", "running")
+        await db.add_message("user", "brake pads worn", "run")
+        page = await db.search_messages("brake", "run")
+        assert page["total"] == 1 and not page["has_more"]
+        assert [hit["content"] for hit in page["results"]] == ["brake pads worn"]
+    
+    @pytest.mark.parametrize("session_column", ["session_id", "session_id UNINDEXED"])
+    async def test_older_index_layouts_rebuilt(self, db, session_column):
+        """Indexes storing raw session ids (stemmed or unindexed) are recreated by init_db."""
+        with sqlite3.connect(db.DB_PATH) as conn:
+            for trigger in ("insert", "delete", "update"):
+                conn.execute(f"DROP TRIGGER messages_fts_{trigger}")
+            conn.execute("DROP TABLE messages_fts")
+            conn.execute(
+                f"CREATE VIRTUAL TABLE messages_fts USING fts5(content, {session_column}, "
+                "content='messages', content_rowid='id', tokenize='porter unicode61')"
+            )
+            conn.execute(
+                "CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN "
+                "INSERT INTO messages_fts (rowid, content, session_id) VALUES (new.id, new.content, new.session_id); END"
+            )
+            conn.execute("INSERT INTO messages (session_id, role, content) VALUES ('run', 'user', 'clutch slips')")
+        await db.init_db()
+        with sqlite3.connect(db.DB_PATH) as conn:
+            trigger = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'messages_fts_insert'").fetchone()[0]
+        assert "hex(new.session_id)" in trigger
+        assert (await db.search_messages("clutch", "run"))["total"] == 1
+        assert (await db.search_messages("clutch", "running"))["total"] == 0
+    
+    async def test_match_scoped_in_index(self, db):
+        """With many sessions, MATCH itself yields only the searched session's messages."""
+        for i in range(200):
+            for j in range(3):
+                await db.add_message("user", f"brake caliper check {j}", f"fleet-{i}")
+        page = await db.search_messages("brake caliper", "fleet-42")
+        assert page["total"] == 3
+        assert {hit["id"] for hit in page["results"]} == {
+            row[0] for row in _query(db, "SELECT id FROM messages WHERE session_id = 'fleet-42'")
+        }
+        # The session filter is part of the FTS query, not a join afterwards
+        match = db._fts_query("brake", "fleet-42")
+        assert _query(db, "SELECT COUNT(*) FROM messages_fts WHERE messages_fts MATCH ?", (match,)) == [(3,)]
+    
+    async def test_highlight_is_escaped(self, db):
+        """Snippets mark matches and escape stored HTML."""
+        await db.add_message("user", "<b>torque</b> spec for wheel nuts", "s1")
+        [hit] = (await db.search_messages("torque", "s1"))["results"]
+        assert hit["snippet"].startswith("&lt;b&gt;<mark>torque</mark>&lt;/b&gt;")
+    
+    async def test_pagination(self, db):
+        """limit/offset page through the ranked results."""
+        for i in range(5):
+            await db.add_message("user", f"gearbox question {i}", "s1")
+        first = await db.search_messages("gearbox", "s1", limit=2)
+        last = await db.search_messages("gearbox", "s1", limit=2, offset=4)
+        assert first["total"] == 5 and first["has_more"]
+        assert len(last["results"]) == 1 and not last["has_more"]
+    
+    async def test_operators_taken_literally(self, db):
+        """FTS5 syntax in the query cannot cause errors."""
+        await self._seed(db)
+        page = await db.search_messages('synthetic" oil* -(', "s1")
+        assert page["total"] == 1
+        with pytest.raises(ValueError):
+            await db.search_messages("?!", "s1")
+    
+    async def test_index_follows_deletes(self, db):
+        """Cleared messages disappear from search."""
+        await self._seed(db)
+        await db.clear_messages("s1")
+        assert (await db.search_messages("brake", "s1"))["total"] == 0
+    
+    async def test_existing_messages_indexed_on_upgrade(self, db):
+        """Messages stored before search existed are indexed by init_db."""
+        with sqlite3.connect(db.DB_PATH) as conn:
+            for trigger in ("insert", "delete", "update"):
+                conn.execute(f"DROP TRIGGER messages_fts_{trigger}")
+            conn.execute("DROP TABLE messages_fts")
+            conn.execute("INSERT INTO messages (session_id, role, content) VALUES ('s1', 'user', 'legacy clutch note')")
+        await db.init_db()
+        assert (await db.search_messages("clutch", "s1"))["total"] == 1
+    
+    async def test_search_endpoint(self, client):
+        """GET /history/search returns the session's ranked hits."""
+        from database import add_message
+        await add_message("user", "Where is the spark plug gap listed?", "searcher")
+        response = await client.get(
+            "/history/search", params={"q": "spark plug"}, headers={"X-Session-ID": "searcher"}
+        )
+        assert response.status_code == 200
+        assert response.json()["results"][0]["snippet"].count("<mark>") == 2
+        bad = await client.get("/history/search", params={"q": "!!"}, headers={"X-Session-ID": "searcher"})
+        assert bad.status_code == 400
+
+
+SOURCES = [
+    {"page": 3, "preview": "Step 3: tighten...", "chunk_id": "c-1", "score": 0.91},
+    {"page": 7, "preview": "Torque table...", "chunk_id": "c-2", "score": 0.74},
+]
+
+
+class TestMessageSources:
+    """Tests for retrieval provenance stored with answers."""
+    
+    async def test_sources_returned_with_history(self, db):
+        """Answers come back with their sources, in retrieval order."""
+        await db.add_message("user", "How tight?", "s1")
+        await db.add_message("assistant", "Very tight.", "s1", sources=SOURCES)
+        history = await db.get_history("s1")
+        assert history[0] == {"role": "user", "content": "How tight?"}
+        assert history[1]["sources"] == SOURCES
+    
+    async def test_paginated_history_includes_sources(self, db):
+        """The paginated view carries sources alongside timestamps."""
+        await db.add_message("user", "q1", "s1")
+        await db.add_message("assistant", "a1", "s1", sources=SOURCES[:1])
+        await db.add_message("user", "q2", "s1")
+        page = await db.get_history_paginated(limit=2, offset=1, session_id="s1")
+        assert [m["content"] for m in page["messages"]] == ["q1", "a1"]
+        assert page["messages"][1]["sources"] == SOURCES[:1]
+        assert "timestamp" in page["messages"][1]
+    
+    async def test_history_is_one_query(self, db, monkeypatch):
+        """Messages and sources are read with a single statement, not one per message."""
+        import aiosqlite
+        for i in range(5):
+            await db.add_message("assistant", f"a{i}", "s1", sources=SOURCES)
+        await db.message_writer.flush()
+        
+        statements = []
+        original = aiosqlite.Connection.execute
+        
+        def counting_execute(self, sql, *args, **kwargs):
+            statements.append(sql)
+            return original(self, sql, *args, **kwargs)
+        
+        monkeypatch.setattr(aiosqlite.Connection, "execute", counting_execute)
+        history = await db.get_history("s1")
+        assert len(history) == 5 and all(len(m["sources"]) == 2 for m in history)
+        assert len(statements) == 1
+    
+    async def test_sources_deleted_with_messages(self, db):
+        """Clearing a session removes its stored sources."""
+        await db.add_message("assistant", "a", "s1", sources=SOURCES)
+        await db.clear_messages("s1")
+        with sqlite3.connect(db.DB_PATH) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM message_sources").fetchone()[0] == 0
+    
+    async def test_direct_write_stores_sources(self, db, monkeypatch):
+        """Sources are stored without the write-behind queue too."""
+        from config import settings
+        monkeypatch.setattr(settings, "MESSAGE_WRITE_BEHIND", False)
+        await db.add_message("assistant", "a", "s1", sources=SOURCES)
+        assert (await db.get_history("s1"))[0]["sources"] == SOURCES
+    
+    async def test_chat_answer_keeps_sources(self, client, monkeypatch):
+        """A /chat answer is stored with the sources that were streamed."""
+        import json
+        import rag
+        from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+        from langchain_core.messages import AIMessage
+        from tests.test_rag import FakeVectorStore
+        
+        monkeypatch.setattr(rag.vector_stores, "default", FakeVectorStore())
+        monkeypatch.setattr(
+            rag, "get_llm", lambda: GenericFakeChatModel(messages=iter([AIMessage(content="Tighten them.")]))
+        )
+        await client.post("/clear_chat")
+        response = await client.post("/chat", json={"question": "What is step 3?"})
+        streamed = json.loads(response.text.splitlines()[0])["data"]
+        
+        history = (await client.get("/history")).json()
+        assert history[1]["sources"] == streamed
+        assert streamed[0]["chunk_id"] == "chunk-1" and streamed[0]["score"] == 0.87
+    
+    async def test_ingested_chunks_stored_with_ids(self, client, monkeypatch, tmp_path):
+        """Chunks from the real ingestion path give every stored source a chunk_id."""
+        import rag
+        from benchmarks.pdfgen import generate_pdf
+        from embeddings import HashingEmbeddings
+        from ingestion import stream_ingest
+        from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+        from langchain_core.messages import AIMessage
+        from vector_store import FAISSVectorStore
+        
+        pdf = generate_pdf(tmp_path / "manual.pdf", pages=3)
+        store = FAISSVectorStore(tmp_path / "index")
+        store._vectorstore, _ = stream_ingest(str(pdf), HashingEmbeddings(dimension=64))
+        monkeypatch.setattr(rag.vector_stores, "default", store)
+        monkeypatch.setattr(
+            rag, "get_llm", lambda: GenericFakeChatModel(messages=iter([AIMessage(content="Tighten them.")]))
+        )
+        await client.post("/clear_chat")
+        await client.post("/chat", json={"question": "What is step 3?"})
+        
+        sources = (await client.get("/history")).json()[1]["sources"]
+        docstore_ids = set(store._vectorstore.index_to_docstore_id.values())
+        assert sources and all(source["chunk_id"] in docstore_ids for source in sources)
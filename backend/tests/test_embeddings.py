@@ -0,0 +1,99 @@
+"""
+Embedding Provider Tests
+Tests for the provider registry and the CPU-local hashing embeddings
+"""
+
+import numpy as np
+import pytest
+
+
+class TestHashingEmbeddings:
+    """Tests for the local feature-hashing provider."""
+    
+    def test_dimension_and_unit_norm(self):
+        """Vectors should have the configured size and unit length."""
+        from embeddings import HashingEmbeddings
+        embeddings = HashingEmbeddings(dimension=64)
+        vectors = np.array(embeddings.embed_documents(["pump pressure", "valve torque"]))
+        assert vectors.shape == (2, 64)
+        assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-5)
+    
+    def test_deterministic_across_instances(self):
+        """Separate instances must agree so cached indexes stay valid."""
+        from embeddings import HashingEmbeddings
+        a = HashingEmbeddings(dimension=128).embed_query("replace the filter")
+        b = HashingEmbeddings(dimension=128).embed_query("replace the filter")
+        assert a == b
+    
+    def test_feature_cache_bounded(self):
+        """Hashed grams are cached up to FEATURE_CACHE_SIZE, not without limit."""
+        from embeddings import FEATURE_CACHE_SIZE, HashingEmbeddings, _signed_code
+        texts = [f"part{i} serial{i}" for i in range(FEATURE_CACHE_SIZE // 2)]
+        HashingEmbeddings(dimension=32).embed_documents(texts)
+        assert _signed_code.cache_info().currsize <= FEATURE_CACHE_SIZE
+    
+    def test_related_texts_score_higher(self):
+        """Texts sharing words should be closer than unrelated texts."""
+        from embeddings import HashingEmbeddings
+        embeddings = HashingEmbeddings(dimension=256)
+        query = np.array(embeddings.embed_query("how to replace the pump filter"))
+        related = np.array(embeddings.embed_query("replace the pump filter every month"))
+        unrelated = np.array(embeddings.embed_query("firmware network latency"))
+        assert query @ related > query @ unrelated
+    
+    def test_batches_match_single_embedding(self):
+        """Batched multi-threaded embedding should equal one-by-one results."""
+        from embeddings import HashingEmbeddings
+        embeddings = HashingEmbeddings(dimension=64, batch_size=3, max_workers=2)
+        texts = [f"section {i} torque bolt" for i in range(10)] + [""]
+        batched = embeddings.embed_array(texts)
+        single = np.array([embeddings.embed_query(text) for text in texts])
+        assert np.allclose(batched, single)
+        assert not batched[-1].any()
+
+
+class TestNormalizedEmbeddings:
+    """Tests for the unit-length wrapper used by cosine indexes."""
+    
+    def test_outputs_unit_vectors(self):
+        """Documents and queries should come back with unit length."""
+        from langchain_core.embeddings import FakeEmbeddings
+        from embeddings import NormalizedEmbeddings
+        embeddings = NormalizedEmbeddings(FakeEmbeddings(size=16))
+        vectors = np.array(embeddings.embed_documents(["a", "b", "c"]))
+        query = np.array(embeddings.embed_query("q"))
+        assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-5)
+        assert np.linalg.norm(query) == pytest.approx(1.0, abs=1e-5)
+    
+    def test_wrapping_is_idempotent(self):
+        """Wrapping twice should not nest."""
+        from embeddings import HashingEmbeddings, normalized
+        wrapped = normalized(HashingEmbeddings(dimension=32))
+        assert normalized(wrapped) is wrapped
+        assert wrapped.dimension == 32
+
+
+class TestEmbeddingRegistry:
+    """Tests for provider selection."""
+    
+    def test_unknown_provider_rejected(self):
+        """Unknown provider names should raise a clear error."""
+        from embeddings import get_embeddings
+        with pytest.raises(ValueError, match="Unknown embedding provider"):
+            get_embeddings("does-not-exist")
+    
+    def test_instances_are_shared(self):
+        """The same provider should return the same instance."""
+        from embeddings import get_embeddings
+        assert get_embeddings("local") is get_embeddings("local")
+    
+    def test_dimension_comes_from_provider(self):
+        """Dimension lookup should use the provider's declared size."""
+        from config import EMBEDDING_DIMENSION
+        from embeddings import get_embeddings, get_embedding_dimension
+        assert get_embedding_dimension(get_embeddings("local")) == EMBEDDING_DIMENSION
+    
+    def test_signatures_differ_between_providers(self):
+        """Caches for different providers must not collide."""
+        from embeddings import embedding_signature
+        assert embedding_signature("google") != embedding_signature("local")
@@ -0,0 +1,319 @@
+"""
+Resumable Generation Tests
+Tests for background generation, replay buffers and stream reconnects
+"""
+
+import asyncio
+import json
+
+import pytest
+from httpx import AsyncClient
+
+
+async def _source(*frames, delay: float = 0.0):
+    for frame in frames:
+        if delay:
+            await asyncio.sleep(delay)
+        yield frame
+
+
+async def _collect(iterator, limit=None):
+    out = []
+    async for item in iterator:
+        out.append(item)
+        if limit is not None and len(out) == limit:
+            break
+    return out
+
+
+class TestGeneration:
+    """Tests for the per-generation ring buffer."""
+    
+    async def test_subscriber_gets_every_frame(self):
+        """A live subscriber follows the producer to the end."""
+        from generations import GenerationRegistry
+        generation = GenerationRegistry(capacity=10).start("s", _source("a\n", "b\n", "c\n", delay=0.01))
+        assert await _collect(generation.subscribe()) == ["a\n", "b\n", "c\n"]
+        assert generation.done
+    
+    async def test_resume_from_offset(self):
+        """A reconnect with an offset continues after the frames already read."""
+        from generations import GenerationRegistry
+        generation = GenerationRegistry(capacity=10).start("s", _source("a\n", "b\n", "c\n", "d\n", delay=0.01))
+        first = await _collect(generation.subscribe(), limit=2)
+        assert first == ["a\n", "b\n"]
+        assert await _collect(generation.subscribe(offset=2)) == ["c\n", "d\n"]
+    
+    async def test_generation_survives_disconnect(self):
+        """Producing continues with nobody listening."""
+        from generations import GenerationRegistry
+        generation = GenerationRegistry(capacity=10).start("s", _source(*"abcde", delay=0.005))
+        subscription = generation.subscribe()
+        await _collect(subscription, limit=1)
+        await subscription.aclose()
+        await asyncio.wait_for(generation._task, timeout=1)
+        assert generation.total == 5
+        assert await _collect(generation.subscribe(offset=4)) == ["e"]
+    
+    async def test_ring_buffer_bounds_resume(self):
+        """Offsets older than the buffer cannot be resumed."""
+        from generations import GenerationRegistry
+        generation = GenerationRegistry(capacity=3).start("s", _source(*"abcde"))
+        await generation._task
+        assert generation.first_buffered == 3
+        assert not generation.can_resume(0)
+        assert generation.can_resume(2)
+        assert not generation.can_resume(6)
+        assert await _collect(generation.subscribe(offset=2)) == ["c", "d", "e"]
+        [frame] = await _collect(generation.subscribe(offset=0))
+        assert json.loads(frame)["type"] == "error"
+    
+    async def test_producer_error_becomes_error_frame(self):
+        """A failing source ends the generation with an error frame."""
+        from generations import GenerationRegistry
+        
+        async def failing():
+            yield "a\n"
+            raise RuntimeError("boom")
+        
+        generation = GenerationRegistry(capacity=10).start("s", failing())
+        frames = await _collect(generation.subscribe())
+        assert frames[0] == "a\n"
+        assert json.loads(frames[1])["type"] == "error"
+    
+    async def test_finished_generations_expire(self):
+        """Completed generations are swept after the TTL."""
+        from generations import GenerationRegistry
+        registry = GenerationRegistry(capacity=10, ttl_seconds=60)
+        generation = registry.start("s", _source("a"))
+        running = registry.start("s", _source("b", delay=10))
+        await generation._task
+        assert registry.sweep(now=generation.finished_at + 30) == 0
+        assert registry.sweep(now=generation.finished_at + 61) == 1
+        assert registry.get(generation.id) is None
+        assert registry.get(running.id) is running
+        running._task.cancel()
+    
+    async def test_expiry_without_traffic(self):
+        """An idle registry still drops finished generations once their TTL passes."""
+        from generations import GenerationRegistry
+        registry = GenerationRegistry(capacity=10, ttl_seconds=0.2)
+        first = registry.start("s", _source("a"))
+        second = registry.start("s", _source("b", delay=0.1))
+        await asyncio.gather(first._task, second._task)
+        assert len(registry) == 2
+        await asyncio.sleep(0.15)
+        assert list(registry._generations) == [second.id]
+        await asyncio.sleep(0.15)
+        assert len(registry) == 0
+
+
+class TestResumeEndpoint:
+    """Tests for GET /chat/{generation_id}/stream."""
+    
+    @pytest.fixture
+    def fake_pipeline(self, monkeypatch):
+        """Local retrieval and LLM so /chat streams several frames."""
+        import rag
+        from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+        from langchain_core.messages import AIMessage
+        from tests.test_rag import FakeVectorStore
+        
+        monkeypatch.setattr(rag.vector_stores, "default", FakeVectorStore())
+        monkeypatch.setattr(
+            rag, "get_llm",
+            lambda: GenericFakeChatModel(messages=iter([AIMessage(content="Tighten the bolts firmly.")])),
+        )
+    
+    async def test_resume_replays_remaining_frames(self, client: AsyncClient, fake_pipeline):
+        """Reconnecting with an offset returns exactly the frames after it."""
+        response = await client.post("/chat", json={"question": "What is step 3?"})
+        generation_id = response.headers["x-generation-id"]
+        lines = response.text.splitlines()
+        
+        resumed = await client.get(f"/chat/{generation_id}/stream", params={"offset": 2})
+        assert resumed.status_code == 200
+        assert resumed.text.splitlines() == lines[2:]
+    
+    async def test_sse_resume_uses_last_event_id(self, client: AsyncClient, fake_pipeline):
+        """SSE clients resume from Last-Event-ID with continued numbering."""
+        response = await client.post("/chat", json={"question": "What is step 3?"})
+        generation_id = response.headers["x-generation-id"]
+        total = len(response.text.splitlines())
+        
+        resumed = await client.get(
+            f"/chat/{generation_id}/stream",
+            headers={"Accept": "text/event-stream", "Last-Event-ID": "1"},
+        )
+        ids = [line for line in resumed.text.splitlines() if line.startswith("id: ")]
+        assert ids == [f"id: {n}" for n in range(2, total + 1)]
+    
+    async def test_other_session_cannot_resume(self, client: AsyncClient, fake_pipeline):
+        """Generations are only visible to the session that started them."""
+        response = await client.post("/chat", json={"question": "What is step 3?"})
+        generation_id = response.headers["x-generation-id"]
+        other = await client.get(f"/chat/{generation_id}/stream", headers={"X-Session-ID": "intruder"})
+        assert other.status_code == 404
+        assert (await client.get("/chat/unknown/stream")).status_code == 404
+    
+    async def test_offset_beyond_stream_rejected(self, client: AsyncClient, fake_pipeline):
+        """Offsets past the produced frames are gone, not silently empty."""
+        response = await client.post("/chat", json={"question": "What is step 3?"})
+        generation_id = response.headers["x-generation-id"]
+        resumed = await client.get(f"/chat/{generation_id}/stream", params={"offset": 999})
+        assert resumed.status_code == 410
+
+
+class TestAbandonment:
+    """Tests for cancelling generations nobody is reading."""
+    
+    async def test_abandoned_generation_is_cancelled(self):
+        """The producer is cancelled once the last subscriber has been gone long enough."""
+        from generations import GenerationRegistry
+        closed = asyncio.Event()
+        
+        async def endless():
+            try:
+                while True:
+                    await asyncio.sleep(0.005)
+                    yield "x\n"
+            finally:
+                closed.set()
+        
+        generation = GenerationRegistry(capacity=10, abandon_seconds=0.02).start("s", endless())
+        subscription = generation.subscribe()
+        await _collect(subscription, limit=1)
+        await subscription.aclose()
+        await asyncio.wait_for(generation._task, timeout=1)
+        
+        assert generation.cancelled and generation.done
+        assert closed.is_set()
+        assert json.loads(generation.frames[-1])["type"] == "error"
+    
+    async def test_reattaching_within_grace_keeps_generating(self):
+        """A client that reconnects before the grace period ends keeps its answer."""
+        from generations import GenerationRegistry
+        generation = GenerationRegistry(capacity=10, abandon_seconds=0.05).start(
+            "s", _source(*"abcdef", delay=0.02)
+        )
+        subscription = generation.subscribe()
+        await _collect(subscription, limit=1)
+        await subscription.aclose()
+        rest = await _collect(generation.subscribe(offset=1))
+        assert rest == list("bcdef")
+        assert not generation.cancelled
+    
+    async def test_disconnected_client_ends_subscription(self):
+        """Subscriptions notice a gone client even while no frames arrive."""
+        from generations import GenerationRegistry
+        generation = GenerationRegistry(capacity=10, abandon_seconds=60).start("s", _source("a", delay=10))
+        
+        async def is_disconnected():
+            return True
+        
+        frames = await asyncio.wait_for(
+            _collect(generation.subscribe(is_disconnected=is_disconnected, poll_seconds=0.01)), timeout=1
+        )
+        assert frames == []
+        assert generation.subscribers == 0
+        generation._task.cancel()
+
+
+class TestCancellation:
+    """Tests for cancelling the RAG pipeline mid-answer."""
+    
+    @pytest.fixture
+    def slow_pipeline(self, monkeypatch):
+        """LLM that streams one token every 10ms."""
+        import rag
+        from langchain_core.messages import AIMessageChunk
+        from langchain_core.runnables import RunnableGenerator
+        from tests.test_rag import FakeVectorStore
+        
+        async def slow_llm(prompts):
+            async for _ in prompts:
+                pass
+            for word in ["Tighten ", "the ", "bolts ", "firmly ", "and ", "check ", "again."] * 10:
+                await asyncio.sleep(0.01)
+                yield AIMessageChunk(content=word)
+        
+        monkeypatch.setattr(rag.vector_stores, "default", FakeVectorStore())
+        monkeypatch.setattr(rag, "get_llm", lambda: RunnableGenerator(slow_llm))
+    
+    async def test_cancel_stops_stream_and_counts_abandoned_tokens(self, slow_pipeline):
+        """Cancelling stops the LLM stream and records what was spent."""
+        from metrics import ABANDONED_TOKENS, CHAT_REQUESTS
+        from rag import generate_chat_response
+        cancelled_before = CHAT_REQUESTS.value(outcome="cancelled")
+        completion_before = ABANDONED_TOKENS.value(kind="completion")
+        prompt_before = ABANDONED_TOKENS.value(kind="prompt")
+        parts = []
+        
+        async def consume():
+            async for _ in generate_chat_response("What is step 3?", answer_parts=parts):
+                pass
+        
+        task = asyncio.create_task(consume())
+        while len(parts) < 3:
+            await asyncio.sleep(0.005)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        
+        assert len(parts) < 70
+        assert CHAT_REQUESTS.value(outcome="cancelled") == cancelled_before + 1
+        assert ABANDONED_TOKENS.value(kind="completion") > completion_before
+        assert ABANDONED_TOKENS.value(kind="prompt") > prompt_before
+    
+    async def test_abandoned_answer_saved_as_truncated(self, slow_pipeline, tmp_path, monkeypatch):
+        """The partial answer is persisted with a truncated flag."""
+        import database
+        from config import settings
+        from generations import generations
+        from models import ChatRequest
+        from routers.chat import chat
+        from starlette.requests import Request
+        
+        monkeypatch.setattr(database, "DB_PATH", tmp_path / "chat.db")
+        monkeypatch.setattr(settings, "GENERATION_ABANDON_SECONDS", 0.05)
+        await database.init_db()
+        
+        # The response is never read, as if the client left right away
+        request = Request({"type": "http", "method": "POST", "headers": [], "query_string": b""})
+        response = await chat(ChatRequest(question="What is step 3?"), request, "default")
+        generation = generations.get(response.headers["x-generation-id"])
+        await asyncio.wait_for(generation._task, timeout=2)
+        
+        assert generation.cancelled
+        history = await database.get_history()
+        assert history[0] == {"role": "user", "content": "What is step 3?"}
+        assert history[1]["role"] == "assistant"
+        assert history[1]["truncated"] is True
+        assert history[1]["content"].startswith("Tighten")
+    
+    async def test_shutdown_saves_running_answers(self, slow_pipeline, tmp_path, monkeypatch):
+        """App shutdown cancels live generations and their partial answers are written."""
+        import database
+        import main
+        from generations import generations
+        from models import ChatRequest
+        from routers.chat import chat
+        from starlette.requests import Request
+        
+        for module in (main, database):
+            monkeypatch.setattr(module, "DB_PATH", tmp_path / "chat.db")
+        monkeypatch.setattr(main, "VECTOR_STORE_PATH", tmp_path / "index")
+        monkeypatch.setattr(main, "SESSION_STORE_DIR", tmp_path / "sessions")
+        
+        async with main.lifespan(main.app):
+            request = Request({"type": "http", "method": "POST", "headers": [], "query_string": b""})
+            response = await chat(ChatRequest(question="What is step 3?"), request, "default")
+            generation = generations.get(response.headers["x-generation-id"])
+            subscription = generation.subscribe()
+            await _collect(subscription, limit=3)  # Attached, so not abandoned
+        
+        assert generation.done and generation.cancelled
+        history = await database.get_history()
+        assert history[1]["truncated"] is True
+        assert history[1]["content"].startswith("Tighten")
+        await subscription.aclose()
@@ -0,0 +1,393 @@
+"""
+Index Factory Tests
+Tests for FAISS index selection, compressed index types and rescoring
+"""
+
+import numpy as np
+import pytest
+
+
+def _vectors(count: int, dimension: int = 32, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _recall(index, vectors: np.ndarray, k: int = 5) -> float:
+    import faiss
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    queries = vectors[:50]
+    _, truth = exact.search(queries, k)
+    _, found = index.search(queries, k)
+    return np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+
+
+class TestIndexSelection:
+    """Tests for automatic index type selection."""
+
+    def test_small_corpus_stays_exact(self):
+        """Under 1000 vectors brute force is fastest and exact."""
+        from index_factory import select_index_type
+        assert select_index_type(10) == "flat"
+        assert select_index_type(999) == "flat"
+
+    def test_larger_corpora_pick_sq8_hnsw_then_ivfpq(self):
+        """SQ8 up to 10k, HNSW up to 1M, IVF-PQ beyond."""
+        from index_factory import select_index_type
+        assert select_index_type(5_000) == "sq8"
+        assert select_index_type(10_000) == "hnsw"
+        assert select_index_type(500_000) == "hnsw"
+        assert select_index_type(5_000_000) == "ivfpq"
+
+    def test_explicit_type_overrides_auto(self):
+        """An explicit type is used regardless of size."""
+        from index_factory import resolve_index_type
+        assert resolve_index_type("ivf", 10) == "ivf"
+        assert resolve_index_type("auto", 10) == "flat"
+
+    def test_nlist_bounded_by_training_sample(self, monkeypatch):
+        """Every inverted list gets ~39 training points even when the corpus outgrows the sample."""
+        from config import settings
+        from index_factory import MIN_POINTS_PER_CENTROID, create_index
+        monkeypatch.setattr(settings, "INDEX_TRAIN_SAMPLE", 20_000)
+        index, _ = create_index("ivf", 32, 1_000_000, rescore=False)
+        assert index.nlist == 20_000 // MIN_POINTS_PER_CENTROID
+        small, _ = create_index("ivf", 32, 2_000, rescore=False)
+        assert small.nlist == 2_000 // MIN_POINTS_PER_CENTROID
+
+    def test_unknown_type_rejected(self):
+        """Unknown index types should raise ValueError."""
+        from index_factory import resolve_index_type
+        with pytest.raises(ValueError, match="Unknown index type"):
+            resolve_index_type("annoy", 10)
+
+
+class TestBuildIndex:
+    """Tests for building and querying each index type."""
+
+    def test_sq8_is_smaller_and_accurate(self):
+        """SQ8 should use ~4x less memory than flat with near-exact recall."""
+        from index_factory import build_index, index_memory_bytes
+        vectors = _vectors(2000)
+        flat, _ = build_index("flat", vectors)
+        sq8, built = build_index("sq8", vectors, rescore=False)
+        assert built == "sq8"
+        assert sq8.ntotal == 2000
+        assert index_memory_bytes(flat) / index_memory_bytes(sq8) > 3
+        assert _recall(sq8, vectors) > 0.9
+
+    def test_ivf_is_trained_and_searchable(self):
+        """IVF should be trained, filled and probe several lists."""
+        import faiss
+        from index_factory import build_index
+        vectors = _vectors(2000)
+        index, built = build_index("ivf", vectors)
+        assert built == "ivf"
+        assert index.is_trained and index.ntotal == 2000
+        assert faiss.extract_index_ivf(index).nprobe > 1
+
+    def test_ivfpq_falls_back_when_too_small(self):
+        """PQ needs ~10k training points; smaller corpora get SQ8."""
+        from index_factory import build_index
+        _, built = build_index("ivfpq", _vectors(500), rescore=False)
+        assert built == "sq8"
+
+    def test_ivfpq_compresses_at_least_16x(self):
+        """IVF-PQ codes should be 16x smaller than the raw vectors (ids and codebooks extra)."""
+        from index_factory import build_index, index_memory_bytes
+        vectors = _vectors(10_000)
+        index, built = build_index("ivfpq", vectors, rescore=False)
+        assert built == "ivfpq"
+        assert vectors.nbytes / index_memory_bytes(index) > 4
+        assert index.pq.code_size * 16 <= vectors.shape[1] * 4
+
+    def test_rescore_wraps_and_restores_recall(self):
+        """Rescoring re-ranks candidates against exact vectors."""
+        import faiss
+        from index_factory import build_index
+        vectors = _vectors(2000)
+        index, _ = build_index("sq8", vectors, rescore=True)
+        assert isinstance(index, faiss.IndexRefineFlat)
+        assert _recall(index, vectors) == 1.0
+
+    @pytest.mark.parametrize("kind,count,rescore", [
+        ("flat", 500, False), ("sq8", 500, True), ("ivf", 2000, False), ("hnsw", 500, False),
+    ])
+    def test_memory_estimate_matches_serialized_size(self, kind, count, rescore):
+        """The size is derived from index parameters and stays close to the serialized size."""
+        import faiss
+        from index_factory import build_index, index_memory_bytes
+        index, _ = build_index(kind, _vectors(count), rescore=rescore)
+        serialized = faiss.serialize_index(index).nbytes
+        assert abs(index_memory_bytes(index) - serialized) / serialized < 0.05
+
+    def test_build_does_not_serialize(self, monkeypatch):
+        """Logging a build's size must not copy the index."""
+        import faiss
+        from index_factory import build_index
+
+        def fail(index):
+            raise AssertionError("serialize_index called")
+
+        monkeypatch.setattr(faiss, "serialize_index", fail)
+        build_index("sq8", _vectors(500))
+
+
+class TestHNSWIndex:
+    """Tests for the HNSW graph index."""
+
+    def test_hnsw_parameters_and_recall(self, monkeypatch):
+        """M, efConstruction and efSearch come from config; recall stays high."""
+        from config import settings
+        from index_factory import build_index
+        monkeypatch.setattr(settings, "INDEX_HNSW_M", 16)
+        monkeypatch.setattr(settings, "INDEX_HNSW_EF_SEARCH", 48)
+        vectors = _vectors(2000)
+        index, built = build_index("hnsw", vectors)
+        assert built == "hnsw"
+        assert index.hnsw.efSearch == 48
+        assert index.hnsw.efConstruction == settings.INDEX_HNSW_EF_CONSTRUCTION
+        assert _recall(index, vectors) > 0.9
+
+    def test_incremental_add_and_persistence(self, tmp_path, monkeypatch):
+        """add_documents appends to the same graph and survives save/load."""
+        import faiss
+        from langchain_core.documents import Document
+        from config import settings
+        from embeddings import HashingEmbeddings
+        from vector_store import FAISSVectorStore
+
+        monkeypatch.setattr(settings, "INDEX_TYPE", "hnsw")
+        monkeypatch.setattr(settings, "INDEX_HNSW_EF_SEARCH", 40)
+        store = FAISSVectorStore(store_path=tmp_path / "index")
+        store._embeddings = HashingEmbeddings(dimension=64)
+
+        store.add_documents([Document(page_content=f"valve {i} seal") for i in range(200)])
+        index = store._vectorstore.index
+        assert isinstance(index, faiss.IndexHNSWFlat)
+        store.add_documents([Document(page_content="gearbox oil change interval")])
+        assert store._vectorstore.index is index
+        assert index.ntotal == 201
+
+        store.save()
+        reloaded = FAISSVectorStore(store_path=tmp_path / "index")
+        reloaded._embeddings = store._embeddings
+        results = reloaded.similarity_search("gearbox oil change", k=1)
+        assert isinstance(reloaded._vectorstore.index, faiss.IndexHNSWFlat)
+        assert reloaded._vectorstore.index.hnsw.efSearch == 40
+        assert results[0].page_content == "gearbox oil change interval"
+
+
+class TestIndexBuilder:
+    """Tests for incremental index construction from streamed batches."""
+
+    def test_untrained_types_fill_immediately(self):
+        """Flat indexes take batches as they arrive."""
+        from index_factory import IndexBuilder
+        builder = IndexBuilder("flat")
+        builder.add(_vectors(100), expected_total=300)
+        assert builder.index is not None and builder.index.ntotal == 100
+        builder.add(_vectors(200, seed=1), expected_total=300)
+        index, kind = builder.finish()
+        assert kind == "flat" and index.ntotal == 300
+
+    def test_trained_types_buffer_until_sample(self, monkeypatch):
+        """IVF buffers up to the training sample, then adds directly."""
+        from config import settings
+        from index_factory import IndexBuilder
+        monkeypatch.setattr(settings, "INDEX_TRAIN_SAMPLE", 1000)
+        builder = IndexBuilder("ivf")
+        builder.add(_vectors(600), expected_total=3000)
+        assert builder.index is None and builder.ntotal == 600
+        builder.add(_vectors(600, seed=1), expected_total=3000)
+        assert builder.index is not None and builder.index.is_trained
+        builder.add(_vectors(600, seed=2), expected_total=3000)
+        index, kind = builder.finish()
+        assert kind == "ivf" and index.ntotal == 1800
+
+    def test_auto_type_uses_estimate_then_actual(self):
+        """Auto picks from the estimate; unflushed buffers use the real count."""
+        from index_factory import IndexBuilder
+        builder = IndexBuilder("auto")
+        builder.add(_vectors(500), expected_total=5000)  # estimate says sq8
+        index, kind = builder.finish()  # only 500 arrived
+        assert kind == "flat" and index.ntotal == 500
+
+    def test_empty_builder(self):
+        """No batches means no index."""
+        from index_factory import IndexBuilder
+        assert IndexBuilder().finish() == (None, None)
+
+
+class TestCosineMetric:
+    """Tests for normalized inner-product search and cache migration."""
+
+    def test_cosine_builds_inner_product_indexes(self):
+        """Every index type should use inner product and normalize input."""
+        import faiss
+        from index_factory import build_index, index_metric
+        vectors = _vectors(2000) * 3.0
+        for kind in ("flat", "sq8", "ivf", "hnsw"):
+            index, _ = build_index(kind, vectors.copy(), rescore=False, metric="cosine")
+            assert index.metric_type == faiss.METRIC_INNER_PRODUCT
+            assert index_metric(index) == "cosine"
+        build_index("flat", vectors, metric="cosine")
+        assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-5)
+
+    def test_l2_metric_still_available(self):
+        """INDEX_METRIC=l2 keeps Euclidean indexes."""
+        from index_factory import build_index, index_metric
+        index, _ = build_index("flat", _vectors(10), metric="l2")
+        assert index_metric(index) == "l2"
+
+    def test_scores_are_cosine_similarities(self, tmp_path, monkeypatch):
+        """Scores lie in [-1, 1], best first, with an exact match near 1."""
+        from langchain_core.documents import Document
+        from embeddings import HashingEmbeddings
+        from vector_store import FAISSVectorStore
+
+        store = FAISSVectorStore(store_path=tmp_path / "index")
+        store._embeddings = HashingEmbeddings(dimension=64)
+        store.add_documents([Document(page_content=f"bearing {i} grease") for i in range(50)])
+        results = store.similarity_search_with_score("bearing 7 grease", k=5)
+        scores = [score for _, score in results]
+        assert results[0][0].page_content == "bearing 7 grease"
+        assert scores[0] == pytest.approx(1.0, abs=1e-4)
+        assert scores == sorted(scores, reverse=True)
+        assert all(-1.0 <= score <= 1.0 + 1e-5 for score in scores)
+
+    def test_legacy_l2_cache_is_migrated(self, tmp_path, monkeypatch):
+        """Flat L2 cache entries are rebuilt as cosine indexes in place."""
+        import faiss
+        from langchain_community.vectorstores import FAISS
+        from langchain_core.documents import Document
+        from cache import DocumentCache
+        from embeddings import HashingEmbeddings
+
+        from config import settings
+
+        monkeypatch.setattr(DocumentCache, "CACHE_DIR", tmp_path)
+        monkeypatch.setattr(settings, "EMBEDDING_PROVIDER", "google")
+        embeddings = HashingEmbeddings(dimension=64)
+        documents = [Document(page_content=f"coolant {i} level") for i in range(30)]
+        # Pre-series layout: CACHE_DIR/<hash>, L2 flat index
+        FAISS.from_documents(documents, embeddings).save_local(str(tmp_path / "abc"))
+
+        assert DocumentCache.has_cached_index("abc")
+        migrated = DocumentCache.load_cached_index("abc", embeddings)
+        assert migrated.index.metric_type == faiss.METRIC_INNER_PRODUCT
+        assert type(faiss.downcast_index(migrated.index)) in (faiss.IndexFlat, faiss.IndexFlatIP)
+        assert migrated.similarity_search("coolant 4 level", k=1)[0].page_content == "coolant 4 level"
+        # Written back: the next load needs no migration
+        reloaded = DocumentCache.load_cached_index("abc", embeddings)
+        assert reloaded.index.metric_type == faiss.METRIC_INNER_PRODUCT
+
+    def test_unnamespaced_cache_is_adopted(self, tmp_path, monkeypatch):
+        """Entries from before signature namespacing stay usable with Google embeddings."""
+        from langchain_community.vectorstores import FAISS
+        from langchain_core.documents import Document
+        from cache import DocumentCache
+        from config import settings
+        from embeddings import HashingEmbeddings
+
+        monkeypatch.setattr(DocumentCache, "CACHE_DIR", tmp_path)
+        monkeypatch.setattr(settings, "EMBEDDING_PROVIDER", "google")
+        documents = [Document(page_content=f"hose {i}") for i in range(5)]
+        FAISS.from_documents(documents, HashingEmbeddings(dimension=64)).save_local(str(tmp_path / "abc"))
+
+        assert DocumentCache.has_cached_index("abc")
+        assert (DocumentCache._cache_path("abc") / "index.faiss").exists()
+        assert not (tmp_path / "abc").exists()
+
+    def test_unnamespaced_cache_ignored_by_other_providers(self, tmp_path, monkeypatch):
+        """Legacy entries hold Google vectors, so the local provider never adopts them."""
+        from langchain_community.vectorstores import FAISS
+        from langchain_core.documents import Document
+        from cache import DocumentCache
+        from config import settings
+        from embeddings import HashingEmbeddings
+
+        monkeypatch.setattr(DocumentCache, "CACHE_DIR", tmp_path)
+        monkeypatch.setattr(settings, "EMBEDDING_PROVIDER", "local")
+        documents = [Document(page_content=f"hose {i}") for i in range(5)]
+        FAISS.from_documents(documents, HashingEmbeddings(dimension=64)).save_local(str(tmp_path / "abc"))
+
+        assert not DocumentCache.has_cached_index("abc")
+        assert (tmp_path / "abc" / "index.faiss").exists()
+
+    def test_migration_keeps_large_caches_exact(self, tmp_path, monkeypatch):
+        """Migrating changes only the metric, never to a compressed index type."""
+        import faiss
+        from langchain_community.vectorstores import FAISS
+        from cache import DocumentCache
+        from config import settings
+        from embeddings import HashingEmbeddings
+
+        monkeypatch.setattr(DocumentCache, "CACHE_DIR", tmp_path)
+        monkeypatch.setattr(settings, "INDEX_TYPE", "sq8")
+        embeddings = HashingEmbeddings(dimension=64)
+        texts = [f"pump {i} seal" for i in range(500)]
+        FAISS.from_texts(texts, embeddings).save_local(str(DocumentCache._cache_path("big")))
+
+        migrated = DocumentCache.load_cached_index("big", embeddings)
+        assert type(faiss.downcast_index(migrated.index)) in (faiss.IndexFlat, faiss.IndexFlatIP)
+        assert migrated.index.ntotal == 500
+
+    def test_lossy_cache_is_invalidated(self, tmp_path, monkeypatch):
+        """Compressed L2 entries cannot be migrated exactly and are dropped."""
+        from langchain_core.documents import Document
+        from cache import DocumentCache
+        from config import settings
+        from embeddings import HashingEmbeddings
+        from ingestion import create_optimized_vectorstore
+
+        monkeypatch.setattr(DocumentCache, "CACHE_DIR", tmp_path)
+        embeddings = HashingEmbeddings(dimension=64)
+        documents = [Document(page_content=f"filter {i}") for i in range(30)]
+        monkeypatch.setattr(settings, "INDEX_METRIC", "l2")
+        store = create_optimized_vectorstore(documents, embeddings, 30, index_type="sq8")
+        DocumentCache.cache_index("lossy", store, 30)
+
+        monkeypatch.setattr(settings, "INDEX_METRIC", "cosine")
+        assert DocumentCache.load_cached_index("lossy", embeddings) is None
+        assert not DocumentCache._cache_path("lossy").exists()
+
+
+class TestOptimizedVectorstore:
+    """Tests for create_optimized_vectorstore using the built index."""
+
+    def test_compressed_index_is_used(self):
+        """The trained index must back the returned vectorstore."""
+        import faiss
+        from langchain_core.documents import Document
+        from embeddings import HashingEmbeddings
+        from ingestion import create_optimized_vectorstore
+
+        embeddings = HashingEmbeddings(dimension=64)
+        documents = [Document(page_content=f"pump {i} torque valve {i % 7}") for i in range(1200)]
+        store = create_optimized_vectorstore(documents, embeddings, len(documents), index_type="sq8")
+
+        assert isinstance(store.index, faiss.IndexScalarQuantizer)
+        assert store.index.ntotal == len(documents)
+        results = store.similarity_search("pump 42 torque valve 0", k=1)
+        assert results[0].page_content == "pump 42 torque valve 0"
+
+    def test_save_and_load_keeps_index_type(self, tmp_path):
+        """Compressed indexes round-trip through save_local/load_local."""
+        import faiss
+        from langchain_community.vectorstores import FAISS
+        from langchain_core.documents import Document
+        from embeddings import HashingEmbeddings
+        from index_factory import configure_search
+        from ingestion import create_optimized_vectorstore
+
+        embeddings = HashingEmbeddings(dimension=64)
+        documents = [Document(page_content=f"chapter {i} filter") for i in range(100)]
+        store = create_optimized_vectorstore(documents, embeddings, len(documents), index_type="ivf")
+        store.save_local(str(tmp_path))
+
+        loaded = FAISS.load_local(str(tmp_path), embeddings, allow_dangerous_deserialization=True)
+        configure_search(loaded.index)
+        assert isinstance(loaded.index, faiss.IndexIVFFlat)
+        assert loaded.similarity_search("chapter 7 filter", k=1)[0].page_content == "chapter 7 filter"
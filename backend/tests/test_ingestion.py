@@ -53,3 +53,77 @@ class TestIngestionConfig:
         """Max retries should be between 1 and 10."""
         from config import INGESTION_MAX_RETRIES
         assert 1 <= INGESTION_MAX_RETRIES <= 10
+
+
+@pytest.fixture
+def generated_pdf(tmp_path: Path) -> Path:
+    """A 12-page PDF with deterministic extractable text."""
+    from benchmarks.pdfgen import generate_pdf
+    return generate_pdf(tmp_path / "manual.pdf", pages=12)
+
+
+class TestStreamingPipeline:
+    """Tests for the bounded page -> chunk -> embedding -> index pipeline."""
+    
+    def test_chunks_match_eager_split(self, generated_pdf: Path, monkeypatch):
+        """Streaming must yield the same chunks, in order, as load + split."""
+        import ingestion
+        from langchain_community.document_loaders import PyPDFLoader
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        from embeddings import HashingEmbeddings
+        
+        # Small batches and queues force many pipeline steps
+        monkeypatch.setattr(ingestion, "INGESTION_PIPELINE_BATCH", 5)
+        monkeypatch.setattr(ingestion, "INGESTION_QUEUE_SIZE", 1)
+        store, count = ingestion.stream_ingest(str(generated_pdf), HashingEmbeddings(dimension=64))
+        
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=ingestion.CHUNK_SIZE, chunk_overlap=ingestion.CHUNK_OVERLAP
+        )
+        expected = splitter.split_documents(PyPDFLoader(str(generated_pdf)).load())
+        streamed = [store.docstore.search(store.index_to_docstore_id[i]) for i in range(count)]
+        assert count == len(expected) == store.index.ntotal
+        assert [doc.page_content for doc in streamed] == [doc.page_content for doc in expected]
+        assert [doc.metadata["page"] for doc in streamed] == [doc.metadata["page"] for doc in expected]
+    
+    def test_search_finds_streamed_chunks(self, generated_pdf: Path):
+        """Vectors and docstore ids must line up."""
+        import ingestion
+        from embeddings import HashingEmbeddings
+        
+        store, count = ingestion.stream_ingest(str(generated_pdf), HashingEmbeddings(dimension=64))
+        target = store.docstore.search(store.index_to_docstore_id[count // 2])
+        assert store.similarity_search(target.page_content, k=1)[0].page_content == target.page_content
+    
+    def test_loader_errors_propagate(self, generated_pdf: Path, monkeypatch):
+        """A failure in a worker stage is raised to the caller."""
+        import ingestion
+        from embeddings import HashingEmbeddings
+        
+        class BrokenLoader:
+            def __init__(self, path):
+                self.path = path
+            
+            def lazy_load(self):
+                from langchain_core.documents import Document
+                yield Document(page_content="first page", metadata={"page": 0})
+                raise RuntimeError("corrupt page")
+        
+        monkeypatch.setattr("langchain_community.document_loaders.PyPDFLoader", BrokenLoader)
+        with pytest.raises(RuntimeError, match="corrupt page"):
+            ingestion.stream_ingest(str(generated_pdf), HashingEmbeddings(dimension=64))
+    
+    def test_empty_document(self, tmp_path: Path, monkeypatch):
+        """A PDF without text yields no store."""
+        import ingestion
+        from embeddings import HashingEmbeddings
+        
+        class EmptyLoader:
+            def __init__(self, path):
+                pass
+            
+            def lazy_load(self):
+                return iter(())
+        
+        monkeypatch.setattr("langchain_community.document_loaders.PyPDFLoader", EmptyLoader)
+        assert ingestion.stream_ingest(str(tmp_path / "x.pdf"), HashingEmbeddings(dimension=64)) == (None, 0)
@@ -0,0 +1,85 @@
+"""
+Metrics Tests
+Tests for the in-process metrics registry and the /metrics endpoint
+"""
+
+import pytest
+from httpx import AsyncClient
+
+
+class TestCounter:
+    """Tests for labelled counters."""
+    
+    def test_counter_increments_per_label(self):
+        """Counters should track each label set independently."""
+        from metrics import MetricsRegistry
+        registry = MetricsRegistry()
+        counter = registry.counter("test_total", "Test counter", ["result"])
+        counter.inc(result="hit")
+        counter.inc(2, result="hit")
+        counter.inc(result="miss")
+        assert counter.value(result="hit") == 3
+        assert counter.value(result="miss") == 1
+    
+    def test_duplicate_registration_rejected(self):
+        """Registering the same metric name twice should fail."""
+        from metrics import MetricsRegistry
+        registry = MetricsRegistry()
+        registry.counter("dup_total", "First")
+        with pytest.raises(ValueError):
+            registry.counter("dup_total", "Second")
+
+
+class TestHistogram:
+    """Tests for bucketed histograms."""
+    
+    def test_observations_render_cumulative_buckets(self):
+        """Rendered buckets should be cumulative with a +Inf bucket."""
+        from metrics import MetricsRegistry
+        registry = MetricsRegistry()
+        histogram = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5.0):
+            histogram.observe(value)
+        text = registry.render()
+        assert 'latency_seconds_bucket{le="0.1"} 1' in text
+        assert 'latency_seconds_bucket{le="1.0"} 3' in text
+        assert 'latency_seconds_bucket{le="+Inf"} 4' in text
+        assert "latency_seconds_count 4" in text
+        assert "latency_seconds_sum 6.05" in text
+    
+    def test_time_context_manager_records_sample(self):
+        """The time() helper should record one sample per block."""
+        from metrics import MetricsRegistry
+        registry = MetricsRegistry()
+        histogram = registry.histogram("stage_seconds", "Stages", ["stage"])
+        with histogram.time(stage="load"):
+            pass
+        assert histogram.count(stage="load") == 1
+        assert histogram.count(stage="split") == 0
+    
+    def test_label_values_escaped(self):
+        """Quotes in label values must be escaped in the exposition format."""
+        from metrics import MetricsRegistry
+        registry = MetricsRegistry()
+        counter = registry.counter("odd_total", "Odd labels", ["name"])
+        counter.inc(name='a"b')
+        assert 'odd_total{name="a\\"b"} 1' in registry.render()
+
+
+class TestMetricsEndpoint:
+    """Tests for the /metrics endpoint."""
+    
+    async def test_metrics_returns_text_exposition(self, client: AsyncClient):
+        """The endpoint should serve Prometheus text format."""
+        response = await client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "# TYPE rag_chat_requests_total counter" in response.text
+        assert "# TYPE rag_time_to_first_token_seconds histogram" in response.text
+    
+    async def test_chat_without_document_counted(self, client: AsyncClient):
+        """A chat without an indexed document should be counted by outcome."""
+        from metrics import CHAT_REQUESTS
+        before = CHAT_REQUESTS.value(outcome="no_document")
+        await client.post("/chat", json={"question": "anything"})
+        assert CHAT_REQUESTS.value(outcome="no_document") == before + 1
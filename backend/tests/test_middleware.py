@@ -24,6 +24,78 @@ class TestRateLimitMiddleware:
         response = await client.post("/chat", json={"question": "test"})
         # Will fail with no document, but not 429 (rate limit)
         assert response.status_code != 429
+    
+    async def test_rate_limit_headers_on_chat(self, client: AsyncClient):
+        """Rate limited endpoints should report their quota in headers."""
+        response = await client.post("/chat", json={"question": "test"})
+        assert "x-ratelimit-limit" in response.headers
+        assert "x-ratelimit-remaining" in response.headers
+        assert "x-ratelimit-reset" in response.headers
+    
+    async def test_unlimited_endpoint_has_no_rate_limit_headers(self, client: AsyncClient):
+        """Endpoints without limits should not carry rate limit headers."""
+        response = await client.get("/health")
+        assert "x-ratelimit-limit" not in response.headers
+
+
+class TestTokenBucketLimiter:
+    """Unit tests for the token bucket used by the rate limiter."""
+    
+    def test_allows_up_to_capacity(self):
+        """A fresh bucket should allow exactly `capacity` requests."""
+        from middleware import TokenBucketLimiter
+        limiter = TokenBucketLimiter(capacity=3, window_seconds=60)
+        results = [limiter.acquire("1.2.3.4", now=0.0)[0] for _ in range(4)]
+        assert results == [True, True, True, False]
+    
+    def test_blocked_request_reports_retry_after(self):
+        """Blocked requests should report when the next token arrives."""
+        from middleware import TokenBucketLimiter
+        limiter = TokenBucketLimiter(capacity=2, window_seconds=60)
+        limiter.acquire("ip", now=0.0)
+        limiter.acquire("ip", now=0.0)
+        allowed, remaining, retry_after = limiter.acquire("ip", now=0.0)
+        assert not allowed
+        assert remaining == 0
+        assert retry_after == pytest.approx(30.0)
+    
+    def test_tokens_refill_over_time(self):
+        """Tokens should refill continuously at capacity per window."""
+        from middleware import TokenBucketLimiter
+        limiter = TokenBucketLimiter(capacity=2, window_seconds=60)
+        limiter.acquire("ip", now=0.0)
+        limiter.acquire("ip", now=0.0)
+        assert not limiter.acquire("ip", now=10.0)[0]
+        assert limiter.acquire("ip", now=31.0)[0]
+    
+    def test_clients_are_isolated(self):
+        """One client exhausting its bucket should not affect another."""
+        from middleware import TokenBucketLimiter
+        limiter = TokenBucketLimiter(capacity=1, window_seconds=60)
+        assert limiter.acquire("a", now=0.0)[0]
+        assert not limiter.acquire("a", now=0.0)[0]
+        assert limiter.acquire("b", now=0.0)[0]
+    
+    def test_sweep_removes_only_idle_buckets(self):
+        """Sweeping should drop refilled buckets and keep active ones."""
+        from middleware import TokenBucketLimiter
+        limiter = TokenBucketLimiter(capacity=2, window_seconds=60)
+        limiter.acquire("idle", now=0.0)
+        limiter.acquire("active", now=50.0)
+        assert limiter.sweep(now=60.0) == 1
+        assert len(limiter) == 1
+        # Active client keeps its partially drained bucket
+        assert limiter.acquire("active", now=60.0)[1] == 0
+    
+    def test_many_clients_swept(self):
+        """Tens of thousands of idle clients should be reclaimed."""
+        from middleware import TokenBucketLimiter
+        limiter = TokenBucketLimiter(capacity=5, window_seconds=60)
+        for i in range(20000):
+            limiter.acquire(f"10.0.{i // 256}.{i % 256}", now=0.0)
+        assert len(limiter) == 20000
+        limiter.sweep(now=120.0)
+        assert len(limiter) == 0
 
 
 class TestRequestSizeLimitMiddleware:
@@ -72,3 +144,130 @@ class TestAPIKeyMiddleware:
         """API key header is ignored when auth is disabled."""
         response = await client.get("/status", headers={"X-API-Key": "any-key"})
         assert response.status_code == 200
+    
+    async def test_missing_key_rejected_when_enabled(self, client: AsyncClient, monkeypatch):
+        """When auth is enabled, requests without a valid key get 401."""
+        from config import settings
+        monkeypatch.setattr(settings, "REQUIRE_AUTH", True)
+        response = await client.get("/status")
+        assert response.status_code == 401
+        assert response.json()["code"] == "UNAUTHORIZED"
+    
+    async def test_health_exempt_when_enabled(self, client: AsyncClient, monkeypatch):
+        """Health checks stay open even when auth is enabled."""
+        from config import settings
+        monkeypatch.setattr(settings, "REQUIRE_AUTH", True)
+        response = await client.get("/health")
+        assert response.status_code == 200
+
+
+class TestASGIMiddleware:
+    """Tests for the raw ASGI middleware wiring."""
+    
+    async def test_request_id_exposed_to_handlers(self):
+        """The request ID should be stored in scope state for request.state."""
+        from middleware import RequestIDMiddleware
+        seen = {}
+        
+        async def inner(scope, receive, send):
+            seen["request_id"] = scope["state"]["request_id"]
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+        
+        messages = []
+        
+        async def send(message):
+            messages.append(message)
+        
+        async def receive():
+            return {"type": "http.request", "body": b""}
+        
+        await RequestIDMiddleware(inner)({"type": "http", "path": "/", "headers": []}, receive, send)
+        headers = dict(messages[0]["headers"])
+        assert headers[b"x-request-id"].decode() == seen["request_id"]
+    
+    async def test_non_http_scopes_pass_through(self):
+        """Lifespan and websocket scopes should reach the app untouched."""
+        from middleware import RateLimitMiddleware, RequestSizeLimitMiddleware
+        calls = []
+        
+        async def inner(scope, receive, send):
+            calls.append(scope["type"])
+        
+        app = RateLimitMiddleware(RequestSizeLimitMiddleware(inner))
+        await app({"type": "lifespan"}, None, None)
+        assert calls == ["lifespan"]
+
+
+class TestCompressionMiddleware:
+    """Tests for gzip response compression."""
+    
+    async def _run(self, chunks, accept_encoding="gzip", content_type=b"application/json"):
+        """Send `chunks` through the middleware; return (start message, body messages)."""
+        from middleware import CompressionMiddleware
+        
+        async def inner(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", content_type)]})
+            for i, chunk in enumerate(chunks):
+                await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+        
+        messages = []
+        
+        async def send(message):
+            messages.append(message)
+        
+        headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding else []
+        await CompressionMiddleware(inner)({"type": "http", "path": "/", "headers": headers}, None, send)
+        return dict(messages[0]["headers"]), messages[1:]
+    
+    async def test_large_body_compressed(self):
+        """Complete bodies over the threshold are gzipped with a correct length."""
+        import gzip
+        body = b'{"messages": [' + b'{"role": "user", "content": "hello"},' * 200 + b"{}]}"
+        headers, messages = await self._run([body])
+        assert headers[b"content-encoding"] == b"gzip"
+        assert headers[b"vary"] == b"Accept-Encoding"
+        assert int(headers[b"content-length"]) == len(messages[0]["body"]) < len(body)
+        assert gzip.decompress(messages[0]["body"]) == body
+    
+    @pytest.mark.parametrize("accept_encoding, content_type", [
+        ("gzip", b"application/json"),
+        (None, b"application/json"),
+        ("gzip;q=0", b"application/json"),
+        ("gzip", b"application/pdf"),
+    ])
+    async def test_left_uncompressed(self, accept_encoding, content_type):
+        """Small bodies, refused codings and binary types pass through."""
+        body = b"x" * (2000 if content_type == b"application/pdf" or accept_encoding != "gzip" else 10)
+        headers, messages = await self._run([body], accept_encoding, content_type)
+        assert b"content-encoding" not in headers
+        assert messages[0]["body"] == body
+    
+    async def test_streams_flushed_per_chunk(self, monkeypatch):
+        """With COMPRESS_STREAMS each frame decompresses as soon as it arrives."""
+        import zlib
+        from config import settings
+        monkeypatch.setattr(settings, "COMPRESS_STREAMS", True)
+        frames = [b'{"type":"token","data":"Tighten"}\n', b'{"type":"token","data":" the bolts"}\n', b""]
+        headers, messages = await self._run(frames, content_type=b"application/x-ndjson")
+        assert headers[b"content-encoding"] == b"gzip"
+        assert b"content-length" not in headers
+        decompressor = zlib.decompressobj(31)
+        for frame, message in zip(frames, messages):
+            assert decompressor.decompress(message["body"]) == frame
+        assert decompressor.eof
+    
+    async def test_streams_uncompressed_by_default(self):
+        """Without COMPRESS_STREAMS streamed bodies pass through."""
+        headers, messages = await self._run([b"a\n", b"b\n", b""], content_type=b"application/x-ndjson")
+        assert b"content-encoding" not in headers
+        assert [m["body"] for m in messages] == [b"a\n", b"b\n", b""]
+    
+    def test_negotiation(self):
+        """gzip is picked when accepted, "*" included; refused codings are skipped."""
+        from middleware import negotiate_encoding
+        assert negotiate_encoding("gzip, deflate, br") in ("gzip", "zstd")
+        assert negotiate_encoding("br") is None
+        assert negotiate_encoding("*") == "gzip"
+        assert negotiate_encoding("gzip;q=0") is None
+        assert negotiate_encoding(None) is None
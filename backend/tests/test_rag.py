@@ -44,3 +44,238 @@ class TestEmbeddingConfig:
         from config import LLM_MODEL
         assert LLM_MODEL
         assert len(LLM_MODEL) > 0
+
+
+class FakeVectorStore:
+    """Vector store stub returning fixed documents."""
+    
+    def similarity_search_with_score(self, query, k=7, timings=None):
+        from langchain_core.documents import Document
+        if timings is not None:
+            timings.add("embedding", 0.002)
+            timings.add("search", 0.001)
+        return [(Document(page_content="Step 3: tighten the bolts.", metadata={"page": 2}, id="chunk-1"), 0.87)]
+
+
+class TestChatTiming:
+    """Tests for the per-request timing breakdown event."""
+    
+    @pytest.fixture
+    def fake_pipeline(self, monkeypatch):
+        """Replace retrieval and the LLM with local fakes."""
+        import rag
+        from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+        from langchain_core.messages import AIMessage
+        
+        monkeypatch.setattr(rag.vector_stores, "default", FakeVectorStore())
+        monkeypatch.setattr(
+            rag,
+            "get_llm",
+            lambda: GenericFakeChatModel(messages=iter([AIMessage(content="Tighten the bolts firmly.")])),
+        )
+    
+    async def test_final_event_is_timing(self, fake_pipeline):
+        """The stream should end with a timing event covering every stage."""
+        import json
+        from rag import generate_chat_response
+        
+        events = [json.loads(line) async for line in generate_chat_response("What is step 3?")]
+        assert events[0]["type"] == "sources"
+        assert events[-1]["type"] == "timing"
+        
+        tokens = "".join(e["data"] for e in events if e["type"] == "token")
+        assert tokens == "Tighten the bolts firmly."
+        
+        timing = events[-1]["data"]
+        for stage in ("embedding", "search", "prompt", "llm_first_token", "llm", "total"):
+            assert stage in timing["stages_ms"]
+        assert timing["stages_ms"]["embedding"] == 2.0
+        assert timing["completion_tokens"] > 0
+        assert timing["prompt_tokens"] > timing["completion_tokens"]
+        assert timing["retrieved_chunks"] == 1
+        assert timing["context_chunks"] == 1
+
+
+class TestRetrievalOffLoop:
+    """Retrieval (index load, query embedding, search) must not block the event loop."""
+    
+    async def test_slow_search_does_not_stall_other_tasks(self, monkeypatch):
+        """Other coroutines keep running while a cold index loads."""
+        import asyncio
+        import time
+        import rag
+        from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+        from langchain_core.messages import AIMessage
+        
+        class ColdStore(FakeVectorStore):
+            def similarity_search_with_score(self, query, k=7, timings=None):
+                time.sleep(0.2)  # Blocking load_local + embedding
+                return super().similarity_search_with_score(query, k, timings)
+        
+        monkeypatch.setattr(rag.vector_stores, "default", ColdStore())
+        monkeypatch.setattr(
+            rag, "get_llm", lambda: GenericFakeChatModel(messages=iter([AIMessage(content="Done.")]))
+        )
+        ticks = 0
+        
+        async def heartbeat():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+        
+        beating = asyncio.create_task(heartbeat())
+        events = [line async for line in rag.generate_chat_response("What is step 3?")]
+        beating.cancel()
+        assert events
+        assert ticks >= 5
+
+
+class TestRateLimitRetry:
+    """Rate-limit retries must not repeat text the client already has."""
+    
+    @pytest.fixture
+    def flaky_llm(self, monkeypatch):
+        """LLM failing with a 429 after `fail_after` tokens on its first call only."""
+        import rag
+        from langchain_core.messages import AIMessageChunk
+        from langchain_core.runnables import RunnableGenerator
+        
+        calls = []
+        
+        def install(fail_after):
+            async def llm(prompts):
+                async for _ in prompts:
+                    pass
+                calls.append(1)
+                for i, word in enumerate(["Tighten ", "the ", "bolts."]):
+                    if len(calls) == 1 and i == fail_after:
+                        raise RuntimeError("429 Too Many Requests")
+                    yield AIMessageChunk(content=word)
+            
+            monkeypatch.setattr(rag, "get_llm", lambda: RunnableGenerator(llm))
+        
+        async def no_wait(delay):
+            pass
+        
+        monkeypatch.setattr(rag.vector_stores, "default", FakeVectorStore())
+        monkeypatch.setattr(rag.asyncio, "sleep", no_wait)
+        install.calls = calls
+        return install
+    
+    async def test_retry_before_first_token(self, flaky_llm):
+        """A 429 before any output is retried and the answer arrives once."""
+        import json
+        from rag import generate_chat_response
+        flaky_llm(fail_after=0)
+        parts, errors = [], []
+        stream = generate_chat_response("What is step 3?", answer_parts=parts, answer_errors=errors)
+        events = [json.loads(line) async for line in stream]
+        assert "".join(parts) == "Tighten the bolts."
+        assert errors == []
+        assert events[-1]["type"] == "timing"
+        assert len(flaky_llm.calls) == 2
+    
+    async def test_no_retry_after_output(self, flaky_llm):
+        """A 429 mid-answer ends the stream with an error instead of restarting it."""
+        import json
+        from rag import generate_chat_response
+        flaky_llm(fail_after=2)
+        parts, errors = [], []
+        stream = generate_chat_response("What is step 3?", answer_parts=parts, answer_errors=errors)
+        events = [json.loads(line) async for line in stream]
+        text = "".join(e["data"] for e in events if e["type"] == "token")
+        assert text == "".join(parts) == "Tighten the "
+        assert events[-1]["type"] == "error"
+        assert errors == [events[-1]["data"]]
+        assert len(flaky_llm.calls) == 1
+    
+    async def test_errored_answer_stored_truncated(self, flaky_llm, tmp_path, monkeypatch):
+        """The router keeps a cut-off answer as truncated and out of conversation memory."""
+        import asyncio
+        import database
+        from conversation import conversation_memory
+        from generations import generations
+        from models import ChatRequest
+        from routers.chat import chat
+        from starlette.requests import Request
+        
+        monkeypatch.setattr(database, "DB_PATH", tmp_path / "chat.db")
+        await database.init_db()
+        await conversation_memory.clear()
+        flaky_llm(fail_after=2)
+        
+        request = Request({"type": "http", "method": "POST", "headers": [], "query_string": b""})
+        response = await chat(ChatRequest(question="What is step 3?"), request, "default")
+        generation = generations.get(response.headers["x-generation-id"])
+        subscription = generation.subscribe()
+        async for _ in subscription:
+            pass
+        await asyncio.wait_for(generation._task, timeout=2)
+        
+        history = await database.get_history()
+        assert history[1]["content"] == "Tighten the "
+        assert history[1]["truncated"] is True
+        assert list((await conversation_memory.get("default")).turns) == []
+        await conversation_memory.clear()
+
+
+class TestContextPacking:
+    """Tests for token-budgeted context assembly."""
+    
+    def _docs(self, *token_counts):
+        from langchain_core.documents import Document
+        return [
+            Document(page_content=f"chunk {i}", metadata={"page": i, "token_count": n})
+            for i, n in enumerate(token_counts)
+        ]
+    
+    def test_packs_in_rank_order_within_budget(self):
+        """Chunks are kept best first until the next would exceed the budget."""
+        from rag import _pack_context
+        packed, tokens = _pack_context(self._docs(300, 500, 400, 50), budget=1000)
+        assert [d.metadata["page"] for d in packed] == [0, 1]
+        assert tokens == 800
+    
+    def test_top_chunk_always_kept(self):
+        """An oversized best match is still used."""
+        from rag import _pack_context
+        packed, tokens = _pack_context(self._docs(1500, 10), budget=1000)
+        assert len(packed) == 1
+        assert tokens == 1500
+    
+    def test_legacy_chunks_counted_on_the_fly(self):
+        """Chunks without token_count metadata are tokenized."""
+        from langchain_core.documents import Document
+        from rag import _pack_context
+        from tokenizer import count_tokens
+        doc = Document(page_content="Tighten bolt 7 to 40 Nm.", metadata={"page": 0})
+        _, tokens = _pack_context([doc], budget=1000)
+        assert tokens == count_tokens(doc.page_content)
+
+
+class TestLLMProviders:
+    """Tests for the LLM provider registry and local stub."""
+    
+    def test_unknown_provider_rejected(self):
+        """Unknown provider names should raise a clear error."""
+        from llm import get_llm
+        with pytest.raises(ValueError, match="Unknown LLM provider"):
+            get_llm("does-not-exist")
+    
+    async def test_stub_streams_configured_tokens(self):
+        """The stub should stream exactly the configured number of tokens."""
+        from llm import StubChatModel
+        model = StubChatModel(answer_tokens=5, token_delay=0.001)
+        chunks = [chunk.content async for chunk in model.astream("replace the pump filter")]
+        # LangChain may append an empty closing chunk
+        assert len([chunk for chunk in chunks if chunk]) == 5
+        assert model.expected_duration == pytest.approx(0.004)
+    
+    async def test_stub_is_deterministic(self):
+        """The same prompt should give the same answer."""
+        from llm import StubChatModel
+        model = StubChatModel(answer_tokens=8)
+        first = await model.ainvoke("torque the housing bolts")
+        second = await model.ainvoke("torque the housing bolts")
+        assert first.content == second.content
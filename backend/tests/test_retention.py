@@ -0,0 +1,143 @@
+"""
+Retention Tests
+Tests for pruning, archiving and vacuuming the messages table
+"""
+
+import gzip
+import json
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+async def db(tmp_path, monkeypatch):
+    """Fresh database with write-through messages and small retention batches."""
+    import database
+    from config import settings
+    monkeypatch.setattr(database, "DB_PATH", tmp_path / "chat.db")
+    monkeypatch.setattr(settings, "RETENTION_BATCH_SIZE", 3)
+    monkeypatch.setattr(settings, "RETENTION_MAX_AGE_DAYS", 0.0)
+    monkeypatch.setattr(settings, "RETENTION_MAX_MESSAGES", 0)
+    await database.init_db()
+    return database
+
+
+def _insert(database, rows):
+    """Insert (content, timestamp) rows directly."""
+    with sqlite3.connect(database.DB_PATH) as conn:
+        conn.executemany(
+            "INSERT INTO messages (session_id, role, content, timestamp) VALUES ('s1', 'user', ?, ?)", rows
+        )
+
+
+def _contents(database):
+    with sqlite3.connect(database.DB_PATH) as conn:
+        return [row[0] for row in conn.execute("SELECT content FROM messages ORDER BY id")]
+
+
+def _archived(directory):
+    lines = []
+    for path in sorted(directory.glob("*.ndjson.gz")):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            lines.extend(json.loads(line) for line in f)
+    return lines
+
+
+class TestRetention:
+    """Tests for run_retention."""
+    
+    async def test_disabled_by_default(self, db, tmp_path):
+        """Without limits nothing is removed."""
+        from retention import retention_enabled, run_retention
+        _insert(db, [(f"m{i}", "2000-01-01 00:00:00") for i in range(5)])
+        assert not retention_enabled()
+        assert (await run_retention(tmp_path / "archive"))["deleted"] == 0
+        assert len(_contents(db)) == 5
+    
+    async def test_count_limit_keeps_newest(self, db, tmp_path, monkeypatch):
+        """Only the newest RETENTION_MAX_MESSAGES survive, removed over several batches."""
+        from config import settings
+        from retention import run_retention
+        monkeypatch.setattr(settings, "RETENTION_MAX_MESSAGES", 3)
+        for i in range(10):
+            await db.add_message("user", f"m{i}", "s1")  # Queued rows are flushed first
+        
+        stats = await run_retention(tmp_path / "archive")
+        assert stats["deleted"] == 7
+        assert _contents(db) == ["m7", "m8", "m9"]
+        assert [row["content"] for row in _archived(tmp_path / "archive")] == [f"m{i}" for i in range(7)]
+    
+    async def test_age_limit(self, db, tmp_path, monkeypatch):
+        """Messages older than RETENTION_MAX_AGE_DAYS are removed, recent ones kept."""
+        from config import settings
+        from retention import run_retention
+        monkeypatch.setattr(settings, "RETENTION_MAX_AGE_DAYS", 30.0)
+        _insert(db, [(f"old{i}", "2000-01-01 00:00:00") for i in range(4)])
+        await db.add_message("user", "fresh", "s1")
+        
+        stats = await run_retention(tmp_path / "archive")
+        assert stats["deleted"] == 4
+        assert _contents(db) == ["fresh"]
+        archived = _archived(tmp_path / "archive")
+        assert archived[0]["session_id"] == "s1" and archived[0]["timestamp"] == "2000-01-01 00:00:00"
+    
+    async def test_archive_optional(self, db, tmp_path, monkeypatch):
+        """RETENTION_ARCHIVE=False deletes without writing files."""
+        from config import settings
+        from retention import run_retention
+        monkeypatch.setattr(settings, "RETENTION_MAX_MESSAGES", 1)
+        monkeypatch.setattr(settings, "RETENTION_ARCHIVE", False)
+        _insert(db, [("a", "2000-01-01 00:00:00"), ("b", "2000-01-01 00:00:00")])
+        stats = await run_retention(tmp_path / "archive")
+        assert stats == {"deleted": 1, "archived": 0, "vacuumed_pages": stats["vacuumed_pages"]}
+        assert not (tmp_path / "archive").exists()
+    
+    async def test_pruned_messages_leave_search(self, db, tmp_path, monkeypatch):
+        """Deleted rows are removed from the full-text index too."""
+        from config import settings
+        from retention import run_retention
+        monkeypatch.setattr(settings, "RETENTION_MAX_MESSAGES", 1)
+        await db.add_message("user", "carburetor cleaning", "s1")
+        await db.add_message("user", "tyre pressure", "s1")
+        await run_retention(tmp_path / "archive")
+        assert (await db.search_messages("carburetor", "s1"))["total"] == 0
+    
+    async def test_space_is_reclaimed(self, db, tmp_path, monkeypatch):
+        """Incremental vacuum shrinks the file after a large delete."""
+        from config import settings
+        from retention import run_retention
+        monkeypatch.setattr(settings, "RETENTION_MAX_MESSAGES", 1)
+        monkeypatch.setattr(settings, "RETENTION_BATCH_SIZE", 500)
+        monkeypatch.setattr(settings, "RETENTION_ARCHIVE", False)
+        _insert(db, [("x" * 2000, "2000-01-01 00:00:00") for _ in range(500)])
+        size_before = db.DB_PATH.stat().st_size
+        
+        stats = await run_retention(tmp_path / "archive")
+        assert stats["vacuumed_pages"] > 0
+        assert db.DB_PATH.stat().st_size < size_before / 2
+    
+    async def test_legacy_file_converted_to_incremental_vacuum(self, tmp_path, monkeypatch):
+        """Databases created without auto_vacuum are converted on the first run."""
+        import database
+        from retention import run_retention
+        path = tmp_path / "legacy.db"
+        with sqlite3.connect(path) as conn:
+            conn.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, role TEXT, content TEXT, timestamp DATETIME)")
+        monkeypatch.setattr(database, "DB_PATH", path)
+        await database.init_db()
+        await run_retention(tmp_path / "archive")
+        with sqlite3.connect(path) as conn:
+            assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    
+    async def test_archive_keeps_sources(self, db, tmp_path, monkeypatch):
+        """Archived answers include their stored sources."""
+        from config import settings
+        from retention import run_retention
+        monkeypatch.setattr(settings, "RETENTION_MAX_MESSAGES", 1)
+        source = {"chunk_id": "c-1", "page": 2, "score": 0.5, "preview": "..."}
+        await db.add_message("assistant", "old answer", "s1", sources=[source])
+        await db.add_message("user", "new question", "s1")
+        await run_retention(tmp_path / "archive")
+        [archived] = _archived(tmp_path / "archive")
+        assert archived["sources"] == [source]
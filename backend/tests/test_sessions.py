@@ -0,0 +1,124 @@
+"""
+Session Isolation Tests
+Tests for session ids, session-scoped history/state and per-session indexes
+"""
+
+import pytest
+from httpx import AsyncClient
+
+
+@pytest.fixture
+async def session_db(tmp_path, monkeypatch):
+    """Point the database at a fresh file."""
+    import database
+    monkeypatch.setattr(database, "DB_PATH", tmp_path / "chat.db")
+    await database.init_db()
+    return database
+
+
+class TestSessionIds:
+    """Tests for session id validation."""
+    
+    def test_missing_id_is_default(self):
+        """No header means the shared default session."""
+        from sessions import DEFAULT_SESSION, validate_session_id
+        assert validate_session_id(None) == DEFAULT_SESSION
+        assert validate_session_id("") == DEFAULT_SESSION
+    
+    @pytest.mark.parametrize("session_id", ["../etc", "a b", "x" * 65, "semi;colon"])
+    def test_unsafe_ids_rejected(self, session_id: str):
+        """Ids are directory names, so path characters are refused."""
+        from sessions import validate_session_id
+        with pytest.raises(ValueError):
+            validate_session_id(session_id)
+    
+    async def test_invalid_header_returns_400(self, client: AsyncClient):
+        """A malformed X-Session-ID is a client error."""
+        response = await client.get("/status", headers={"X-Session-ID": "../../x"})
+        assert response.status_code == 400
+
+
+class TestSessionHistory:
+    """Tests for session-keyed messages."""
+    
+    async def test_history_is_per_session(self, client: AsyncClient, session_db):
+        """Each session sees only its own messages."""
+        await session_db.add_message("user", "question a", "alice")
+        await session_db.add_message("user", "question b", "bob")
+        response = await client.get("/history", headers={"X-Session-ID": "alice"})
+        assert response.json() == [{"role": "user", "content": "question a"}]
+        page = await client.get("/history?limit=10", headers={"X-Session-ID": "bob"})
+        assert page.json()["total"] == 1
+    
+    async def test_reset_only_affects_own_session(self, client: AsyncClient, session_db):
+        """Resetting one session leaves other sessions' history and state."""
+        from state import app_state
+        await session_db.add_message("user", "keep me", "alice")
+        await session_db.add_message("user", "drop me", "bob")
+        await app_state.set_document("alice.pdf", "alice")
+        await app_state.set_document("bob.pdf", "bob")
+        
+        response = await client.post("/reset", headers={"X-Session-ID": "bob"})
+        assert response.status_code == 200
+        assert await session_db.get_history("bob") == []
+        assert await session_db.get_history("alice") == [{"role": "user", "content": "keep me"}]
+        status = await client.get("/status", headers={"X-Session-ID": "alice"})
+        assert status.json()["filename"] == "alice.pdf"
+        assert (await client.get("/status", headers={"X-Session-ID": "bob"})).json()["filename"] is None
+        await app_state.clear()
+    
+    async def test_legacy_schema_migrated(self, tmp_path, monkeypatch):
+        """Databases created before sessions get the column and index."""
+        import aiosqlite
+        import database
+        path = tmp_path / "legacy.db"
+        async with aiosqlite.connect(path) as db:
+            await db.execute(
+                "CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, role TEXT NOT NULL, "
+                "content TEXT NOT NULL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)"
+            )
+            await db.execute("INSERT INTO messages (role, content) VALUES ('user', 'old')")
+            await db.commit()
+        monkeypatch.setattr(database, "DB_PATH", path)
+        await database.init_db()
+        assert await database.get_history() == [{"role": "user", "content": "old"}]
+        async with aiosqlite.connect(path) as db:
+            async with db.execute("PRAGMA index_list(messages)") as cursor:
+                assert "idx_messages_session" in {row[1] for row in await cursor.fetchall()}
+
+
+class TestVectorStoreRegistry:
+    """Tests for lazily created, LRU-evicted session indexes."""
+    
+    @pytest.fixture
+    def registry(self, tmp_path, monkeypatch):
+        import sessions
+        from vector_store import FAISSVectorStore, VectorStoreRegistry
+        monkeypatch.setattr(sessions, "SESSION_STORE_DIR", tmp_path / "sessions")
+        return VectorStoreRegistry(FAISSVectorStore(tmp_path / "default"), max_loaded=2)
+    
+    def test_default_session_uses_shared_store(self, registry):
+        """The default session maps to the application-wide store."""
+        assert registry.get() is registry.default
+        assert len(registry) == 0
+    
+    def test_session_stores_cached_and_evicted(self, registry, tmp_path):
+        """Stores are reused until evicted least recently used first."""
+        alice = registry.get("alice")
+        assert alice.store_path == tmp_path / "sessions" / "alice"
+        registry.get("bob")
+        assert registry.get("alice") is alice
+        registry.get("carol")  # evicts bob
+        assert len(registry) == 2
+        assert registry.get("alice") is alice
+        assert registry.get("carol") is registry.get("carol")
+    
+    def test_clear_removes_index_from_disk(self, registry):
+        """Clearing a session deletes its directory even when not loaded."""
+        path = registry.get("alice").store_path
+        path.mkdir(parents=True)
+        (path / "index.faiss").write_bytes(b"x")
+        registry.get("bob")
+        registry.get("carol")  # alice evicted from memory
+        registry.clear("alice")
+        assert not path.exists()
@@ -0,0 +1,93 @@
+"""
+Startup Tests
+Import-time profile of the app: heavy dependencies must stay deferred until first use
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).parent.parent
+
+# Loaded on first upload/chat, never by `import main`
+DEFERRED_MODULES = (
+    "faiss",
+    "langchain_community",
+    "langchain_google_genai",
+    "google.genai",
+    "langchain_core.language_models",
+    "langchain_core.prompts",
+    "pypdf",
+)
+
+# Cumulative `import main` budget in ms. Wall-clock dependent, so only
+# checked when set (e.g. IMPORT_TIME_BUDGET_MS=1500 on a known machine)
+IMPORT_BUDGET_MS = os.environ.get("IMPORT_TIME_BUDGET_MS")
+
+
+def _import_profile(statement: str = "import main") -> dict[str, int]:
+    """Run `python -X importtime` in a fresh interpreter; module -> cumulative microseconds"""
+    env = {**os.environ, "GOOGLE_API_KEY": "test_key_for_testing", "ENVIRONMENT": "test"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=60,
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            profile[name.strip()] = int(cumulative)
+    return profile
+
+
+class TestImportTime:
+    """`import main` in a fresh process, as a forked worker would"""
+
+    @pytest.fixture(scope="class")
+    def profile(self):
+        return _import_profile()
+
+    def test_heavy_dependencies_deferred(self, profile):
+        """No vector store, LLM or PDF libraries are imported at startup."""
+        loaded = [
+            name for name in profile
+            if any(name == module or name.startswith(module + ".") for module in DEFERRED_MODULES)
+        ]
+        assert loaded == []
+
+    @pytest.mark.skipif(not IMPORT_BUDGET_MS, reason="IMPORT_TIME_BUDGET_MS not set")
+    def test_import_within_budget(self, profile):
+        """The whole import stays within IMPORT_TIME_BUDGET_MS."""
+        assert profile["main"] / 1000 < float(IMPORT_BUDGET_MS)
+
+
+class TestLazySingletons:
+    """Module singletons construct without touching their backends"""
+
+    def test_vector_store_defers_embeddings(self, monkeypatch):
+        """Embeddings are resolved on first use, not at construction."""
+        import embeddings
+        from vector_store import FAISSVectorStore
+
+        calls = []
+        monkeypatch.setattr(embeddings, "get_embeddings", lambda: calls.append(1) or "client")
+        store = FAISSVectorStore(BACKEND_DIR / "does-not-exist")
+        assert calls == []
+        assert store._embeddings == "client"
+        assert calls == [1]
+
+    def test_embeddings_override(self):
+        """An assigned embeddings instance takes precedence."""
+        from embeddings import HashingEmbeddings
+        from vector_store import FAISSVectorStore
+
+        store = FAISSVectorStore(BACKEND_DIR / "does-not-exist")
+        local = HashingEmbeddings(dimension=8)
+        store._embeddings = local
+        assert store._embeddings is local
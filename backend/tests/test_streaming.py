@@ -0,0 +1,139 @@
+"""
+Stream Encoding Tests
+Tests for NDJSON frame encoding and token coalescing
+"""
+
+import json
+
+import pytest
+
+
+class TestFrames:
+    """Frames must match the StreamEvent JSON shape."""
+    
+    @pytest.mark.parametrize("text", ["plain", ' quoted "x"\n', "tab\tback\\slash", "naïve ✓", "\x00\x1f"])
+    def test_token_frame_matches_model(self, text: str):
+        """Token frames decode to the same object as StreamEvent."""
+        from models import StreamEvent
+        from streaming import token_frame
+        frame = token_frame(text)
+        assert frame.endswith("}\n") and "\n" not in frame[:-1]
+        assert json.loads(frame) == json.loads(StreamEvent(type="token", data=text).model_dump_json())
+    
+    def test_event_frame(self):
+        """Structured events keep their payload."""
+        from streaming import event_frame
+        data = {"stages_ms": {"llm": 1.5}, "prompt_tokens": 10}
+        assert json.loads(event_frame("timing", data)) == {"type": "timing", "data": data}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestTokenCoalescer:
+    """Tests for time and size based coalescing."""
+    
+    def test_disabled_sends_every_token(self):
+        """A zero window keeps one frame per token."""
+        from streaming import TokenCoalescer
+        coalescer = TokenCoalescer(window_ms=0)
+        assert [coalescer.push(t) is not None for t in "abc"] == [True, True, True]
+        assert coalescer.flush() is None
+        assert coalescer.frames == 3
+    
+    def test_window_merges_tokens(self):
+        """Tokens inside the window share a frame; the first is immediate."""
+        from streaming import TokenCoalescer
+        clock = FakeClock()
+        coalescer = TokenCoalescer(window_ms=20, max_chars=1000, clock=clock)
+        assert json.loads(coalescer.push("A"))["data"] == "A"
+        clock.now = 0.005
+        assert coalescer.push("b") is None
+        clock.now = 0.010
+        assert coalescer.push("c") is None
+        clock.now = 0.021
+        assert json.loads(coalescer.push("d"))["data"] == "bcd"
+        clock.now = 0.025
+        assert coalescer.push("e") is None
+        assert json.loads(coalescer.flush())["data"] == "e"
+        assert coalescer.frames == 3
+    
+    def test_size_limit_sends_early(self):
+        """A full buffer is sent before the window ends."""
+        from streaming import TokenCoalescer
+        coalescer = TokenCoalescer(window_ms=1000, max_chars=5, clock=FakeClock())
+        coalescer.push("first")
+        assert coalescer.push("abc") is None
+        assert json.loads(coalescer.push("def"))["data"] == "abcdef"
+
+
+class TestCoalescedChat:
+    """Tests for coalescing in the chat stream."""
+    
+    async def test_answer_collected_without_parsing(self, monkeypatch):
+        """answer_parts gets the full text while frames are merged."""
+        import rag
+        from config import settings
+        from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+        from langchain_core.messages import AIMessage
+        from tests.test_rag import FakeVectorStore
+        
+        monkeypatch.setattr(settings, "STREAM_COALESCE_MS", 60_000.0)
+        monkeypatch.setattr(rag.vector_stores, "default", FakeVectorStore())
+        answer = "Tighten the bolts in a star pattern to 40 Nm."
+        monkeypatch.setattr(
+            rag, "get_llm", lambda: GenericFakeChatModel(messages=iter([AIMessage(content=answer)]))
+        )
+        
+        parts = []
+        events = [json.loads(line) async for line in rag.generate_chat_response("Step 3?", answer_parts=parts)]
+        tokens = [e["data"] for e in events if e["type"] == "token"]
+        assert "".join(parts) == answer
+        assert "".join(tokens) == answer
+        assert len(tokens) == 2  # first token, then everything else at the end
+        assert events[-1]["data"]["stream_frames"] == 2
+
+
+async def _frames(*items, delay: float = 0.0):
+    """Async NDJSON frame source with an optional pause before each frame."""
+    import asyncio
+    for item in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield item
+
+
+class TestServerSentEvents:
+    """Tests for SSE framing."""
+    
+    async def test_frames_become_numbered_events(self):
+        """Each NDJSON frame becomes an event with an increasing id."""
+        from streaming import sse_stream, token_frame
+        frames = [token_frame("Hi"), token_frame(" there")]
+        out = [chunk async for chunk in sse_stream(_frames(*frames), heartbeat_seconds=5, retry_ms=1500)]
+        assert out[0] == "retry: 1500\n\n"
+        assert out[1] == 'id: 1\ndata: {"type":"token","data":"Hi"}\n\n'
+        assert out[2].startswith("id: 2\n")
+        assert len(out) == 3
+    
+    async def test_heartbeat_while_idle(self):
+        """A comment line is sent while waiting on a slow producer."""
+        from streaming import sse_stream, token_frame
+        out = [chunk async for chunk in sse_stream(_frames(token_frame("late"), delay=0.12), heartbeat_seconds=0.05)]
+        assert ": ping\n\n" in out
+        assert out[-1].startswith("id: 1\n")
+    
+    async def test_chat_negotiates_sse(self, client):
+        """Accept: text/event-stream switches /chat to SSE."""
+        response = await client.post(
+            "/chat", json={"question": "What is this about?"}, headers={"Accept": "text/event-stream"}
+        )
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert response.headers["cache-control"] == "no-cache"
+        events = [block for block in response.text.split("\n\n") if block.startswith("id:")]
+        assert events and '"type":"error"' in events[-1]
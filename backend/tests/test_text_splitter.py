@@ -0,0 +1,80 @@
+"""
+Text Splitter Tests
+Equivalence of FastTextSplitter with LangChain's RecursiveCharacterTextSplitter
+"""
+
+import random
+
+import pytest
+
+
+def _reference(chunk_size: int, chunk_overlap: int):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+class TestEquivalence:
+    """FastTextSplitter must produce exactly the reference chunks."""
+    
+    @pytest.mark.parametrize("text", [
+        "",
+        "   \n\n  ",
+        "short text",
+        "para one\n\npara two\n\n\n\npara three",
+        "line\n" * 400,
+        "word " * 500,
+        "x" * 2500,  # no separator: falls back to characters
+        "\n\n\n" + "alpha beta\n" * 150 + "\n\n\n\n" + "gamma " * 300,
+        "tabs\tand non-breaking spaces " * 120,
+    ])
+    def test_edge_cases_default_settings(self, text: str):
+        """Edge cases at the application's chunk settings."""
+        from text_splitter import FastTextSplitter
+        assert FastTextSplitter(800, 400).split_text(text) == _reference(800, 400).split_text(text)
+    
+    def test_randomized_small_chunks(self):
+        """Random separator-heavy texts across many size/overlap pairs."""
+        from text_splitter import FastTextSplitter
+        rng = random.Random(7)
+        alphabet = ["a", "bc", " ", "  ", "\n", "\n\n", "\t", "word"]
+        for _ in range(2000):
+            chunk_size = rng.randint(1, 40)
+            chunk_overlap = rng.randint(0, chunk_size)
+            text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 150)))
+            expected = _reference(chunk_size, chunk_overlap).split_text(text)
+            assert FastTextSplitter(chunk_size, chunk_overlap).split_text(text) == expected, (
+                text, chunk_size, chunk_overlap
+            )
+    
+    def test_split_documents_copies_metadata(self):
+        """Chunks carry an independent copy of their page's metadata."""
+        from langchain_core.documents import Document
+        from text_splitter import FastTextSplitter
+        pages = [
+            Document(page_content="alpha " * 300, metadata={"page": 0, "source": "a.pdf"}),
+            Document(page_content="beta\n" * 300, metadata={"page": 1, "tags": ["x"]}),
+        ]
+        fast = FastTextSplitter(800, 400).split_documents(pages)
+        reference = _reference(800, 400).split_documents(pages)
+        assert [(d.page_content, d.metadata) for d in fast] == [(d.page_content, d.metadata) for d in reference]
+        fast[-1].metadata["tags"].append("y")
+        assert pages[1].metadata["tags"] == ["x"]
+
+
+class TestSpans:
+    """Tests for the offset interface."""
+    
+    def test_spans_index_into_source(self):
+        """Each span slices the original text to its chunk."""
+        from text_splitter import FastTextSplitter
+        text = "The pump must be primed.\n\n" * 80
+        splitter = FastTextSplitter(200, 50)
+        spans = splitter.split_spans(text)
+        assert [text[a:b] for a, b in spans] == splitter.split_text(text)
+        assert all(a < b for a, b in spans)
+    
+    def test_overlap_larger_than_size_rejected(self):
+        """Invalid settings raise like the reference splitter."""
+        from text_splitter import FastTextSplitter
+        with pytest.raises(ValueError):
+            FastTextSplitter(100, 200)
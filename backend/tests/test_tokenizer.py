@@ -0,0 +1,98 @@
+"""
+Tokenizer Tests
+Tests for the local token estimator and token-based chunking
+"""
+
+import pytest
+
+
+class TestApproxTokenizer:
+    """Tests for token counting rules."""
+    
+    @pytest.mark.parametrize("text, expected", [
+        ("", 0),
+        ("   \n\t ", 0),
+        ("bolt", 1),
+        ("tighten the bolts", 3),
+        ("internationalization", 3),  # 20 letters: 1 + 20 // 8
+        ("12345", 5),  # digits are counted one by one
+        ("step 3.", 3),
+        ("naïve café", 2),  # non-ASCII letters stay inside words
+        ("a b", 2),  # non-breaking space separates words
+    ])
+    def test_counts(self, text: str, expected: int):
+        """Known inputs give the documented counts."""
+        from tokenizer import count_tokens
+        assert count_tokens(text) == expected
+    
+    def test_prefix_counts_match_slices(self):
+        """Prefix differences equal counts of the slices they bound."""
+        from tokenizer import get_tokenizer
+        tokenizer = get_tokenizer()
+        text = "Replace filter 42-B every 3,000 hours.\n\nSee table 7."
+        prefix = tokenizer.prefix_counts(text)
+        assert len(prefix) == len(text) + 1
+        assert prefix[-1] == tokenizer.count(text)
+        for start, end in [(0, 7), (8, 14), (15, 19), (38, len(text))]:
+            assert prefix[end] - prefix[start] == tokenizer.count(text[start:end])
+    
+    def test_shared_instance(self):
+        """get_tokenizer returns one cached instance."""
+        from tokenizer import get_tokenizer
+        assert get_tokenizer() is get_tokenizer()
+
+
+class TestTokenChunking:
+    """Tests for chunk sizes measured in tokens."""
+    
+    TEXT = ("Check valve 12 for leaks before startup. " * 40 + "\n\n") * 10
+    
+    def test_chunks_fit_token_budget(self):
+        """Every chunk stays within chunk_size tokens."""
+        from text_splitter import FastTextSplitter
+        from tokenizer import count_tokens, get_tokenizer
+        chunks = FastTextSplitter(100, 20, tokenizer=get_tokenizer()).split_text(self.TEXT)
+        assert len(chunks) > 1
+        assert all(count_tokens(chunk) <= 100 for chunk in chunks)
+        # Chunks are filled, not cut at arbitrary character counts
+        assert max(count_tokens(chunk) for chunk in chunks) > 80
+    
+    def test_token_count_metadata(self):
+        """split_documents records each chunk's token count in both units."""
+        from langchain_core.documents import Document
+        from text_splitter import FastTextSplitter
+        from tokenizer import count_tokens, get_tokenizer
+        page = Document(page_content=self.TEXT, metadata={"page": 0})
+        for splitter in (
+            FastTextSplitter(800, 400, add_token_count=True),
+            FastTextSplitter(150, 30, tokenizer=get_tokenizer(), add_token_count=True),
+        ):
+            chunks = splitter.split_documents([page])
+            assert chunks
+            for chunk in chunks:
+                assert chunk.metadata["page"] == 0
+                assert chunk.metadata["token_count"] == count_tokens(chunk.page_content)
+    
+    def test_no_metadata_by_default(self):
+        """Character mode without add_token_count leaves metadata unchanged."""
+        from langchain_core.documents import Document
+        from text_splitter import FastTextSplitter
+        chunks = FastTextSplitter(800, 400).split_documents([Document(page_content=self.TEXT, metadata={"page": 1})])
+        assert all(chunk.metadata == {"page": 1} for chunk in chunks)
+    
+    def test_create_splitter_caps_at_model_limit(self, monkeypatch):
+        """Token chunk size is clamped to the embedding model's input limit."""
+        import embeddings
+        import ingestion
+        monkeypatch.setattr(ingestion, "CHUNK_SIZE_TOKENS", 5000)
+        monkeypatch.setattr(embeddings, "get_embedding_token_limit", lambda: 2048)
+        splitter = ingestion.create_splitter("tokens")
+        assert splitter.chunk_size == 2048
+        assert splitter.tokenizer is not None
+        assert splitter.add_token_count
+    
+    def test_create_splitter_rejects_unknown_unit(self):
+        """An unknown CHUNK_UNIT is a configuration error."""
+        import ingestion
+        with pytest.raises(ValueError):
+            ingestion.create_splitter("words")
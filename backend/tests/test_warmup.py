@@ -0,0 +1,182 @@
+"""
+Warm Start Tests
+Tests for index manifests, startup validation/repair and readiness reporting
+"""
+
+import json
+
+import pytest
+from httpx import AsyncClient
+
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch):
+    """Local embeddings and a vector store registry rooted in tmp_path."""
+    import sessions
+    import vector_store
+    import warmup
+    from cache import DocumentCache
+    from config import settings
+    
+    monkeypatch.setattr(settings, "EMBEDDING_PROVIDER", "local")
+    monkeypatch.setattr(sessions, "SESSION_STORE_DIR", tmp_path / "sessions")
+    monkeypatch.setattr(warmup, "SESSION_STORE_DIR", tmp_path / "sessions")
+    monkeypatch.setattr(warmup, "VECTOR_STORE_PATH", tmp_path / "default")
+    monkeypatch.setattr(DocumentCache, "CACHE_DIR", tmp_path / "cache")
+    registry = vector_store.VectorStoreRegistry(vector_store.FAISSVectorStore(tmp_path / "default"))
+    monkeypatch.setattr(vector_store, "vector_stores", registry)
+    return registry
+
+
+def _index(store, text="Step 3: tighten the bolts.", content_hash="hash-1", filename="manual.pdf"):
+    """Build and save a one-chunk index."""
+    from langchain_core.documents import Document
+    store.add_documents([Document(page_content=text, metadata={"page": 0})])
+    store.save(content_hash, filename)
+    return store
+
+
+class TestManifest:
+    """Tests for writing and verifying index manifests."""
+    
+    def test_save_writes_manifest(self, stores):
+        """Saving an index records checksums, dimension and the source document."""
+        from vector_store import read_manifest, verify_manifest
+        store = _index(stores.default)
+        manifest = read_manifest(store.store_path)
+        assert manifest["signature"].startswith("local-hash-")
+        assert manifest["vectors"] == 1
+        assert manifest["filename"] == "manual.pdf" and manifest["content_hash"] == "hash-1"
+        assert set(manifest["files"]) == {"index.faiss", "index.pkl"}
+        assert verify_manifest(store.store_path, manifest) is None
+    
+    def test_detects_corruption_and_incompatibility(self, stores):
+        """Torn files, another model or another dimension are rejected."""
+        from vector_store import read_manifest, verify_manifest
+        store = _index(stores.default)
+        path = store.store_path
+        manifest = read_manifest(path)
+        
+        assert verify_manifest(path, None) == "no_manifest"
+        assert verify_manifest(path, {**manifest, "signature": "google-text-embedding-004"}) == "model_changed"
+        assert verify_manifest(path, {**manifest, "dimension": 3}) == "dimension_mismatch"
+        with open(path / "index.faiss", "ab") as f:
+            f.write(b"garbage")
+        assert verify_manifest(path, manifest) == "checksum_mismatch"
+        (path / "index.faiss").unlink()
+        assert verify_manifest(path, manifest) == "missing_file"
+
+
+class TestWarmStores:
+    """Tests for validating, repairing and loading indexes at startup."""
+    
+    def test_valid_indexes_are_loaded(self, stores):
+        """Default and session indexes come back loaded, with their document names."""
+        import vector_store
+        from warmup import warm_stores
+        _index(stores.default)
+        _index(stores.get("alice"), filename="alice.pdf")
+        
+        # A fresh process: same files, nothing in memory
+        fresh = vector_store.VectorStoreRegistry(vector_store.FAISSVectorStore(stores.default.store_path))
+        vector_store.vector_stores = fresh
+        summary = warm_stores()
+        
+        assert summary["validated"] == 2 and summary["loaded"] == 2
+        assert summary["documents"] == {"default": "manual.pdf", "alice": "alice.pdf"}
+        assert fresh.default._vectorstore is not None
+        assert fresh.get("alice")._vectorstore is not None
+    
+    def test_corrupt_index_rebuilt_from_cache(self, stores):
+        """A damaged index is restored from the DocumentCache copy of its document."""
+        from cache import DocumentCache
+        from vector_store import read_manifest, verify_manifest
+        from warmup import warm_stores
+        store = _index(stores.default)
+        DocumentCache.cache_index("hash-1", store._vectorstore, 1)
+        with open(store.store_path / "index.faiss", "ab") as f:
+            f.write(b"garbage")
+        
+        summary = warm_stores()
+        assert summary["rebuilt"] == 1 and summary["dropped"] == 0
+        assert verify_manifest(store.store_path, read_manifest(store.store_path)) is None
+        assert store.similarity_search("tighten bolts", k=1)[0].page_content.startswith("Step 3")
+    
+    def test_unrecoverable_index_dropped(self, stores):
+        """Without a cached copy a damaged index is removed so the session re-uploads."""
+        from warmup import warm_stores
+        store = _index(stores.get("bob"))
+        manifest = json.loads((store.store_path / "manifest.json").read_text())
+        manifest["signature"] = "some-other-model"
+        (store.store_path / "manifest.json").write_text(json.dumps(manifest))
+        
+        summary = warm_stores()
+        assert summary["dropped"] == 1
+        assert summary["documents"] == {}
+        assert not store.store_path.exists()
+    
+    def test_load_limit(self, stores):
+        """Only the newest session indexes up to the limit are loaded eagerly."""
+        import vector_store
+        from warmup import warm_stores
+        for name in ("s1", "s2", "s3"):
+            _index(stores.get(name))
+        
+        fresh = vector_store.VectorStoreRegistry(vector_store.FAISSVectorStore(stores.default.store_path))
+        vector_store.vector_stores = fresh
+        summary = warm_stores(max_loaded=1)
+        assert summary["validated"] == 3
+        assert summary["loaded"] == 1
+        assert fresh.get("s3")._vectorstore is not None
+        assert fresh.get("s1")._vectorstore is None
+
+
+class TestReadiness:
+    """Tests for warm start readiness in /health."""
+    
+    @pytest.fixture
+    def readiness(self):
+        from warmup import readiness
+        yield readiness
+        readiness.finish({})
+    
+    async def test_health_reports_warming(self, client: AsyncClient, readiness):
+        """/health answers 503 until warm-up has finished."""
+        readiness.begin()
+        response = await client.get("/health")
+        assert response.status_code == 503
+        assert response.json()["status"] == "warming"
+        
+        readiness.finish({"loaded": 1})
+        response = await client.get("/health")
+        assert response.status_code == 200
+        assert response.json()["ready"] is True and response.json()["loaded"] == 1
+    
+    async def test_warm_start_restores_documents(self, stores, readiness):
+        """Documents of warmed indexes show up in /status again."""
+        from state import app_state
+        from warmup import start_warmup
+        _index(stores.get("carol"), filename="carol.pdf")
+        
+        task = start_warmup()
+        assert not readiness.ready
+        await task
+        assert readiness.ready
+        assert await app_state.get_document("carol") == "carol.pdf"
+        await app_state.clear("carol")
+
+
+class TestDatabaseCheck:
+    """Tests for the startup database integrity check."""
+    
+    async def test_corrupt_database_moved_aside(self, tmp_path, monkeypatch):
+        """An unreadable database is quarantined and a fresh one created."""
+        import database
+        path = tmp_path / "chat.db"
+        path.write_bytes(b"this is not sqlite" * 100)
+        monkeypatch.setattr(database, "DB_PATH", path)
+        
+        assert await database.check_db() is False
+        assert list(tmp_path.glob("chat.db.corrupt-*"))
+        await database.init_db()
+        assert await database.check_db() is True
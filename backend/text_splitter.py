@@ -0,0 +1,210 @@
+"""
+Fast Text Splitter
+Offset-based equivalent of LangChain's RecursiveCharacterTextSplitter.
+
+With literal separators kept at the start of each piece (the LangChain
+default), every piece is a contiguous slice of the input and merged chunks
+are contiguous too. So the whole split can run on (start, end) offsets into
+one buffer: separator positions are found once per separator with a single
+regex scan, recursion narrows offset ranges, and text is copied only when
+a finished chunk is emitted.
+
+Output is identical to RecursiveCharacterTextSplitter(chunk_size,
+chunk_overlap) with default separators, keep_separator=True,
+strip_whitespace=True and len as the length function.
+
+Given a tokenizer, chunk_size and chunk_overlap are measured in tokens
+instead: the text is tokenized once into a prefix-count array and every
+length becomes prefix[end] - prefix[start].
+"""
+
+import copy
+import re
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Iterable, List, Optional, Sequence, Tuple
+
+from tokenizer import ApproxTokenizer, get_tokenizer
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+DEFAULT_SEPARATORS = ("\n\n", "\n", " ", "")
+
+Span = Tuple[int, int]
+
+_IMMUTABLE_TYPES = (str, int, float, bool, type(None))
+
+
+class FastTextSplitter:
+    """Split text into overlapping chunks using offsets instead of substrings"""
+
+    def __init__(
+        self,
+        chunk_size: int = 4000,
+        chunk_overlap: int = 200,
+        separators: Optional[Sequence[str]] = None,
+        tokenizer: Optional[ApproxTokenizer] = None,
+        add_token_count: bool = False,
+    ):
+        """
+        Args:
+            chunk_size: Maximum chunk length (characters, or tokens with a tokenizer)
+            chunk_overlap: Target overlap between chunks, same unit
+            separators: Split points in priority order
+            tokenizer: Measure lengths in this tokenizer's tokens
+            add_token_count: Store each chunk's token count in
+                metadata["token_count"] (uses the shared tokenizer if none given)
+        """
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size must be > 0, got {chunk_size}")
+        if chunk_overlap < 0:
+            raise ValueError(f"chunk_overlap must be >= 0, got {chunk_overlap}")
+        if chunk_overlap > chunk_size:
+            raise ValueError(
+                f"Got a larger chunk overlap ({chunk_overlap}) than chunk size ({chunk_size}), should be smaller."
+            )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = tuple(separators or DEFAULT_SEPARATORS)
+        self.tokenizer = tokenizer
+        self.add_token_count = add_token_count
+        self._counter = tokenizer or (get_tokenizer() if add_token_count else None)
+
+    # ============ Public API ============
+
+    def split_spans(self, text: str) -> List[Span]:
+        """
+        Split text into chunk offsets.
+
+        Returns:
+            (start, end) pairs such that text[start:end] is each chunk
+        """
+        return _SplitRun(text, self).spans()
+
+    def split_text(self, text: str) -> List[str]:
+        """Split text into chunk strings"""
+        return [text[start:end] for start, end in self.split_spans(text)]
+
+    def split_documents(self, documents: Iterable["Document"]) -> List["Document"]:
+        """Split each document, copying its metadata onto every chunk"""
+        from langchain_core.documents import Document
+
+        chunks = []
+        for document in documents:
+            metadata = document.metadata
+            # Flat metadata of immutable values (PDF pages) needs only a shallow copy
+            shallow = all(isinstance(value, _IMMUTABLE_TYPES) for value in metadata.values())
+            text = document.page_content
+            run = _SplitRun(text, self)
+            prefix = run.prefix
+            if self.add_token_count and prefix is None and self._counter is not None:
+                prefix = self._counter.prefix_counts(text)
+            for start, end in run.spans():
+                chunk_metadata = dict(metadata) if shallow else copy.deepcopy(metadata)
+                if self.add_token_count and prefix is not None:
+                    chunk_metadata["token_count"] = prefix[end] - prefix[start]
+                chunks.append(Document(page_content=text[start:end], metadata=chunk_metadata))
+        return chunks
+
+
+class _SplitRun:
+    """State for splitting one text: the buffer, cached separator positions and token prefix"""
+
+    def __init__(self, text: str, splitter: FastTextSplitter):
+        self.text = text
+        self.chunk_size = splitter.chunk_size
+        self.chunk_overlap = splitter.chunk_overlap
+        self.separators = splitter.separators
+        self._positions: dict = {}
+        # Cumulative token counts by offset in token mode, None in character mode
+        self.prefix = splitter.tokenizer.prefix_counts(text) if splitter.tokenizer else None
+
+    def spans(self) -> List[Span]:
+        chunks: List[Span] = []
+        self._split(0, len(self.text), 0, chunks)
+        return chunks
+
+    def _occurrences(self, separator: str, start: int, end: int) -> List[int]:
+        """
+        Start offsets of non-overlapping separator matches inside [start, end),
+        scanning left to right as re.split would on text[start:end].
+        """
+        positions = self._positions.get(separator)
+        if positions is None:
+            positions = [m.start() for m in re.finditer(re.escape(separator), self.text)]
+            self._positions[separator] = positions
+        length = len(separator)
+        first = bisect_left(positions, start)
+        # A whole-text match straddling `start` shifts where a fresh scan
+        # would match (e.g. "\n\n" in a run of newlines); rescan that span
+        if length > 1 and first > 0 and positions[first - 1] + length > start:
+            pattern = re.compile(re.escape(separator))
+            return [m.start() for m in pattern.finditer(self.text, start, end)]
+        last = bisect_left(positions, end - length + 1, first)
+        return positions[first:last]
+
+    def _pieces(self, start: int, end: int, level: int) -> Tuple[List[Span], int]:
+        """Split [start, end) at the first separator present; return pieces and next level"""
+        for index in range(level, len(self.separators)):
+            separator = self.separators[index]
+            if not separator:
+                return [(i, i + 1) for i in range(start, end)], len(self.separators)
+            found = self._occurrences(separator, start, end)
+            if found:
+                # Keep each separator at the start of the following piece
+                bounds = [start] + found + [end]
+                pieces = [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+                return pieces, index + 1
+        # No separator matched and none is "": the last one is used (no split)
+        return [(start, end)], len(self.separators)
+
+    def _split(self, start: int, end: int, level: int, chunks: List[Span]) -> None:
+        pieces, next_level = self._pieces(start, end, level)
+        chunk_size = self.chunk_size
+        prefix = self.prefix
+        good: List[Span] = []
+        for piece in pieces:
+            length = piece[1] - piece[0] if prefix is None else prefix[piece[1]] - prefix[piece[0]]
+            if length < chunk_size:
+                good.append(piece)
+                continue
+            if good:
+                self._merge(good, chunks)
+                good = []
+            if next_level >= len(self.separators):
+                chunks.append(piece)  # Unsplittable: emitted as-is, unstripped
+            else:
+                self._split(piece[0], piece[1], next_level, chunks)
+        if good:
+            self._merge(good, chunks)
+
+    def _merge(self, pieces: List[Span], chunks: List[Span]) -> None:
+        """Combine adjacent pieces into chunks of at most chunk_size with overlap"""
+        chunk_size = self.chunk_size
+        chunk_overlap = self.chunk_overlap
+        prefix = self.prefix
+        window_start = 0  # Index into pieces of the current chunk's first piece
+        total = 0
+        for index, (start, end) in enumerate(pieces):
+            length = end - start if prefix is None else prefix[end] - prefix[start]
+            if total + length > chunk_size:
+                if index > window_start:
+                    self._emit(pieces[window_start][0], pieces[index - 1][1], chunks)
+                    # Drop leading pieces until only the overlap remains
+                    while total > chunk_overlap or (total + length > chunk_size and total > 0):
+                        first = pieces[window_start]
+                        total -= first[1] - first[0] if prefix is None else prefix[first[1]] - prefix[first[0]]
+                        window_start += 1
+            total += length
+        if window_start < len(pieces):
+            self._emit(pieces[window_start][0], pieces[-1][1], chunks)
+
+    def _emit(self, start: int, end: int, chunks: List[Span]) -> None:
+        """Append a chunk with surrounding whitespace trimmed, skipping empty ones"""
+        text = self.text
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end > start:
+            chunks.append((start, end))
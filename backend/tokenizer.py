@@ -0,0 +1,94 @@
+"""
+Tokenizer Module
+Fast local approximation of subword tokenizers (Gemini / SentencePiece style)
+for sizing chunks and prompts without a remote call.
+
+Counting rules, applied per character class in one vectorized NumPy pass:
+    letters:     1 token per word, plus 1 per further 8 characters
+    digits:      1 token each (SentencePiece models split numbers by digit)
+    punctuation: 1 token each
+    whitespace:  free
+
+Counts are deliberately a little pessimistic so token budgets hold.
+"""
+
+import threading
+from typing import List
+
+import numpy as np
+
+# Character classes
+_SPACE, _LETTER, _DIGIT, _PUNCT = 0, 1, 2, 3
+
+# Lookup for ASCII code points; everything above 127 is treated as a letter
+_ASCII_CLASSES = np.full(128, _PUNCT, dtype=np.int8)
+_ASCII_CLASSES[[ord(c) for c in " \t\n\r\x0b\x0c"]] = _SPACE
+_ASCII_CLASSES[:32] = _SPACE
+_ASCII_CLASSES[ord("0"):ord("9") + 1] = _DIGIT
+_ASCII_CLASSES[ord("a"):ord("z") + 1] = _LETTER
+_ASCII_CLASSES[ord("A"):ord("Z") + 1] = _LETTER
+
+CHARS_PER_EXTRA_TOKEN = 8
+
+
+class ApproxTokenizer:
+    """Character-class token estimator; stateless and thread-safe"""
+
+    def _weights(self, text: str) -> np.ndarray:
+        """Token weight attributed to each character (at token starts)"""
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+        classes = np.full(len(codes), _LETTER, dtype=np.int8)
+        ascii_mask = codes < 128
+        classes[ascii_mask] = _ASCII_CLASSES[codes[ascii_mask]]
+        # Common non-ASCII spaces (NBSP, en/em/thin spaces, ideographic space)
+        classes[(codes == 0xA0) | ((codes >= 0x2000) & (codes <= 0x200B)) | (codes == 0x3000)] = _SPACE
+
+        weights = np.zeros(len(codes), dtype=np.int32)
+        weights[(classes == _DIGIT) | (classes == _PUNCT)] = 1
+
+        # Letter runs: one token at the run start, plus one per extra 8 chars
+        letters = (classes == _LETTER).astype(np.int8)
+        edges = np.diff(letters, prepend=0, append=0)
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        weights[starts] = 1 + (ends - starts) // CHARS_PER_EXTRA_TOKEN
+        return weights
+
+    def count(self, text: str) -> int:
+        """Approximate number of tokens in text"""
+        if not text:
+            return 0
+        return int(self._weights(text).sum())
+
+    def prefix_counts(self, text: str) -> List[int]:
+        """
+        Cumulative token counts by character offset.
+
+        Returns:
+            List of len(text) + 1 ints; tokens in text[a:b] are
+            prefix[b] - prefix[a] (each token counted at its first character)
+        """
+        prefix = np.zeros(len(text) + 1, dtype=np.int64)
+        if text:
+            np.cumsum(self._weights(text), out=prefix[1:])
+        counts: List[int] = prefix.tolist()
+        return counts
+
+
+_instance: ApproxTokenizer | None = None
+_instance_lock = threading.Lock()
+
+
+def get_tokenizer() -> ApproxTokenizer:
+    """Shared tokenizer instance (created once)"""
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = ApproxTokenizer()
+    return _instance
+
+
+def count_tokens(text: str) -> int:
+    """Approximate token count using the shared tokenizer"""
+    return get_tokenizer().count(text)
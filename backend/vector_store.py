@@ -1,34 +1,168 @@
 """
 Vector Store Abstraction Layer
 Enables swapping FAISS for Pinecone/Qdrant without code changes
+
+LangChain's FAISS wrapper and the embeddings client are imported and
+created on first use, so importing this module (and the app) stays cheap.
 """
 
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import List, Optional
+from collections import OrderedDict
+from typing import TYPE_CHECKING, List, Optional, Tuple
+import hashlib
+import json
 import shutil
+import threading
+import time
 
-from langchain_core.documents import Document
-from langchain_community.vectorstores import FAISS
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-
-from config import VECTOR_STORE_PATH, EMBEDDING_MODEL, GOOGLE_API_KEY, RETRIEVER_K
+from config import VECTOR_STORE_PATH, RETRIEVER_K, SESSION_MAX_LOADED_INDEXES, SESSION_STORE_DIR
+from index_factory import configure_search, index_metric
 from logging_config import get_logger
+from metrics import EMBEDDING_SECONDS, VECTOR_SEARCH_SECONDS, StageTimings
+from sessions import DEFAULT_SESSION, session_store_path
+
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
 
 logger = get_logger(__name__)
 
 
+def wrap_index(index, embeddings, docstore, index_to_docstore_id) -> "FAISS":
+    """
+    Build the LangChain FAISS wrapper matching an index's metric.
+    Inner-product (cosine) indexes get normalizing embeddings and
+    max-inner-product scoring so queries and incremental adds are unit length.
+    """
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.vectorstores.utils import DistanceStrategy
+    from embeddings import normalized
+
+    if index_metric(index) == "cosine":
+        embeddings = normalized(embeddings)
+        strategy = DistanceStrategy.MAX_INNER_PRODUCT
+    else:
+        strategy = DistanceStrategy.EUCLIDEAN_DISTANCE
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+        distance_strategy=strategy,
+    )
+
+
+def load_faiss(path: Path, embeddings) -> "FAISS":
+    """Load a saved FAISS store, restoring its metric and search parameters"""
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+
+    loaded = FAISS.load_local(str(path), embeddings, allow_dangerous_deserialization=True)
+    configure_search(loaded.index)
+    # Indexes saved before chunks carried their docstore id
+    for doc_id in loaded.index_to_docstore_id.values():
+        document = loaded.docstore.search(doc_id)
+        if isinstance(document, Document) and document.id is None:
+            document.id = doc_id
+    return wrap_index(loaded.index, embeddings, loaded.docstore, loaded.index_to_docstore_id)
+
+
+# ============ Manifest ============
+# Written next to index.faiss/index.pkl on save, so a restart can tell a
+# complete, compatible index from a torn or foreign one before loading it.
+
+MANIFEST_NAME = "manifest.json"
+_INDEX_FILES = ("index.faiss", "index.pkl")
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_manifest(path: Path, index, content_hash: Optional[str] = None, filename: Optional[str] = None) -> dict:
+    """Record checksums and the embedding space of a saved index"""
+    from embeddings import embedding_signature
+
+    manifest = {
+        "signature": embedding_signature(),
+        "dimension": int(index.d),
+        "metric": index_metric(index),
+        "vectors": int(index.ntotal),
+        "files": {name: _sha256(path / name) for name in _INDEX_FILES},
+        "content_hash": content_hash,
+        "filename": filename,
+        "saved_at": time.time(),
+    }
+    # Written last and replaced atomically: no manifest means no complete save
+    tmp = path / (MANIFEST_NAME + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2))
+    tmp.replace(path / MANIFEST_NAME)
+    return manifest
+
+
+def read_manifest(path: Path) -> Optional[dict]:
+    """A store's manifest, or None if missing or unreadable"""
+    try:
+        manifest: dict = json.loads((path / MANIFEST_NAME).read_text())
+        return manifest
+    except (OSError, ValueError):
+        return None
+
+
+def verify_manifest(path: Path, manifest: Optional[dict], embeddings=None) -> Optional[str]:
+    """
+    Check a saved index against its manifest and the configured embeddings.
+
+    Returns:
+        None if the index can be loaded, otherwise the reason it cannot
+        (no_manifest, model_changed, dimension_mismatch, missing_file,
+        checksum_mismatch)
+    """
+    from embeddings import embedding_signature, get_embedding_dimension, get_embeddings
+
+    if manifest is None:
+        return "no_manifest"
+    if manifest.get("signature") != embedding_signature():
+        return "model_changed"
+    if manifest.get("dimension") != get_embedding_dimension(embeddings or get_embeddings()):
+        return "dimension_mismatch"
+    for name, checksum in manifest.get("files", {}).items():
+        if not (path / name).exists():
+            return "missing_file"
+        if _sha256(path / name) != checksum:
+            return "checksum_mismatch"
+    return None
+
+
 class VectorStoreInterface(ABC):
     """Abstract interface for vector stores - enables provider swapping"""
     
     @abstractmethod
-    def add_documents(self, documents: List[Document]) -> int:
+    def add_documents(self, documents: List["Document"]) -> int:
         """Add documents to the store. Returns count added."""
         pass
     
     @abstractmethod
-    def similarity_search(self, query: str, k: int = 5) -> List[Document]:
-        """Search for similar documents."""
+    def similarity_search(
+        self, query: str, k: int = 5, timings: Optional[StageTimings] = None
+    ) -> List["Document"]:
+        """Search for similar documents. Stage durations go into `timings` if given."""
+        pass
+    
+    @abstractmethod
+    def similarity_search_with_score(
+        self, query: str, k: int = 5, timings: Optional[StageTimings] = None
+    ) -> List[Tuple["Document", float]]:
+        """
+        Search returning (document, score) pairs, best first.
+        Scores are cosine similarities in [-1, 1] for cosine indexes and
+        L2 distances (lower is closer) for L2 indexes.
+        """
         pass
     
     @abstractmethod
@@ -52,32 +186,73 @@ class FAISSVectorStore(VectorStoreInterface):
     
     def __init__(self, store_path: Path = VECTOR_STORE_PATH):
         self.store_path = store_path
-        self._embeddings = GoogleGenerativeAIEmbeddings(
-            model=EMBEDDING_MODEL,
-            google_api_key=GOOGLE_API_KEY
-        )
-        self._vectorstore: Optional[FAISS] = None
-    
-    def add_documents(self, documents: List[Document]) -> int:
-        """Add documents to FAISS index"""
+        self._embeddings_override = None
+        self._vectorstore: Optional["FAISS"] = None
+        self._load_lock = threading.Lock()  # Searches run in worker threads
+    
+    @property
+    def _embeddings(self):
+        """Embeddings client, resolved on first use rather than at construction"""
+        from embeddings import get_embeddings
+        return self._embeddings_override or get_embeddings()
+    
+    @_embeddings.setter
+    def _embeddings(self, embeddings) -> None:
+        self._embeddings_override = embeddings
+    
+    def add_documents(self, documents: List["Document"]) -> int:
+        """
+        Add documents to FAISS index.
+        The first batch picks the index type (see index_factory); later batches
+        are appended in place. Flat and HNSW indexes need no retraining; trained
+        IVF/PQ indexes keep the centroids learned from the first batch.
+        """
         if self._vectorstore is None:
-            self._vectorstore = FAISS.from_documents(documents, self._embeddings)
+            from ingestion import create_optimized_vectorstore
+            self._vectorstore = create_optimized_vectorstore(documents, self._embeddings, len(documents))
         else:
             self._vectorstore.add_documents(documents)
         return len(documents)
     
-    def similarity_search(self, query: str, k: int = RETRIEVER_K) -> List[Document]:
+    def similarity_search(
+        self,
+        query: str,
+        k: int = RETRIEVER_K,
+        timings: Optional[StageTimings] = None,
+    ) -> List["Document"]:
         """Search for similar documents in FAISS index"""
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, timings)]
+    
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = RETRIEVER_K,
+        timings: Optional[StageTimings] = None,
+    ) -> List[Tuple["Document", float]]:
+        """Search returning (document, score) pairs from FAISS index"""
+        timings = timings or StageTimings()
         if self._vectorstore is None:
-            self._load()
+            with timings.stage("index_load"):
+                self._load()
         if self._vectorstore is None:
             raise FileNotFoundError("No documents indexed. Please upload a PDF first.")
-        return self._vectorstore.similarity_search(query, k=k)
+        # The store's own embeddings normalize queries for cosine indexes
+        embeddings = self._vectorstore.embeddings or self._embeddings
+        # Embed and search separately so each shows up in metrics
+        with EMBEDDING_SECONDS.time(operation="query"), timings.stage("embedding"):
+            embedding = embeddings.embed_query(query)
+        with VECTOR_SEARCH_SECONDS.time(), timings.stage("search"):
+            results = self._vectorstore.similarity_search_with_score_by_vector(embedding, k=k)
+        return [(doc, float(score)) for doc, score in results]
     
-    def save(self) -> None:
-        """Save FAISS index to disk"""
+    def save(self, content_hash: Optional[str] = None, filename: Optional[str] = None) -> None:
+        """
+        Save FAISS index to disk with its manifest. The source document's
+        hash and name let a restart restore it (see warmup.py).
+        """
         if self._vectorstore is not None:
             self._vectorstore.save_local(str(self.store_path))
+            write_manifest(self.store_path, self._vectorstore.index, content_hash, filename)
             logger.info("vector_store_saved", path=str(self.store_path))
     
     def exists(self) -> bool:
@@ -92,15 +267,67 @@ class FAISSVectorStore(VectorStoreInterface):
             logger.info("vector_store_cleared")
     
     def _load(self) -> None:
-        """Load FAISS index from disk if it exists"""
-        if self.store_path.exists():
-            self._vectorstore = FAISS.load_local(
-                str(self.store_path),
-                self._embeddings,
-                allow_dangerous_deserialization=True
-            )
-            logger.debug("vector_store_loaded", path=str(self.store_path))
+        """Load FAISS index from disk if it exists (once when searches race)"""
+        with self._load_lock:
+            if self._vectorstore is None and self.store_path.exists():
+                self._vectorstore = load_faiss(self.store_path, self._embeddings)
+                logger.debug("vector_store_loaded", path=str(self.store_path))
+
+
+class VectorStoreRegistry:
+    """
+    Per-session vector stores.
+    
+    The default session uses the application-wide store. Other sessions get
+    a store over their own directory, created on first use; its index loads
+    lazily on the first search. At most `max_loaded` session stores are held
+    in memory, least recently used evicted first. Evicted indexes stay on
+    disk and reload on next use.
+    """
+    
+    def __init__(self, default: FAISSVectorStore, max_loaded: int = SESSION_MAX_LOADED_INDEXES):
+        self.default = default
+        self.max_loaded = max_loaded
+        self._stores: "OrderedDict[str, FAISSVectorStore]" = OrderedDict()
+        self._lock = threading.Lock()  # Ingestion runs in worker threads
+    
+    def get(self, session_id: str = DEFAULT_SESSION) -> FAISSVectorStore:
+        """Store for a session"""
+        if session_id == DEFAULT_SESSION:
+            return self.default
+        with self._lock:
+            store = self._stores.get(session_id)
+            if store is None:
+                store = FAISSVectorStore(session_store_path(session_id))
+                self._stores[session_id] = store
+                while len(self._stores) > self.max_loaded:
+                    evicted, _ = self._stores.popitem(last=False)
+                    logger.debug("vector_store_evicted", session=evicted)
+            else:
+                self._stores.move_to_end(session_id)
+            return store
+    
+    def clear(self, session_id: str = DEFAULT_SESSION) -> None:
+        """Delete a session's index from memory and disk"""
+        if session_id == DEFAULT_SESSION:
+            self.default.clear()
+            return
+        with self._lock:
+            store = self._stores.pop(session_id, None)
+        (store or FAISSVectorStore(session_store_path(session_id))).clear()
+    
+    def clear_all(self) -> None:
+        """Delete every session's index"""
+        with self._lock:
+            self._stores.clear()
+        self.default.clear()
+        if SESSION_STORE_DIR.exists():
+            shutil.rmtree(SESSION_STORE_DIR)
+    
+    def __len__(self) -> int:
+        return len(self._stores)
 
 
-# Singleton instance for application-wide use
+# Singleton instances for application-wide use (cheap: indexes and embeddings load on first use)
 vector_store = FAISSVectorStore()
+vector_stores = VectorStoreRegistry(vector_store)
@@ -0,0 +1,168 @@
+"""
+Warm Start
+Reuses the chat database and FAISS indexes of a previous run (PERSISTENT mode).
+
+At startup every saved index is checked against its manifest: embedding
+signature and dimension must match the configured provider and the
+index files their checksums. Valid indexes are loaded in a worker thread
+(the default session's, plus the most recently saved session indexes up to
+SESSION_MAX_LOADED_INDEXES; the rest load on first use). An index that
+fails the checks is rebuilt from the DocumentCache copy of its document
+when there is one, and dropped otherwise, so that session re-uploads.
+
+Until the pass finishes `readiness` reports warming and /health answers
+503, so load balancers hold traffic back.
+"""
+
+import asyncio
+import time
+from pathlib import Path
+from typing import Optional, TypedDict
+
+from config import SESSION_MAX_LOADED_INDEXES, SESSION_STORE_DIR, VECTOR_STORE_PATH
+from logging_config import get_logger
+from sessions import DEFAULT_SESSION, validate_session_id
+
+logger = get_logger(__name__)
+
+
+class Readiness:
+    """Startup progress reported by /health"""
+
+    def __init__(self):
+        self.ready = True  # Nothing to warm unless warm_start runs
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.summary: dict = {}
+
+    def begin(self) -> None:
+        self.ready = False
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.summary = {}
+
+    def finish(self, summary: dict) -> None:
+        self.summary = summary
+        self.finished_at = time.monotonic()
+        self.ready = True
+
+    def as_dict(self) -> dict:
+        info = {"ready": self.ready, **self.summary}
+        if self.started_at is not None:
+            end = self.finished_at or time.monotonic()
+            info["warmup_ms"] = round((end - self.started_at) * 1000, 1)
+        return info
+
+
+readiness = Readiness()
+
+
+class WarmSummary(TypedDict):
+    """What warm_stores did with the saved indexes"""
+    loaded: int
+    validated: int
+    rebuilt: int
+    dropped: int
+    documents: dict[str, str]  # Session id -> document name
+
+
+def _saved_stores() -> list[tuple[str, Path]]:
+    """(session id, index directory) of every index on disk"""
+    stores = []
+    if VECTOR_STORE_PATH.exists():
+        stores.append((DEFAULT_SESSION, VECTOR_STORE_PATH))
+    if SESSION_STORE_DIR.exists():
+        for path in SESSION_STORE_DIR.iterdir():
+            try:
+                session_id = validate_session_id(path.name)
+            except ValueError:
+                continue
+            if path.is_dir() and session_id != DEFAULT_SESSION:
+                stores.append((session_id, path))
+    return stores
+
+
+def _rebuild(store, manifest: Optional[dict]) -> bool:
+    """Restore a store from the DocumentCache copy of its document"""
+    from cache import DocumentCache
+
+    if manifest is None:
+        return False
+    content_hash = manifest.get("content_hash")
+    if not content_hash or not DocumentCache.has_cached_index(content_hash):
+        return False
+    cached = DocumentCache.load_cached_index(content_hash)
+    if cached is None:
+        return False
+    store._vectorstore = cached
+    store.save(content_hash, manifest.get("filename"))
+    return True
+
+
+def warm_stores(max_loaded: int = SESSION_MAX_LOADED_INDEXES) -> WarmSummary:
+    """
+    Validate, repair and load saved indexes (blocking; run in a thread).
+
+    Returns:
+        Counts of loaded, validated, rebuilt and dropped indexes, and the
+        document name of every usable one
+    """
+    from vector_store import read_manifest, vector_stores, verify_manifest
+
+    summary: WarmSummary = {"loaded": 0, "validated": 0, "rebuilt": 0, "dropped": 0, "documents": {}}
+    usable = []
+    for session_id, path in _saved_stores():
+        store = vector_stores.get(session_id)
+        manifest = read_manifest(path)
+        reason = verify_manifest(path, manifest, store._embeddings)
+        if manifest is not None and reason is None:
+            summary["validated"] += 1
+            usable.append((manifest.get("saved_at", 0), session_id, store))
+        elif _rebuild(store, manifest):
+            logger.warning("index_rebuilt", session=session_id, reason=reason)
+            summary["rebuilt"] += 1
+            summary["loaded"] += 1  # Rebuilding leaves it in memory
+        else:
+            logger.warning("index_dropped", session=session_id, reason=reason)
+            vector_stores.clear(session_id)
+            summary["dropped"] += 1
+            continue
+        if manifest and manifest.get("filename"):
+            summary["documents"][session_id] = manifest["filename"]
+
+    # The default index plus the most recently saved sessions, oldest
+    # first so the registry's LRU order ends with the newest
+    default = [item for item in usable if item[1] == DEFAULT_SESSION]
+    sessions = sorted(item for item in usable if item[1] != DEFAULT_SESSION)
+    recent = sessions[len(sessions) - max_loaded:] if max_loaded > 0 else []
+    for _, session_id, store in default + recent:
+        try:
+            store._load()
+            summary["loaded"] += 1
+        except Exception as e:
+            logger.warning("index_load_failed", session=session_id, error=str(e))
+    return summary
+
+
+def start_warmup() -> asyncio.Task:
+    """Mark the app as warming and start warm_start in the background"""
+    readiness.begin()
+    return asyncio.create_task(warm_start(), name="warm-start")
+
+
+async def warm_start() -> None:
+    """Warm indexes, restore document names and mark the app ready"""
+    from state import app_state
+
+    info: dict
+    try:
+        summary = await asyncio.to_thread(warm_stores)
+        for session_id, filename in summary["documents"].items():
+            await app_state.set_document(filename, session_id)
+        info = {**summary, "documents": len(summary["documents"])}
+        logger.info("warm_start_complete", **info)
+    except Exception as e:
+        logger.exception("warm_start_failed", error=str(e))
+        info = {"error": str(e)}
+    # Serve either way: unloaded indexes still load lazily on first use
+    readiness.finish(info)
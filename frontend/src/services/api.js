@@ -8,6 +8,22 @@ const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 // Default timeout for requests (10 seconds)
 const DEFAULT_TIMEOUT = 10000;
 
+const SESSION_STORAGE_KEY = 'rag-session-id';
+
+/**
+ * Session id for this browser, created once and kept in localStorage.
+ * The backend scopes the document, its index and chat history to it.
+ * @returns {string}
+ */
+export function getSessionId() {
+  let id = localStorage.getItem(SESSION_STORAGE_KEY);
+  if (!id) {
+    id = crypto.randomUUID();
+    localStorage.setItem(SESSION_STORAGE_KEY, id);
+  }
+  return id;
+}
+
 /**
  * Wrapper for fetch with timeout support
  * @param {string} url - URL to fetch
@@ -22,6 +38,7 @@ async function fetchWithTimeout(url, options = {}, timeout = DEFAULT_TIMEOUT) {
   try {
     const response = await fetch(url, {
       ...options,
+      headers: { 'X-Session-ID': getSessionId(), ...options.headers },
       signal: controller.signal,
     });
     return response;
@@ -110,7 +127,7 @@ export async function uploadDocument(file) {
 export async function sendChatMessage(question) {
   const res = await fetch(`${API_URL}/chat`, {
     method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
+    headers: { 'Content-Type': 'application/json', 'X-Session-ID': getSessionId() },
     body: JSON.stringify({ question }),
   });
 